@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+from importlib.util import find_spec
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -50,15 +51,52 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.middleware.MetricsMiddleware",
+    "core.middleware.LoadSheddingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.middleware.RequestProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.middleware.RequestShapeRecorderMiddleware",
 ]
 
+# Queue RideEvents from core.signals and write them in batches (see
+# core.event_buffer). Off by default: events are inserted synchronously.
+# Queued events are lost when a worker is killed before they are written:
+# at most RIDE_EVENT_BUFFER_SECONDS of events, while the database is up.
+RIDE_EVENT_WRITE_BEHIND = os.getenv("RIDE_EVENT_WRITE_BEHIND") == "True"
+RIDE_EVENT_BUFFER_SIZE = int(os.getenv("RIDE_EVENT_BUFFER_SIZE", 500))
+RIDE_EVENT_BUFFER_SECONDS = float(os.getenv("RIDE_EVENT_BUFFER_SECONDS", 1.0))
+# A batch that cannot be written is retried on this many flushes before its
+# events are dropped, and at most this many events are queued per database.
+RIDE_EVENT_BUFFER_MAX_RETRIES = int(os.getenv("RIDE_EVENT_BUFFER_MAX_RETRIES", 30))
+RIDE_EVENT_BUFFER_MAX_EVENTS = int(os.getenv("RIDE_EVENT_BUFFER_MAX_EVENTS", 50000))
+
+# The RideEvent change feed (see core.feed) only serves events older than
+# this, so events that commit late are not skipped. Keep it above the
+# longest request (gunicorn's 30 s worker timeout): write transactions and
+# write-behind events never outlive their request.
+RIDE_EVENT_FEED_LAG_SECONDS = float(os.getenv("RIDE_EVENT_FEED_LAG_SECONDS", 30))
+
+# Per-process metric files summed by /metrics (see core.metrics).
+# Set METRICS_DIR to an empty string to disable metrics. Scrapes must
+# send "Authorization: Bearer <METRICS_TOKEN>"; /metrics answers 403 to
+# everyone while METRICS_TOKEN is unset.
+METRICS_DIR = os.getenv("METRICS_DIR", BASE_DIR / "metrics")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Ring buffer of on-demand admin request profiles (see core.profiling).
+# Set REQUEST_PROFILE_DIR to an empty string to disable profiling.
+REQUEST_PROFILE_DIR = os.getenv("REQUEST_PROFILE_DIR", BASE_DIR / "request-profiles")
+REQUEST_PROFILE_LIMIT = int(os.getenv("REQUEST_PROFILE_LIMIT", 50))
+
+# Append request shapes to this file for the loadtest command (off by default).
+LOADTEST_RECORD_FILE = os.getenv("LOADTEST_RECORD_FILE")
+
 ROOT_URLCONF = "app.urls"
 
 TEMPLATES = [
@@ -85,10 +123,45 @@ WSGI_APPLICATION = "app.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": os.getenv("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
     }
 }
 
+# Region-based ride sharding (see core.sharding). RIDE_SHARD_COUNT=N adds
+# N local SQLite shard databases; other deployments can list any
+# DATABASES aliases in RIDE_SHARDS instead. Each shard must be migrated
+# with `manage.py migrate --database <alias>`.
+RIDE_SHARDS = []
+RIDE_SHARD_DIR = Path(os.getenv("RIDE_SHARD_DIR", BASE_DIR))
+RIDE_SHARD_CELL_DEGREES = float(os.getenv("RIDE_SHARD_CELL_DEGREES", "1.0"))
+for _index in range(int(os.getenv("RIDE_SHARD_COUNT", "0"))):
+    DATABASES[f"ride_shard_{_index}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": RIDE_SHARD_DIR / f"ride_shard_{_index}.sqlite3",
+    }
+    RIDE_SHARDS.append(f"ride_shard_{_index}")
+
+DATABASE_ROUTERS = ["core.sharding.RideShardRouter"]
+
+# SQLite production mode for single-node deployments (see core.sqlite):
+# every SQLite connection sets a busy timeout, the WAL journal,
+# synchronous=NORMAL and mmap when it opens. Run `manage.py
+# sqlite_maintenance` periodically alongside it.
+SQLITE_PRODUCTION = os.getenv("SQLITE_PRODUCTION") == "True"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+# busy_timeout first, so switching to WAL waits for other connections too.
+SQLITE_INIT_COMMAND = (
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS};"
+    "PRAGMA journal_mode=WAL;"
+    "PRAGMA synchronous=NORMAL;"
+    f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}"
+)
+if SQLITE_PRODUCTION:
+    for _database in DATABASES.values():
+        if _database["ENGINE"] == "django.db.backends.sqlite3":
+            _database.setdefault("OPTIONS", {})["init_command"] = SQLITE_INIT_COMMAND
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -135,10 +208,61 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = 'core.User'
 
+# JSON is rendered and parsed with orjson when installed (see core.renderers),
+# with the same output as DRF's stdlib renderer. application/msgpack is
+# offered to internal services when msgpack is installed.
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": [
+        "core.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+        *(["core.renderers.MessagePackRenderer"] if find_spec("msgpack") else []),
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "core.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+    # Client IPs come from the last NUM_PROXIES X-Forwarded-For entries,
+    # added by nginx; entries sent by the client itself are ignored. Set
+    # it to 0 when clients reach gunicorn directly.
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", 1)),
+    # Token buckets of core.throttling: burst N, refilled at N per period.
+    # An empty value disables a throttle.
+    "DEFAULT_THROTTLE_RATES": {
+        "ride_token": os.getenv("THROTTLE_RATE_RIDE_TOKEN", "50/s") or None,
+        "ride_ip": os.getenv("THROTTLE_RATE_RIDE_IP", "100/s") or None,
+        "login_ip": os.getenv("THROTTLE_RATE_LOGIN_IP", "30/m") or None,
+    },
 }
 
+# CACHES alias holding the throttle buckets, shared by every worker.
+# Unset: each worker process keeps its own buckets.
+THROTTLE_CACHE = os.getenv("THROTTLE_CACHE") or None
+# False turns every throttle of core.throttling off, e.g. for load tests.
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "True") == "True"
+
+# Load shedding of expensive requests (see core.loadshed): budget units
+# of in-flight expensive work shared by all workers through lock files
+# in LOAD_SHED_DIR. 0 disables shedding. The default of 1 keeps cheap
+# request p99 at its baseline under overload with the 4 gunicorn workers
+# of entrypoint.prod.sh; with a budget of 2 it rose several times over
+# (benchmark_load_shedding, on 1 and 4 CPUs).
+LOAD_SHED_BUDGET = int(os.getenv("LOAD_SHED_BUDGET", 1))
+LOAD_SHED_DIR = os.getenv("LOAD_SHED_DIR", BASE_DIR / "load-shed")
+
 SPECTACULAR_SETTINGS = {
     "COMPONENT_SPLIT_REQUEST": True,
-}
\ No newline at end of file
+}
+
+# Precomputed OpenAPI schema served by /api/schema (see core.schema).
+# Generated at container start with `manage.py spectacular`.
+OPENAPI_SCHEMA_FILE = os.getenv("OPENAPI_SCHEMA_FILE", BASE_DIR / "openapi-schema.json")
+
+# Cache lifetime (seconds) of heatmap tiles served by /api/ride/heatmap/.
+HEATMAP_TILE_MAX_AGE = int(os.getenv("HEATMAP_TILE_MAX_AGE", 24 * 60 * 60))
+# Limits of one bulk user import through /api/user/import/ (see
+# user.bulk): larger uploads are rejected with 400 before they are read.
+# The import_users command has no limits.
+BULK_IMPORT_MAX_BYTES = int(os.getenv("BULK_IMPORT_MAX_BYTES", 10 * 2 ** 20))
+BULK_IMPORT_MAX_ROWS = int(os.getenv("BULK_IMPORT_MAX_ROWS", 50000))
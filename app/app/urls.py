@@ -1,17 +1,28 @@
 """
 Main project URL configuration.
 """
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView,
-)
+from drf_spectacular.views import SpectacularSwaggerView
 
 from django.contrib import admin
 from django.urls import path, include
 
+from core import views as core_views
+from core.schema import CachedSpectacularAPIView
+
 urlpatterns = [
+    path(
+        'admin/request-profiles/',
+        admin.site.admin_view(core_views.request_profile_list),
+        name='request-profile-list',
+    ),
+    path(
+        'admin/request-profiles/<str:profile_id>/',
+        admin.site.admin_view(core_views.request_profile_detail),
+        name='request-profile-detail',
+    ),
     path('admin/', admin.site.urls),
-    path('api/schema', SpectacularAPIView.as_view(), name='api-schema'),
+    path('metrics', core_views.metrics_view, name='metrics'),
+    path('api/schema', CachedSpectacularAPIView.as_view(), name='api-schema'),
     path(
         'api/docs/',
         SpectacularSwaggerView.as_view(url_name='api-schema'),
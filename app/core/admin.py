@@ -3,18 +3,22 @@ Django admin customization.
 """
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS
 from django.utils.translation import gettext_lazy as _
 
 from .models import Ride, RideEvent
 
+from . import metrics
+from .event_summary import check_summaries
+from .purge import iter_purge
+from .sharding import ride_databases, shard_for_ride_id, sharding_enabled
 from .utils import get_long_trips_report
 from django.urls import path, reverse
 from django.http import HttpResponse
 from django.shortcuts import render
 from core import models
 
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from io import BytesIO
 
 class UserAdmin(BaseUserAdmin):
@@ -67,17 +71,85 @@ class UserAdmin(BaseUserAdmin):
             )
         }),
     )
+class RideDatabaseFilter(admin.SimpleListFilter):
+    """Database to list rides or events from, with ride sharding enabled."""
+    title = _('database')
+    parameter_name = 'database'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in ride_databases()]
+
+    def queryset(self, request, queryset):
+        if self.value() in ride_databases():
+            return queryset.using(self.value())
+        return queryset
+
+    def choices(self, changelist):
+        # One database at a time: no "All" choice.
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': (self.value() or DEFAULT_DB_ALIAS) == lookup,
+                'query_string': changelist.get_query_string({self.parameter_name: lookup}),
+                'display': title,
+            }
+
+
+class ShardedAdminMixin:
+    """
+    Admin for a sharded model (see core.sharding): lists one ride
+    database at a time and finds objects in the shard their id belongs
+    to. Users stay in the default database, so user foreign keys are
+    shown as ids.
+    """
+    user_fields = ()
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if sharding_enabled():
+            return [RideDatabaseFilter, *list_filter]
+        return list_filter
+
+    def get_list_display(self, request):
+        list_display = super().get_list_display(request)
+        if sharding_enabled():
+            return [f'{field}_id' if field in self.user_fields else field
+                    for field in list_display]
+        return list_display
+
+    def get_object(self, request, object_id, from_field=None):
+        if not sharding_enabled() or from_field is not None:
+            return super().get_object(request, object_id, from_field)
+        try:
+            alias = shard_for_ride_id(object_id)
+            return self.get_queryset(request).using(alias).get(pk=object_id)
+        except (self.model.DoesNotExist, ValidationError, TypeError, ValueError):
+            return None
+
+
 class RideEventInline(admin.TabularInline):
     model = RideEvent
     extra = 0
     readonly_fields = ('description', 'created_at')
     can_delete = False
 
+    def has_add_permission(self, request, obj=None):
+        # Events added here would bypass the ride's event summary.
+        return False
+
 @admin.register(Ride)
-class RideAdmin(admin.ModelAdmin):
+class RideAdmin(ShardedAdminMixin, admin.ModelAdmin):
     list_display = ('id_ride', 'status', 'id_rider', 'id_driver', 'pickup_time')
     list_filter = ('status',)
     inlines = [RideEventInline]
+    actions = ['purge_selected']
+    user_fields = ('id_rider', 'id_driver')
+
+    def get_formset_kwargs(self, request, obj, inline, prefix):
+        kwargs = super().get_formset_kwargs(request, obj, inline, prefix)
+        if obj is not None and obj._state.db:
+            # Read the events from the ride's shard.
+            kwargs['queryset'] = kwargs['queryset'].using(obj._state.db)
+        return kwargs
     
     change_list_template = 'admin/ride/ride_changelist.html'
     
@@ -90,8 +162,13 @@ class RideAdmin(admin.ModelAdmin):
         ]
         return custom_urls + urls
     
+    @metrics.timed('report_duration_seconds', report='long_trips_excel')
     def download_excel_report(self, request):
         """Download the long trips report as Excel file."""
+        # openpyxl is heavy; import it on first export instead of at worker start
+        from openpyxl import Workbook
+        from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+
         # Get report data
         report_data = get_long_trips_report()
         
@@ -157,8 +234,19 @@ class RideAdmin(admin.ModelAdmin):
         
         return response
 
+    def purge_selected(self, request, queryset):
+        """Delete rides and their events in batches, without loading the events."""
+        rides = events = 0
+        for progress in iter_purge(queryset):
+            rides += progress['rides']
+            events += progress['events']
+        self.message_user(request, f"Purged {rides} rides and {events} events")
+
+    purge_selected.short_description = "Purge selected rides and their events"
+    purge_selected.allowed_permissions = ('delete',)
+
 @admin.register(RideEvent)
-class RideEventAdmin(admin.ModelAdmin):
+class RideEventAdmin(ShardedAdminMixin, admin.ModelAdmin):
     list_display = ('id_ride_event', 'id_ride', 'description', 'created_at')
     list_filter = ('created_at', 'id_ride__status')
     search_fields = ('description', 'id_ride__id_ride')
@@ -170,24 +258,54 @@ class RideEventAdmin(admin.ModelAdmin):
     # Better formatting for the list
     def get_queryset(self, request):
         qs = super().get_queryset(request)
+        if sharding_enabled():
+            # Users are not in the ride shards.
+            return qs.select_related('id_ride')
         return qs.select_related('id_ride', 'id_ride__id_driver', 'id_ride__id_rider')
     
+    # Edits here bypass create_events(): recompute the event summaries
+    # of the rides whose events were added, changed or deleted.
+    def repair_summaries(self, using, ride_ids):
+        check_summaries(Ride.objects.using(using).filter(pk__in=set(ride_ids)), repair=True)
+
+    def save_model(self, request, obj, form, change):
+        ride_ids = [obj.id_ride_id]
+        if change:
+            ride_ids += RideEvent.objects.using(shard_for_ride_id(obj.pk)).filter(
+                pk=obj.pk).values_list('id_ride_id', flat=True)
+        super().save_model(request, obj, form, change)
+        self.repair_summaries(obj._state.db, ride_ids)
+
+    def delete_model(self, request, obj):
+        using, ride_id = obj._state.db, obj.id_ride_id
+        super().delete_model(request, obj)
+        self.repair_summaries(using, [ride_id])
+
+    def delete_queryset(self, request, queryset):
+        ride_ids = list(queryset.values_list('id_ride_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        self.repair_summaries(queryset.db, ride_ids)
+
     # Custom admin actions
     actions = ['set_pickup_time', 'set_dropoff_time']
     
     def set_pickup_time(self, request, queryset):
         """Quick action to set events as pickup events."""
-        for event in queryset:
+        events = list(queryset)
+        for event in events:
             event.description = "Status changed from 'en-route' to 'pickup'"
             event.save()
-        self.message_user(request, f"Updated {queryset.count()} events to pickup")
+        self.repair_summaries(queryset.db, [event.id_ride_id for event in events])
+        self.message_user(request, f"Updated {len(events)} events to pickup")
     
     def set_dropoff_time(self, request, queryset):
         """Quick action to set events as dropoff events."""
-        for event in queryset:
+        events = list(queryset)
+        for event in events:
             event.description = "Status changed from 'pickup' to 'dropoff'"
             event.save()
-        self.message_user(request, f"Updated {queryset.count()} events to dropoff")
+        self.repair_summaries(queryset.db, [event.id_ride_id for event in events])
+        self.message_user(request, f"Updated {len(events)} events to dropoff")
     
     set_pickup_time.short_description = "Set as pickup event"
     set_dropoff_time.short_description = "Set as dropoff event"
@@ -1,4 +1,7 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.core.signals import request_finished
+from django.db.models.signals import post_migrate
 
 
 class CoreConfig(AppConfig):
@@ -6,4 +9,10 @@ class CoreConfig(AppConfig):
     name = "core"
 
     def ready(self):
-        import core.signals
\ No newline at end of file
+        import core.signals
+        from core.event_buffer import flush_at_request_end
+        from core.sharding import check_ride_id_ranges, init_shard_sequences
+
+        post_migrate.connect(init_shard_sequences, sender=self)
+        checks.register(check_ride_id_ranges, checks.Tags.database)
+        request_finished.connect(flush_at_request_end)
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""
+Write-behind buffer for RideEvent inserts.
+
+With settings.RIDE_EVENT_WRITE_BEHIND enabled, core.signals queues
+RideEvents here instead of inserting each one. Queued events are written
+with one bulk_create per database when RIDE_EVENT_BUFFER_SIZE events are
+pending, when the oldest has waited RIDE_EVENT_BUFFER_SECONDS (checked
+by a background thread, so events queued outside requests or kept after
+a failed write do not wait for the next one), and always when a request
+finishes (after the response has been sent) and at interpreter exit.
+
+Queued events live only in process memory: a process killed before the
+flush (SIGKILL, the gunicorn worker timeout, an OOM kill) loses them,
+and with them the events of up to RIDE_EVENT_BUFFER_SECONDS, or longer
+while the database rejects the writes.
+
+A batch rejected with an IntegrityError (typically an event of a ride
+deleted meanwhile) is retried event by event, and only the events that
+still fail are dropped and logged. Batches failing otherwise (the
+database is down or locked) stay queued for
+RIDE_EVENT_BUFFER_MAX_RETRIES flushes before they are dropped, and at
+most RIDE_EVENT_BUFFER_MAX_EVENTS events per database are kept: the
+oldest are dropped beyond that.
+
+Events created inside a transaction enter the buffer through
+transaction.on_commit, so events of rolled-back changes are never
+written. Until the flush, a ride's events and event summary (including in the
+response to the request that changed it) do not show the new event yet.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connections, transaction
+
+from core import metrics
+from core.event_summary import create_events
+
+logger = logging.getLogger(__name__)
+
+
+def write_behind_enabled():
+    return getattr(settings, 'RIDE_EVENT_WRITE_BEHIND', False)
+
+
+class RideEventBuffer:
+    """Process-wide queue of unsaved RideEvents, per database alias."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._oldest = None
+        self._flusher = None
+        self._failures = {}
+
+    def __len__(self):
+        return sum(len(events) for events in self._pending.values())
+
+    def add(self, event, using):
+        """Queue an event once the current transaction (if any) commits."""
+        if connections[using].in_atomic_block:
+            transaction.on_commit(lambda: self._append(event, using), using=using)
+        else:
+            self._append(event, using)
+
+    def _append(self, event, using):
+        with self._lock:
+            self._pending.setdefault(using, []).append(event)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            # Started on first use: a thread started before gunicorn forks
+            # its workers would not exist in them.
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_when_due,
+                                                 name='ride-event-flusher', daemon=True)
+                self._flusher.start()
+            due = (
+                len(self._pending[using]) >= settings.RIDE_EVENT_BUFFER_SIZE
+                or time.monotonic() - self._oldest >= settings.RIDE_EVENT_BUFFER_SECONDS
+            )
+        if due:
+            self.flush()
+
+    def _flush_when_due(self):
+        """Flusher thread: write the queue once its oldest event is due."""
+        while True:
+            time.sleep(settings.RIDE_EVENT_BUFFER_SECONDS)
+            with self._lock:
+                due = (self._oldest is not None
+                       and time.monotonic() - self._oldest >= settings.RIDE_EVENT_BUFFER_SECONDS)
+            if due:
+                try:
+                    self.flush()
+                finally:
+                    connections.close_all()
+
+    def flush(self):
+        """
+        Write every queued event. Batches that failed (other than with an
+        IntegrityError) stay queued for the next flush, up to the limits.
+        """
+        with self._lock:
+            pending, self._pending, self._oldest = self._pending, {}, None
+        written = 0
+        for using, events in pending.items():
+            try:
+                create_events(events, using)
+            except IntegrityError:
+                events = self._write_one_by_one(events, using)
+            except Exception:
+                logger.exception('Could not write %d buffered ride events to %s',
+                                 len(events), using)
+                self._requeue(events, using)
+                continue
+            with self._lock:
+                self._failures.pop(using, None)
+            written += len(events)
+            metrics.inc('ride_events_created_total', len(events), source='signals')
+        return written
+
+    def _write_one_by_one(self, events, using):
+        """Write events one per transaction, dropping those that fail. Returns the written ones."""
+        written = []
+        for event in events:
+            # bulk_create may have set the id before the transaction failed.
+            event.pk = None
+            event._state.adding = True
+            try:
+                create_events([event], using)
+            except IntegrityError as error:
+                logger.warning('Dropped buffered ride event %r of ride %s in %s: %s',
+                               event.description, event.id_ride_id, using, error)
+                continue
+            written.append(event)
+        return written
+
+    def _requeue(self, events, using):
+        """Queue a failed batch again, within the retry and size limits."""
+        with self._lock:
+            failures = self._failures[using] = self._failures.get(using, 0) + 1
+            if failures > settings.RIDE_EVENT_BUFFER_MAX_RETRIES:
+                self._failures.pop(using)
+                logger.error('Dropped %d buffered ride events for %s after %d failed writes',
+                             len(events), using, failures)
+                return
+            queued = events + self._pending.get(using, [])
+            excess = len(queued) - settings.RIDE_EVENT_BUFFER_MAX_EVENTS
+            if excess > 0:
+                logger.error('Dropped the %d oldest buffered ride events for %s: '
+                             'more than RIDE_EVENT_BUFFER_MAX_EVENTS are queued', excess, using)
+                queued = queued[excess:]
+            self._pending[using] = queued
+            self._oldest = self._oldest or time.monotonic()
+
+
+ride_event_buffer = RideEventBuffer()
+
+
+def flush_at_request_end(**kwargs):
+    """request_finished receiver: write the events queued during the request."""
+    if len(ride_event_buffer):
+        ride_event_buffer.flush()
+        # The flush may have reopened a connection that Django already
+        # closed for this request.
+        close_old_connections()
+
+
+@atexit.register
+def _flush_at_exit():
+    if len(ride_event_buffer):
+        ride_event_buffer.flush()
+        if len(ride_event_buffer):
+            logger.error('Lost %d buffered ride events at exit', len(ride_event_buffer))
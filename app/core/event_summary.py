@@ -0,0 +1,169 @@
+"""
+Denormalized event summary of each ride.
+
+Ride rows carry their event count, their latest event (id, description
+and time), the time of their first pickup event and of their last
+dropoff event (see Ride.EVENT_SUMMARY_FIELDS). create_events() inserts
+RideEvents and folds them into their rides' summaries in the same write
+transaction. The UPDATEs are relative to the stored values, so
+concurrent inserts for one ride never lose an event. Code that writes
+events some other way (the RideEvent admin, bulk copies between
+databases) recomputes the affected summaries with check_summaries().
+
+expected_summary() computes summaries from the events themselves, for
+check_summaries() and the check_ride_event_summaries command. Migration
+0007 carries its own copy of the expressions for the backfill.
+"""
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from core.models import Ride, RideEvent
+from core.sqlite import write_transaction
+
+# Events that set pickup_at and dropoff_at: {status: (description
+# suffix, description prefix or None)}. A ride created in 'pickup'
+# counts as picked up; one created in 'dropoff' gets no dropoff time (as
+# in migration 0007). summarize() and expected_summary() both use these.
+STATUS_EVENTS = {
+    'pickup': ("to 'pickup'", RideEvent.created_description('pickup')),
+    'dropoff': ("to 'dropoff'", None),
+}
+
+
+def _status_event(status):
+    suffix, prefix = STATUS_EVENTS[status]
+    condition = Q(description__endswith=suffix)
+    if prefix is not None:
+        condition |= Q(description__startswith=prefix)
+    return condition
+
+
+PICKUP_EVENT = _status_event('pickup')
+DROPOFF_EVENT = _status_event('dropoff')
+
+
+def entered_status(description):
+    """'pickup' or 'dropoff' if the event sets that summary time, else None."""
+    for status, (suffix, prefix) in STATUS_EVENTS.items():
+        if description.endswith(suffix) or (prefix is not None and description.startswith(prefix)):
+            return status
+    return None
+
+
+def empty_summary():
+    return {field: Ride._meta.get_field(field).get_default()
+            for field in Ride.EVENT_SUMMARY_FIELDS}
+
+
+def summarize(events, summary=None):
+    """Fold events into a summary dict ({field: value}), starting from summary."""
+    summary = dict(summary or empty_summary())
+    for event in sorted(events, key=lambda event: (event.created_at, event.pk or 0)):
+        summary['event_count'] += 1
+        if summary['last_event_at'] is None or event.created_at >= summary['last_event_at']:
+            summary['last_event_id'] = event.pk
+            summary['last_event_description'] = event.description
+            summary['last_event_at'] = event.created_at
+        status = entered_status(event.description)
+        if status == 'pickup' and (summary['pickup_at'] is None
+                                   or event.created_at < summary['pickup_at']):
+            summary['pickup_at'] = event.created_at
+        elif status == 'dropoff' and (summary['dropoff_at'] is None
+                                      or event.created_at > summary['dropoff_at']):
+            summary['dropoff_at'] = event.created_at
+    return summary
+
+
+def _replace_if(condition, field, value):
+    return Case(When(condition, then=Value(value)), default=F(field),
+                output_field=Ride._meta.get_field(field))
+
+
+def _summary_update(batch):
+    """UPDATE expressions folding a batch summary into the stored one."""
+    update = {'event_count': F('event_count') + batch['event_count']}
+    newer = Q(last_event_at__isnull=True) | Q(last_event_at__lte=batch['last_event_at'])
+    for field in ('last_event_id', 'last_event_description', 'last_event_at'):
+        update[field] = _replace_if(newer, field, batch[field])
+    if batch['pickup_at'] is not None:
+        update['pickup_at'] = _replace_if(
+            Q(pickup_at__isnull=True) | Q(pickup_at__gt=batch['pickup_at']),
+            'pickup_at', batch['pickup_at'],
+        )
+    if batch['dropoff_at'] is not None:
+        update['dropoff_at'] = _replace_if(
+            Q(dropoff_at__isnull=True) | Q(dropoff_at__lt=batch['dropoff_at']),
+            'dropoff_at', batch['dropoff_at'],
+        )
+    return update
+
+
+def create_events(events, using):
+    """Insert RideEvents and update their rides' summaries in one write transaction."""
+    by_ride = {}
+    with write_transaction(using=using):
+        RideEvent.objects.using(using).bulk_create(events)
+        for event in events:
+            by_ride.setdefault(event.id_ride_id, []).append(event)
+        for ride_id, ride_events in by_ride.items():
+            Ride.objects.using(using).filter(pk=ride_id).update(
+                **_summary_update(summarize(ride_events))
+            )
+    return events
+
+
+def expected_summary(event_model=RideEvent):
+    """
+    Subquery expressions computing each summary field of a ride from its
+    events, for annotate() or update() on a Ride queryset.
+    """
+    events = event_model.objects.filter(id_ride=OuterRef('pk')).order_by()
+    latest = events.order_by('-created_at', '-id_ride_event')
+    return {
+        'event_count': Coalesce(
+            Subquery(events.values('id_ride').annotate(count=Count('pk')).values('count')), 0
+        ),
+        'last_event_id': Subquery(latest.values('id_ride_event')[:1]),
+        'last_event_description': Coalesce(
+            Subquery(latest.values('description')[:1]), Value('')
+        ),
+        'last_event_at': Subquery(latest.values('created_at')[:1]),
+        'pickup_at': Subquery(
+            events.filter(PICKUP_EVENT).order_by('created_at').values('created_at')[:1]
+        ),
+        'dropoff_at': Subquery(
+            events.filter(DROPOFF_EVENT).order_by('-created_at').values('created_at')[:1]
+        ),
+    }
+
+
+def check_summaries(rides, repair=False):
+    """
+    Compare the stored summaries of a Ride queryset with its events.
+
+    Returns {id_ride: {field: (stored, expected)}} for the rides that
+    differ. With repair, those rides get the expected summary; the rides
+    are locked (select_for_update) and rewritten in one write
+    transaction, so events inserted meanwhile are not lost.
+    """
+    using = rides.db
+    expected = {f'expected_{field}': expression
+                for field, expression in expected_summary().items()}
+    with write_transaction(using=using):
+        if repair:
+            rides = rides.select_for_update()
+        rows = rides.order_by().annotate(**expected).values(
+            'pk', *Ride.EVENT_SUMMARY_FIELDS, *expected
+        )
+        mismatches = {}
+        for row in rows:
+            fields = {
+                field: (row[field], row[f'expected_{field}'])
+                for field in Ride.EVENT_SUMMARY_FIELDS
+                if row[field] != row[f'expected_{field}']
+            }
+            if fields:
+                mismatches[row['pk']] = fields
+        if repair and mismatches:
+            Ride.objects.using(using).filter(pk__in=list(mismatches)).update(**expected_summary())
+    return mismatches
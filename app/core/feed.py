@@ -0,0 +1,152 @@
+"""
+Incremental NDJSON change feed of RideEvent rows.
+
+Events are read in id_ride_event order after a cursor with chunked
+iteration (server-side cursors on PostgreSQL) and written as one JSON
+object per line together with the ride's current fields, so consumers
+only fetch what changed since their last checkpoint, with constant memory.
+With ride sharding, every database holding rides is read (see
+parse_cursor for the cursor format).
+
+Ids are handed out when a row is inserted, not when it commits: an
+event may become visible after one with a higher id was already served
+(concurrent writers on PostgreSQL, RideEvents queued by the write-behind
+buffer). The feed therefore stops at the first event created less than
+settings.RIDE_EVENT_FEED_LAG_SECONDS ago, and later events are served on
+the next read. Nothing is skipped as long as no write transaction, and
+no event waiting in the write-behind buffer, outlives the lag.
+
+Events dated more than the lag ahead of now cannot be fresh inserts
+(created_at was edited, e.g. in the admin) and are served right away:
+holding them back would stop the feed of their database until then.
+"""
+import datetime
+import json
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import RideEvent
+from core.sharding import ride_databases, shard_for_ride_id
+
+FEED_CHUNK_SIZE = 5000
+
+EVENT_FIELDS = ('id_ride_event', 'id_ride_id', 'description', 'created_at')
+RIDE_FIELDS = (
+    'status',
+    'id_rider',
+    'id_driver',
+    'pickup_latitude',
+    'pickup_longitude',
+    'dropoff_latitude',
+    'dropoff_longitude',
+    'pickup_time',
+)
+
+
+def format_datetime(value):
+    """ISO 8601 like DRF's DateTimeField output ('Z' for UTC)."""
+    if value is None:
+        return None
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def parse_cursor(value):
+    """
+    Per-database positions of a feed cursor: {alias: last served id}.
+
+    A cursor is a comma separated list of event ids, at most one per
+    database holding rides. Ids are global (each shard hands out its own
+    id range, see core.sharding), so every id names its database. A
+    database missing from the cursor is read from its first event; a
+    plain id_ride_event is a valid cursor. Raises ValueError for
+    anything else.
+    """
+    positions = {}
+    for part in str(value).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        event_id = int(part)
+        if event_id < 0:
+            raise ValueError('Event ids must not be negative.')
+        alias = shard_for_ride_id(event_id)
+        positions[alias] = max(positions.get(alias, 0), event_id)
+    return positions
+
+
+def format_cursor(positions):
+    return ','.join(
+        str(positions[alias]) for alias in ride_databases() if positions.get(alias)
+    ) or '0'
+
+
+def iter_event_feed(after=0, limit=None, chunk_size=FEED_CHUNK_SIZE, lag=None):
+    """
+    Yield (cursor, ndjson_bytes) for the events after a cursor (see
+    parse_cursor), up to the first event younger than lag seconds
+    (default: settings.RIDE_EVENT_FEED_LAG_SECONDS) in each database.
+
+    Databases are read in ascending id range order, each from its own
+    position, so events keep arriving on every ride shard without being
+    skipped. Each line carries the cursor to resume from after it; each
+    chunk holds up to chunk_size lines, and the cursor yielded with it
+    is the one of its last line.
+    """
+    positions = parse_cursor(after)
+    if lag is None:
+        lag = settings.RIDE_EVENT_FEED_LAG_SECONDS
+    now = timezone.now()
+    newest = now - datetime.timedelta(seconds=lag)
+    future = now + datetime.timedelta(seconds=lag)
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    remaining = limit
+
+    for using in ride_databases():
+        if remaining is not None and remaining <= 0:
+            return
+        queryset = (
+            RideEvent.objects.using(using)
+            .filter(id_ride_event__gt=positions.get(using, 0))
+            .order_by('id_ride_event')
+            .values_list(*EVENT_FIELDS, *(f'id_ride__{field}' for field in RIDE_FIELDS))
+        )
+        if remaining is not None:
+            queryset = queryset[:remaining]
+
+        lines = []
+        for (id_ride_event, id_ride, description, created_at,
+             status, id_rider, id_driver, pickup_latitude, pickup_longitude,
+             dropoff_latitude, dropoff_longitude, pickup_time) in queryset.iterator(chunk_size=chunk_size):
+            if newest < created_at <= future:
+                break
+            positions[using] = id_ride_event
+            cursor = format_cursor(positions)
+            lines.append(dumps({
+                'id_ride_event': id_ride_event,
+                'id_ride': id_ride,
+                'description': description,
+                'created_at': format_datetime(created_at),
+                'cursor': cursor,
+                'ride': {
+                    'id_ride': id_ride,
+                    'status': status,
+                    'id_rider': id_rider,
+                    'id_driver': id_driver,
+                    'pickup_latitude': pickup_latitude,
+                    'pickup_longitude': pickup_longitude,
+                    'dropoff_latitude': dropoff_latitude,
+                    'dropoff_longitude': dropoff_longitude,
+                    'pickup_time': format_datetime(pickup_time),
+                },
+            }))
+            if remaining is not None:
+                remaining -= 1
+            if len(lines) >= chunk_size:
+                yield cursor, ('\n'.join(lines) + '\n').encode()
+                lines = []
+        if lines:
+            yield cursor, ('\n'.join(lines) + '\n').encode()
@@ -0,0 +1,168 @@
+"""
+Precomputed pickup and dropoff heatmap.
+
+Ride pickup and dropoff points are counted per grid cell, zoom level and
+hour of day (of pickup_time, in TIME_ZONE) in HeatmapCell, plus an
+ALL_HOURS row per cell holding the total over the day. Cells are the
+pixels of XYZ (Web Mercator) tiles divided into CELLS_PER_TILE x
+CELLS_PER_TILE squares, so a tile is one indexed lookup on
+(kind, zoom, tile_x, tile_y).
+
+Counts are incremented when a ride is created (see core.signals). Edits
+to ride coordinates and deleted or purged rides are only reflected after
+rebuild_heatmap, which recounts every ride database. The rebuild stores
+the highest ride id it counted per database in HeatmapSource, and rides
+up to it are not counted again when their creation is recorded late.
+This needs every ride id up to the high-water mark to be visible when
+the rebuild counts. SQLite has one writer per database, so ids become
+visible in increasing order. Other databases (PostgreSQL) commit
+concurrent inserts in any order, so the rebuild takes their final count
+under a SHARE lock on the ride table, which waits for uncommitted
+inserts and holds off new ones until the swap commits.
+"""
+import contextlib
+import math
+from collections import Counter
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from core.models import HeatmapCell, HeatmapSource, Ride
+from core.sharding import ride_databases
+from core.sqlite import write_transaction
+
+ZOOM_LEVELS = (4, 8, 12, 16)
+CELL_BITS = 5
+CELLS_PER_TILE = 2 ** CELL_BITS
+MAX_LATITUDE = 85.05112878
+KINDS = ('pickup', 'dropoff')
+ALL_HOURS = 24
+REBUILD_CHUNK_SIZE = 5000
+
+CELL_FIELDS = ('kind', 'zoom', 'tile_x', 'tile_y', 'hour', 'cell_x', 'cell_y')
+
+
+def cell_for_point(latitude, longitude, zoom):
+    """(tile_x, tile_y, cell_x, cell_y) of a point at a zoom level."""
+    size = 2 ** (zoom + CELL_BITS)
+    latitude = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude)))
+    x = int((longitude + 180.0) / 360.0 * size)
+    y = int((1.0 - math.asinh(math.tan(latitude)) / math.pi) / 2.0 * size)
+    x = max(0, min(size - 1, x))
+    y = max(0, min(size - 1, y))
+    return x >> CELL_BITS, y >> CELL_BITS, x & (CELLS_PER_TILE - 1), y & (CELLS_PER_TILE - 1)
+
+
+def ride_cells(pickup_latitude, pickup_longitude, dropoff_latitude, dropoff_longitude,
+               pickup_time):
+    """Cell keys (in CELL_FIELDS order) a ride counts towards."""
+    hour = timezone.localtime(pickup_time).hour
+    points = {
+        'pickup': (pickup_latitude, pickup_longitude),
+        'dropoff': (dropoff_latitude, dropoff_longitude),
+    }
+    cells = []
+    for kind in KINDS:
+        latitude, longitude = points[kind]
+        for zoom in ZOOM_LEVELS:
+            tile_x, tile_y, cell_x, cell_y = cell_for_point(latitude, longitude, zoom)
+            cells.append((kind, zoom, tile_x, tile_y, hour, cell_x, cell_y))
+            cells.append((kind, zoom, tile_x, tile_y, ALL_HOURS, cell_x, cell_y))
+    return cells
+
+
+def increment_cells(counts, using=DEFAULT_DB_ALIAS):
+    """Add counts ({cell key: n}) to HeatmapCell with one upsert statement."""
+    if not counts:
+        return
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field) for field in CELL_FIELDS)
+    sql = (
+        f'INSERT INTO {quote(HeatmapCell._meta.db_table)} ({columns}, {quote("count")}) '
+        f'VALUES ({", ".join(["%s"] * (len(CELL_FIELDS) + 1))}) '
+        f'ON CONFLICT ({columns}) DO UPDATE SET '
+        f'{quote("count")} = {quote(HeatmapCell._meta.db_table)}.{quote("count")} '
+        f'+ EXCLUDED.{quote("count")}'
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(*key, count) for key, count in counts.items()])
+
+
+def record_ride(ride, using):
+    """Count a newly created ride in the heatmap, unless a rebuild already did."""
+    with write_transaction():
+        if HeatmapSource.objects.filter(database=using, last_ride_id__gte=ride.pk).exists():
+            return
+        increment_cells(Counter(ride_cells(
+            ride.pickup_latitude, ride.pickup_longitude,
+            ride.dropoff_latitude, ride.dropoff_longitude,
+            ride.pickup_time,
+        )))
+
+
+def count_rides(chunk_size=REBUILD_CHUNK_SIZE, after=None):
+    """
+    Count the rides of every ride database into {cell key: n}, only
+    those with an id above after[alias] if given. Returns the counts and
+    {alias: highest ride id counted (or after[alias])}.
+    """
+    counts = Counter()
+    last_ids = {}
+    for alias in ride_databases():
+        last_id = (after or {}).get(alias, 0)
+        rows = (
+            Ride.objects.using(alias)
+            .filter(id_ride__gt=last_id)
+            .order_by()
+            .values_list('pickup_latitude', 'pickup_longitude',
+                         'dropoff_latitude', 'dropoff_longitude', 'pickup_time', 'id_ride')
+            .iterator(chunk_size=chunk_size)
+        )
+        for *row, id_ride in rows:
+            counts.update(ride_cells(*row))
+            last_id = max(last_id, id_ride)
+        last_ids[alias] = last_id
+    return counts, last_ids
+
+
+def rebuild(chunk_size=REBUILD_CHUNK_SIZE):
+    """Recount the whole heatmap and replace HeatmapCell atomically."""
+    counts, last_ids = count_rides(chunk_size=chunk_size)
+    with contextlib.ExitStack() as locks:
+        for alias in ride_databases():
+            connection = connections[alias]
+            if connection.vendor == 'sqlite':
+                continue
+            locks.enter_context(transaction.atomic(using=alias))
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'LOCK TABLE {connection.ops.quote_name(Ride._meta.db_table)} IN SHARE MODE'
+                )
+        locks.enter_context(write_transaction())
+        # Rides created during the count were recorded in the cells being
+        # replaced, or will be recorded after the swap: count them here,
+        # under the write lock, and record_ride() skips them.
+        late_counts, last_ids = count_rides(chunk_size=chunk_size, after=last_ids)
+        counts.update(late_counts)
+        HeatmapCell.objects.all().delete()
+        HeatmapCell.objects.bulk_create(
+            (HeatmapCell(count=count, **dict(zip(CELL_FIELDS, key)))
+             for key, count in counts.items()),
+            batch_size=1000,
+        )
+        HeatmapSource.objects.all().delete()
+        HeatmapSource.objects.bulk_create(
+            HeatmapSource(database=alias, last_ride_id=last_id)
+            for alias, last_id in last_ids.items()
+        )
+    return len(counts)
+
+
+def get_tile(kind, zoom, tile_x, tile_y, hour=None):
+    """[[cell_x, cell_y, count], ...] for one tile and hour (default: all hours)."""
+    cells = HeatmapCell.objects.filter(
+        kind=kind, zoom=zoom, tile_x=tile_x, tile_y=tile_y,
+        hour=ALL_HOURS if hour is None else hour,
+    )
+    return [list(row) for row in cells.values_list('cell_x', 'cell_y', 'count')]
@@ -0,0 +1,184 @@
+"""
+Load shedding for expensive request classes.
+
+request_class() sorts out the requests that can tie a worker up for
+seconds: unpaginated ride lists, email-filtered ride scans, analytics,
+NDJSON exports and report downloads. Each class costs units of a budget
+of in-flight work shared by every worker process on the host:
+settings.LOAD_SHED_BUDGET slot files in LOAD_SHED_DIR, each held with
+flock while a request using it runs and streams its response. A request
+that cannot get enough free slots is answered at once instead of
+occupying a worker:
+
+- 429 when the same client (token, or IP without one) already holds a
+  slot, so one client cannot take the whole budget;
+- 503 otherwise.
+
+Both carry Retry-After, the class's recent average duration in this
+process. Cheap requests are never shed. flock locks go away with their
+process, so a killed worker never leaks budget.
+"""
+import fcntl
+import hashlib
+import math
+import os
+import threading
+from functools import cache
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import reverse
+from rest_framework.throttling import BaseThrottle
+
+from core import metrics
+
+# Expensive request class: cost in budget units.
+REQUEST_CLASSES = {
+    'ride_list': 1,
+    'ride_email_scan': 1,
+    'ride_analytics': 1,
+    'ride_export': 2,
+    'report': 2,
+}
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+DEFAULT_RETRY_AFTER = 1.0
+# Weight of the newest duration in the per-class moving average.
+DURATION_SMOOTHING = 0.2
+
+_durations = {}
+_durations_lock = threading.Lock()
+
+
+def shed_budget():
+    return getattr(settings, 'LOAD_SHED_BUDGET', 0)
+
+
+@cache
+def _paths():
+    return {
+        'ride_list': reverse('ride:ride-list'),
+        'ride_analytics': reverse('ride:ride-analytics'),
+        'report': reverse('admin:ride_long_trips_report'),
+    }
+
+
+def request_class(request):
+    """Expensive class of a request, or None for a cheap one."""
+    if request.method != 'GET':
+        return None
+    paths = _paths()
+    path = request.path_info
+    if path == paths['ride_list']:
+        if (request.GET.get('format') == 'ndjson'
+                or NDJSON_MEDIA_TYPE in request.META.get('HTTP_ACCEPT', '')):
+            return 'ride_export'
+        if 'id_rider__email' in request.GET:
+            return 'ride_email_scan'
+        return 'ride_list'
+    if path == paths['ride_analytics']:
+        return 'ride_analytics'
+    if path == paths['report']:
+        return 'report'
+    return None
+
+
+def client_key(request):
+    """
+    Who is asking: a hash of the Authorization header, or of the client IP
+    as the throttles see it (X-Forwarded-For only through NUM_PROXIES).
+    """
+    ident = request.META.get('HTTP_AUTHORIZATION') or BaseThrottle().get_ident(request)
+    return hashlib.sha256(ident.encode()).hexdigest()[:16]
+
+
+def _slot_paths():
+    directory = settings.LOAD_SHED_DIR
+    os.makedirs(directory, exist_ok=True)
+    return [os.path.join(directory, f'slot-{index}') for index in range(shed_budget())]
+
+
+def _lock(path):
+    """Open and flock a slot file without blocking; None if it is held."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def release(slots):
+    for fd in slots:
+        os.ftruncate(fd, 0)
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def acquire(name, owner):
+    """Hold enough free slots for a request of the class, or return None."""
+    cost = min(REQUEST_CLASSES[name], shed_budget())
+    slots = []
+    for path in _slot_paths():
+        fd = _lock(path)
+        if fd is None:
+            continue
+        os.write(fd, owner.encode())
+        slots.append(fd)
+        if len(slots) == cost:
+            return slots
+    release(slots)
+    return None
+
+
+def holders():
+    """
+    Client keys holding slots right now.
+
+    Free slots are empty (release() truncates them), so they are never
+    locked here, which would make a concurrent acquire() skip them. A
+    slot with an owner may be left over by a killed worker: only such
+    slots are probed with a non-blocking shared lock, which succeeds
+    when nobody holds the slot any more.
+    """
+    owners = set()
+    for path in _slot_paths():
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            owner = os.read(fd, 64).decode()
+            if not owner:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                owners.add(owner)
+        finally:
+            os.close(fd)
+    return owners
+
+
+def record_duration(name, duration):
+    with _durations_lock:
+        previous = _durations.get(name)
+        _durations[name] = duration if previous is None else (
+            previous + DURATION_SMOOTHING * (duration - previous)
+        )
+
+
+def retry_after(name):
+    return max(1, math.ceil(_durations.get(name, DEFAULT_RETRY_AFTER)))
+
+
+def shed_response(name, owner):
+    """429 or 503 with Retry-After for a request that did not get a slot."""
+    if owner in holders():
+        status, detail = 429, 'Too many expensive requests in flight for this client.'
+    else:
+        status, detail = 503, 'Server busy, retry later.'
+    metrics.inc('http_requests_shed_total', request_class=name, status=status)
+    response = JsonResponse({'detail': detail}, status=status)
+    response['Retry-After'] = str(retry_after(name))
+    return response
@@ -0,0 +1,276 @@
+"""
+Request-replay load generator.
+
+Replays a weighted mix of request shapes (method, path, query and body
+templates) directly against app.wsgi.application from several worker
+processes, without nginx or gunicorn in front. Shapes come from
+DEFAULT_SHAPES, a JSON file written by hand, or a JSONL file recorded by
+core.middleware.RequestShapeRecorderMiddleware.
+
+Templates use {placeholder} names filled per request from
+LoadTestContext: ride_id, status, rider_email, login_email and
+login_password, and int, float and str for values the recorder only kept
+the type of.
+"""
+import io
+import json
+import math
+import random
+import re
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+PLACEHOLDER = re.compile(r'\{([a-z_]+)\}')
+
+DEFAULT_SHAPES = [
+    {'name': 'ride_list', 'method': 'GET', 'path': '/api/ride/rides/',
+     'query': '', 'auth': 'token', 'weight': 20},
+    {'name': 'ride_filter_status', 'method': 'GET', 'path': '/api/ride/rides/',
+     'query': 'status={status}&ordering=-pickup_time', 'auth': 'token', 'weight': 20},
+    {'name': 'ride_filter_email', 'method': 'GET', 'path': '/api/ride/rides/',
+     'query': 'id_rider__email={rider_email}', 'auth': 'token', 'weight': 10},
+    {'name': 'ride_detail', 'method': 'GET', 'path': '/api/ride/rides/{ride_id}/',
+     'query': '', 'auth': 'token', 'weight': 30},
+    {'name': 'ride_patch_status', 'method': 'PATCH', 'path': '/api/ride/rides/{ride_id}/',
+     'query': '', 'body': '{"status": "{status}"}', 'auth': 'token', 'weight': 12},
+    {'name': 'token_login', 'method': 'POST', 'path': '/api/user/token/', 'query': '',
+     'body': '{"email": "{login_email}", "password": "{login_password}"}',
+     'auth': None, 'weight': 6},
+    {'name': 'long_trips_report', 'method': 'GET',
+     'path': '/admin/core/ride/download-long-trips-report/', 'query': '',
+     'auth': 'session', 'weight': 2},
+]
+
+
+def load_shapes(path):
+    """
+    Read request shapes from a JSON list or a recorded JSONL file.
+
+    Recorded shapes are grouped: identical shapes become one entry whose
+    weight is the number of times it was seen.
+    """
+    with open(path) as shapes_file:
+        text = shapes_file.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+
+    counts = Counter()
+    for line in text.splitlines():
+        if line.strip():
+            shape = json.loads(line)
+            counts[(shape['method'], shape['path'], shape.get('query', ''),
+                    shape.get('body'), shape.get('auth'))] += 1
+    return [
+        {'name': f'{method} {path}', 'method': method, 'path': path, 'query': query,
+         'body': body, 'auth': auth, 'weight': weight}
+        for (method, path, query, body, auth), weight in counts.most_common()
+    ]
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram (milliseconds) that can be merged."""
+
+    GROWTH = 1.1
+    MIN_MS = 0.05
+
+    def __init__(self, buckets=None):
+        self.buckets = Counter(buckets or {})
+
+    def _bucket(self, latency_ms):
+        if latency_ms <= self.MIN_MS:
+            return 0
+        return int(math.log(latency_ms / self.MIN_MS, self.GROWTH)) + 1
+
+    def _upper_bound(self, bucket):
+        return self.MIN_MS * self.GROWTH ** bucket
+
+    def record(self, latency_ms):
+        self.buckets[self._bucket(latency_ms)] += 1
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+
+    @property
+    def count(self):
+        return sum(self.buckets.values())
+
+    def percentile(self, percentile):
+        """Upper bound of the bucket holding the given percentile."""
+        total = self.count
+        if not total:
+            return None
+        threshold = total * percentile / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= threshold:
+                return self._upper_bound(bucket)
+        return self._upper_bound(max(self.buckets))
+
+    def rows(self, edges=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)):
+        """(lower_ms, upper_ms, count) per coarse latency range, for printing."""
+        counts = Counter()
+        for bucket, value in self.buckets.items():
+            bound = self._upper_bound(bucket)
+            counts[next((edge for edge in edges if bound <= edge), math.inf)] += value
+        rows, lower = [], 0
+        for upper in edges + (math.inf,):
+            rows.append((lower, upper, counts[upper]))
+            lower = upper
+        return rows
+
+    def as_dict(self):
+        return dict(self.buckets)
+
+
+class LoadTestContext:
+    """Values used to fill shape templates."""
+
+    def __init__(self, ride_ids, rider_emails, login_email=None, login_password=None,
+                 token=None, session_cookie=None, host='localhost'):
+        self.ride_ids = ride_ids or [0]
+        self.rider_emails = rider_emails or ['nobody@example.com']
+        self.login_email = login_email or ''
+        self.login_password = login_password or ''
+        self.token = token
+        self.session_cookie = session_cookie
+        self.host = host
+
+    def value(self, name, rng):
+        if name == 'ride_id':
+            return str(rng.choice(self.ride_ids))
+        if name == 'status':
+            return rng.choice(['en-route', 'pickup', 'dropoff'])
+        if name == 'rider_email':
+            return rng.choice(self.rider_emails)
+        if name == 'login_email':
+            return self.login_email
+        if name == 'login_password':
+            return self.login_password
+        # Recorded values of other parameters (limit, hour, ...) are typed only.
+        if name == 'int':
+            return str(rng.randint(1, 23))
+        if name == 'float':
+            return f'{rng.uniform(0, 1):.3f}'
+        if name == 'str':
+            return 'loadtest'
+        raise KeyError(f'Unknown placeholder {{{name}}}')
+
+    def fill(self, template, rng):
+        if not template:
+            return template or ''
+        return PLACEHOLDER.sub(lambda match: self.value(match.group(1), rng), template)
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def build_environ(shape, context, rng):
+    """WSGI environ for one request built from a shape."""
+    path = context.fill(shape['path'], rng)
+    query = context.fill(shape.get('query') or '', rng)
+    body = context.fill(shape.get('body') or '', rng).encode()
+    split = urlsplit(path)
+    environ = {
+        'REQUEST_METHOD': shape['method'],
+        'PATH_INFO': split.path,
+        'QUERY_STRING': query or split.query,
+        'SERVER_NAME': context.host,
+        'SERVER_PORT': '80',
+        'HTTP_HOST': context.host,
+        'REMOTE_ADDR': '127.0.0.1',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(len(body)),
+    }
+    if body:
+        environ['CONTENT_TYPE'] = 'application/json'
+    if shape.get('auth') == 'token' and context.token:
+        environ['HTTP_AUTHORIZATION'] = f'Token {context.token}'
+    elif shape.get('auth') == 'session' and context.session_cookie:
+        environ['HTTP_COOKIE'] = context.session_cookie
+    return environ
+
+
+def call_application(application, environ):
+    """Run one request through a WSGI app; return the status code."""
+    status_holder = []
+
+    def start_response(status, headers, exc_info=None):
+        status_holder.append(int(status.split(' ', 1)[0]))
+        return lambda data: None
+
+    result = application(environ, start_response)
+    try:
+        for _chunk in result:
+            pass
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return status_holder[0]
+
+
+def run_worker(shapes, context_dict, duration, seed, results, throttle=False):
+    """
+    Worker process: replay shapes for duration seconds, report stats via
+    results queue. The API throttles are off unless throttle is true:
+    every request shares one token and client IP.
+    """
+    import django
+
+    django.setup()
+    from django.test import override_settings
+
+    from app.wsgi import application
+
+    if not throttle:
+        # For the rest of this process, which only replays requests.
+        override_settings(THROTTLE_ENABLED=False).enable()
+
+    context = LoadTestContext(**context_dict)
+    rng = random.Random(seed)
+    weights = [shape.get('weight', 1) for shape in shapes]
+    stats = {
+        shape['name']: {'histogram': LatencyHistogram(), 'errors': 0, 'client_errors': 0,
+                        'build_errors': 0}
+        for shape in shapes
+    }
+
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        shape = rng.choices(shapes, weights)[0]
+        entry = stats[shape['name']]
+        try:
+            environ = build_environ(shape, context, rng)
+        except (KeyError, ValueError):
+            # Unknown placeholder or malformed shape: count it, keep going.
+            entry['build_errors'] += 1
+            continue
+        started = time.perf_counter()
+        try:
+            status = call_application(application, environ)
+        except Exception:
+            status = 599
+        latency_ms = (time.perf_counter() - started) * 1000
+        entry['histogram'].record(latency_ms)
+        if status >= 500:
+            entry['errors'] += 1
+        elif status >= 400:
+            entry['client_errors'] += 1
+
+    results.put({
+        name: {
+            'histogram': entry['histogram'].as_dict(),
+            'errors': entry['errors'],
+            'client_errors': entry['client_errors'],
+            'build_errors': entry['build_errors'],
+        }
+        for name, entry in stats.items()
+    })
@@ -0,0 +1,95 @@
+"""
+Benchmark heatmap tile queries against aggregating rides on request.
+
+Rides at random points around one city are inserted (and counted into
+the heatmap) inside a transaction that is rolled back afterwards. For
+each ride count the busiest tile at every zoom level is read from the
+precomputed cells and, for comparison, computed by scanning the rides.
+"""
+import random
+import statistics
+import time
+import uuid
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core import heatmap
+from core.models import HeatmapCell, Ride, User
+
+
+class Command(BaseCommand):
+    help = 'Benchmark precomputed heatmap tile reads against a full ride scan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,50000,200000',
+                            help='Comma separated total ride counts to test.')
+        parser.add_argument('--repeat', type=int, default=20, help='Tile reads per measurement.')
+
+    def _add_rides(self, rider, count, rng):
+        now = timezone.now()
+        rides = []
+        for _index in range(count):
+            latitude, longitude = rng.gauss(14.58, 0.08), rng.gauss(121.0, 0.08)
+            rides.append(Ride(
+                id_rider=rider,
+                pickup_latitude=latitude,
+                pickup_longitude=longitude,
+                dropoff_latitude=latitude + rng.uniform(-0.05, 0.05),
+                dropoff_longitude=longitude + rng.uniform(-0.05, 0.05),
+                pickup_time=now - timezone.timedelta(minutes=rng.randrange(7 * 24 * 60)),
+            ))
+        Ride.objects.bulk_create(rides, batch_size=1000)
+        counts = Counter()
+        for ride in rides:
+            counts.update(heatmap.ride_cells(
+                ride.pickup_latitude, ride.pickup_longitude,
+                ride.dropoff_latitude, ride.dropoff_longitude, ride.pickup_time,
+            ))
+        heatmap.increment_cells(counts)
+
+    def _scan_tile(self, rider, zoom, tile_x, tile_y):
+        cells = Counter()
+        rows = Ride.objects.filter(id_rider=rider).values_list(
+            'pickup_latitude', 'pickup_longitude'
+        ).iterator(chunk_size=5000)
+        for latitude, longitude in rows:
+            x, y, cell_x, cell_y = heatmap.cell_for_point(latitude, longitude, zoom)
+            if (x, y) == (tile_x, tile_y):
+                cells[cell_x, cell_y] += 1
+        return cells
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(value) for value in options['sizes'].split(','))
+        rng = random.Random(0)
+
+        with transaction.atomic():
+            rider = User.objects.create_user(f'bench-rider-{uuid.uuid4().hex[:8]}@example.com')
+            created = 0
+            for size in sizes:
+                self._add_rides(rider, size - created, rng)
+                created = size
+                for zoom in heatmap.ZOOM_LEVELS:
+                    busiest = (
+                        HeatmapCell.objects.filter(kind='pickup', zoom=zoom)
+                        .order_by('-count')
+                        .values_list('tile_x', 'tile_y')
+                        .first()
+                    )
+                    timings = []
+                    for _index in range(options['repeat']):
+                        started = time.perf_counter()
+                        cells = heatmap.get_tile('pickup', zoom, *busiest)
+                        timings.append(time.perf_counter() - started)
+                    started = time.perf_counter()
+                    self._scan_tile(rider, zoom, *busiest)
+                    scan = time.perf_counter() - started
+                    self.stdout.write(
+                        f'{size:>8} rides  zoom {zoom:>2}  {len(cells):>5} cells  '
+                        f'tile p50 {statistics.median(timings) * 1000:7.2f} ms  '
+                        f'max {max(timings) * 1000:7.2f} ms  scan {scan * 1000:9.1f} ms'
+                    )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,202 @@
+"""
+Load test cheap-request latency during an overload, with and without
+load shedding.
+
+A scratch SQLite database is filled with rides, then for each run
+gunicorn serves the app with 4 workers (as in production) while client
+threads keep more requests in flight than there are workers. Most
+requests are cheap (ride detail, heatmap tile); the rest are expensive
+(unpaginated ride list, email-filtered scan, NDJSON export). Without
+shedding the expensive requests take every worker and cheap requests
+queue behind them. Throttles are disabled so only shedding is measured.
+
+Runs: cheap requests alone (the baseline), the overload mix with
+LOAD_SHED_BUDGET=0, and the overload mix with the given budget.
+"""
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SETUP_SCRIPT = """
+import json, sys
+import django
+django.setup()
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from core.models import Ride, User
+
+admin = User.objects.create_user('bench-admin@example.com', role='admin')
+riders = [User.objects.create_user(f'bench-rider-{index}@example.com') for index in range(20)]
+Ride.objects.bulk_create([
+    Ride(id_rider=riders[index % len(riders)], pickup_latitude=14.5, pickup_longitude=121.0,
+         dropoff_latitude=14.6, dropoff_longitude=121.1, pickup_time=timezone.now())
+    for index in range(int(sys.argv[1]))
+], batch_size=1000)
+print(json.dumps({
+    'token': Token.objects.create(user=admin).key,
+    'ride_ids': list(Ride.objects.values_list('pk', flat=True)[:1000]),
+    'rider_emails': [rider.email for rider in riders],
+}))
+"""
+
+CHEAP = ['ride_detail', 'heatmap_tile']
+EXPENSIVE = ['ride_list', 'ride_email_scan', 'ride_export']
+
+
+def request_path(name, data, rng):
+    if name == 'ride_detail':
+        return f'/api/ride/rides/{rng.choice(data["ride_ids"])}/'
+    if name == 'heatmap_tile':
+        return '/api/ride/heatmap/pickup/8/214/121/'
+    if name == 'ride_list':
+        return '/api/ride/rides/?status=en-route'
+    if name == 'ride_email_scan':
+        return f'/api/ride/rides/?id_rider__email={rng.choice(data["rider_emails"])}'
+    return '/api/ride/rides/?format=ndjson'
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Load test cheap-request p99 latency during an overload, with and without shedding.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=16,
+                            help='Concurrent client threads.')
+        parser.add_argument('--expensive-share', type=float, default=0.25,
+                            help='Fraction of requests that are expensive.')
+        parser.add_argument('--seconds', type=float, default=30.0, help='Duration of each run.')
+        parser.add_argument('--rides', type=int, default=20000)
+        parser.add_argument('--budget', type=int,
+                            help='LOAD_SHED_BUDGET for the run with shedding '
+                                 '(default: the configured budget).')
+
+    def _free_port(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def _wait_ready(self, port, server):
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            if server.poll() is not None:
+                raise CommandError('gunicorn exited during startup.')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError('gunicorn did not start.')
+
+    def _client(self, port, data, names, weights, deadline, seed, results):
+        rng = random.Random(seed)
+        host = settings.ALLOWED_HOSTS[0]
+        while time.time() < deadline:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+            try:
+                connection.request('GET', request_path(name, data, rng), headers={
+                    'Host': host, 'Authorization': f'Token {data["token"]}',
+                })
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except OSError:
+                status = 599
+            finally:
+                connection.close()
+            results.append((name, status, time.perf_counter() - started))
+
+    def _run(self, env, data, budget, expensive_share, options):
+        port = self._free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', '4',
+             '--timeout', '120', 'app.wsgi:application'],
+            cwd=settings.BASE_DIR, env=dict(env, LOAD_SHED_BUDGET=str(budget)),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            self._wait_ready(port, server)
+            names = CHEAP + EXPENSIVE
+            weights = ([(1 - expensive_share) / len(CHEAP)] * len(CHEAP)
+                       + [expensive_share / len(EXPENSIVE)] * len(EXPENSIVE))
+            results = []
+            deadline = time.time() + options['seconds']
+            clients = [
+                threading.Thread(target=self._client,
+                                 args=(port, data, names, weights, deadline, seed, results))
+                for seed in range(options['clients'])
+            ]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+        finally:
+            server.terminate()
+            server.wait()
+        return results
+
+    def _report(self, label, results):
+        cheap = [elapsed for name, status, elapsed in results if name in CHEAP and status == 200]
+        cheap_failed = sum(1 for name, status, _elapsed in results
+                           if name in CHEAP and status != 200)
+        expensive = [(status, elapsed) for name, status, elapsed in results if name in EXPENSIVE]
+        served = [elapsed for status, elapsed in expensive if status == 200]
+        shed = sum(1 for status, _elapsed in expensive if status in (429, 503))
+        self.stdout.write(
+            f'{label:<18} cheap: {len(cheap):>5} ok  p50 {percentile(cheap, 0.5) * 1000:7.1f} ms  '
+            f'p99 {percentile(cheap, 0.99) * 1000:8.1f} ms  {cheap_failed} failed | '
+            f'expensive: {len(served):>4} served (p50 {percentile(served, 0.5):5.2f} s)  '
+            f'{shed:>4} shed'
+        )
+        return percentile(cheap, 0.99)
+
+    def handle(self, *args, **options):
+        budget = options['budget'] or settings.LOAD_SHED_BUDGET or 1
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ,
+                DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'app.settings'),
+                SQLITE_PATH=os.path.join(directory, 'db.sqlite3'),
+                SQLITE_PRODUCTION='True',
+                RIDE_SHARD_COUNT='0',
+                METRICS_DIR=os.path.join(directory, 'metrics'),
+                LOAD_SHED_DIR=os.path.join(directory, 'load-shed'),
+                THROTTLE_ENABLED='False',
+            )
+            subprocess.run([sys.executable, 'manage.py', 'migrate', '--verbosity', '0'],
+                           cwd=settings.BASE_DIR, env=env, check=True)
+            setup = subprocess.run(
+                [sys.executable, '-c', SETUP_SCRIPT, str(options['rides'])],
+                cwd=settings.BASE_DIR, env=env, check=True, stdout=subprocess.PIPE, text=True,
+            )
+            data = json.loads(setup.stdout)
+
+            baseline = self._report(
+                'cheap only', self._run(env, data, 0, 0.0, options))
+            unshed = self._report(
+                'overload', self._run(env, data, 0, options['expensive_share'], options))
+            shed = self._report(
+                f'overload, budget {budget}',
+                self._run(env, data, budget, options['expensive_share'], options))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Cheap p99: {baseline * 1000:.1f} ms alone, {unshed * 1000:.1f} ms overloaded, '
+            f'{shed * 1000:.1f} ms overloaded with shedding.'
+        ))
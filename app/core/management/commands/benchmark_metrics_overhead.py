@@ -0,0 +1,96 @@
+"""
+Benchmark the request latency overhead of the metrics middleware.
+
+Two WSGI handlers are built, one with metrics disabled and one recording
+into a temporary METRICS_DIR. Every request of the mix is sent to both
+handlers back to back, alternating which goes first, so drift in machine
+load affects both equally. Runs inside a transaction that is rolled back,
+so connections are not closed at the end of each request (as in the test
+client).
+"""
+import random
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, transaction
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+from core.loadtest import LoadTestContext, build_environ, call_application
+from core.models import Ride, User
+
+SHAPES = [
+    {'name': 'ride_list', 'method': 'GET', 'path': '/api/ride/rides/',
+     'query': 'status={status}', 'auth': 'token'},
+    {'name': 'ride_detail', 'method': 'GET', 'path': '/api/ride/rides/{ride_id}/',
+     'query': '', 'auth': 'token'},
+]
+
+
+class Command(BaseCommand):
+    help = 'Measure request latency with and without the metrics middleware.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Requests sent to each handler.')
+        parser.add_argument('--warmup', type=int, default=100)
+
+    def _call(self, handler, environ):
+        started = time.perf_counter()
+        status = call_application(handler, environ)
+        elapsed = time.perf_counter() - started
+        if status != 200:
+            raise CommandError(f'Unexpected status {status}.')
+        return elapsed
+
+    def _run(self, options):
+        with transaction.atomic(), tempfile.TemporaryDirectory() as metrics_dir:
+            admin = User.objects.create_user(
+                f'bench-admin-{uuid.uuid4().hex[:8]}@example.com', role='admin'
+            )
+            ride_ids = list(Ride.objects.values_list('id_ride', flat=True)[:100])
+            if not ride_ids:
+                raise CommandError('No rides to request; create some rides first.')
+            context = LoadTestContext(
+                ride_ids=ride_ids,
+                rider_emails=[],
+                token=Token.objects.create(user=admin).key,
+                host=settings.ALLOWED_HOSTS[0],
+            )
+
+            with override_settings(METRICS_DIR=''):
+                off = WSGIHandler()
+            with override_settings(METRICS_DIR=metrics_dir):
+                on = WSGIHandler()
+                totals = {off: 0.0, on: 0.0}
+                rng = random.Random(0)
+                for index in range(options['warmup'] + options['requests']):
+                    shape = SHAPES[index % len(SHAPES)]
+                    seed = rng.random()
+                    for handler in ((off, on) if index % 2 else (on, off)):
+                        # Same ride/status for both handlers.
+                        environ = build_environ(shape, context, random.Random(seed))
+                        elapsed = self._call(handler, environ)
+                        if index >= options['warmup']:
+                            totals[handler] += elapsed
+
+            transaction.set_rollback(True)
+        return totals[off] / options['requests'], totals[on] / options['requests']
+
+    def handle(self, *args, **options):
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            off, on = self._run(options)
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+
+        self.stdout.write(f'metrics off  {off * 1000:8.3f} ms/request')
+        self.stdout.write(f'metrics on   {on * 1000:8.3f} ms/request')
+        self.stdout.write(self.style.SUCCESS(f'Overhead: {(on - off) / off:+.2%}'))
@@ -0,0 +1,108 @@
+"""
+Benchmark rendering a 1000-ride page with the stdlib JSON renderer, the
+orjson-backed FastJSONRenderer and MessagePack, and parsing it back.
+
+Rides with random coordinates and two events each are inserted inside a
+transaction that is rolled back afterwards. The page is serialized once
+with RideSerializer; each renderer then renders the same data, and the
+FastJSONRenderer output is checked to be byte-for-byte identical.
+"""
+import io
+import random
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Ride, RideEvent, User
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+from ride.serializers import RideSerializer
+
+
+def median_time(repeat, function):
+    """Median time of `repeat` calls, and the last result."""
+    timings = []
+    for _index in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), result
+
+
+class Command(BaseCommand):
+    help = 'Benchmark JSON and MessagePack rendering of 1000-ride pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', type=int, default=1000, help='Rides per page.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def _add_rides(self, rider, count):
+        rng = random.Random(0)
+        now = timezone.now()
+        Ride.objects.bulk_create([
+            Ride(
+                id_rider=rider,
+                pickup_latitude=rng.uniform(14.4, 14.8),
+                pickup_longitude=rng.uniform(120.9, 121.2),
+                dropoff_latitude=rng.uniform(14.4, 14.8),
+                dropoff_longitude=rng.uniform(120.9, 121.2),
+                pickup_time=now - timedelta(microseconds=rng.randrange(10 ** 11)),
+            )
+            for _index in range(count)
+        ])
+        RideEvent.objects.bulk_create([
+            RideEvent(id_ride_id=ride_id, description=description,
+                      created_at=now - timedelta(microseconds=rng.randrange(10 ** 11)))
+            for ride_id in Ride.objects.filter(id_rider=rider).values_list('pk', flat=True)
+            for description in ("Ride created with status 'en-route'",
+                                "Status changed from 'en-route' to 'pickup'")
+        ])
+
+    def _run(self, options):
+        repeat = options['repeat']
+        with transaction.atomic():
+            rider = User.objects.create_user(f'bench-rider-{uuid.uuid4().hex[:8]}@example.com')
+            self._add_rides(rider, options['rides'])
+            rides = Ride.objects.filter(id_rider=rider).select_related(
+                'id_rider', 'id_driver'
+            ).prefetch_related('events')
+            serialize_time, data = median_time(
+                repeat, lambda: {'count': len(rides), 'results': RideSerializer(rides, many=True).data}
+            )
+            transaction.set_rollback(True)
+
+        results = [('serialize', serialize_time, None)]
+        stdlib_time, expected = median_time(repeat, lambda: JSONRenderer().render(data))
+        results.append(('json (stdlib)', stdlib_time, len(expected)))
+        fast_time, rendered = median_time(repeat, lambda: FastJSONRenderer().render(data))
+        if rendered != expected:
+            raise CommandError('FastJSONRenderer output differs from JSONRenderer.')
+        results.append(('json (fast)' if orjson else 'json (fast, no orjson)', fast_time, len(rendered)))
+        if msgpack is not None:
+            packed_time, packed = median_time(repeat, lambda: MessagePackRenderer().render(data))
+            results.append(('msgpack', packed_time, len(packed)))
+
+        for label, parser in (('parse (stdlib)', JSONParser()), ('parse (fast)', FastJSONParser())):
+            parse_time, parsed = median_time(repeat, lambda: parser.parse(io.BytesIO(expected)))
+            if parsed['count'] != data['count']:
+                raise CommandError(f'{label}: parsed page differs.')
+            results.append((label, parse_time, None))
+        return results, stdlib_time, fast_time
+
+    def handle(self, *args, **options):
+        results, stdlib_time, fast_time = self._run(options)
+        for label, elapsed, size in results:
+            line = f'{label:<24} {elapsed * 1000:8.2f} ms'
+            if size is not None:
+                line += f'  {size / 1024:8.1f} KiB'
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(
+            f'Identical output; JSON rendering {stdlib_time / fast_time:.1f}x faster.'
+        ))
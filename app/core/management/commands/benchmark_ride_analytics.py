@@ -0,0 +1,154 @@
+"""
+Benchmark the vectorized ride analytics against a pure-Python reference.
+
+Synthetic ride arrays are generated in memory, aggregated with
+ride.analytics.compute_ride_stats and with a per-row Python
+implementation, and the two results are checked against each other.
+"""
+import math
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Ride
+from ride.analytics import (
+    EARTH_RADIUS_KM,
+    PERCENTILES,
+    compute_ride_stats,
+    load_ride_arrays,
+)
+
+
+def synthetic_rides(count, drivers=2000, days=365, seed=0):
+    """Random ride arrays shaped like load_ride_arrays() output."""
+    rng = np.random.default_rng(seed)
+    start = 1_700_000_000.0
+    pickup_time = start + rng.uniform(0, days * 86400, count)
+    pickup_at = pickup_time + rng.uniform(0, 900, count)
+    dropoff_at = pickup_at + rng.exponential(1800, count)
+    # Some rides have no driver yet or never reached dropoff.
+    driver = rng.integers(1, drivers + 1, count)
+    driver[rng.random(count) < 0.01] = -1
+    dropoff_at[rng.random(count) < 0.05] = np.nan
+    pickup_lat = rng.uniform(14.4, 14.8, count)
+    pickup_lon = rng.uniform(120.9, 121.2, count)
+    return {
+        'driver': driver,
+        'pickup_time': pickup_time,
+        'pickup_at': pickup_at,
+        'dropoff_at': dropoff_at,
+        'pickup_latitude': pickup_lat,
+        'pickup_longitude': pickup_lon,
+        'dropoff_latitude': pickup_lat + rng.normal(0, 0.05, count),
+        'dropoff_longitude': pickup_lon + rng.normal(0, 0.05, count),
+    }
+
+
+def _percentile(sorted_values, percentile):
+    position = (len(sorted_values) - 1) * percentile / 100
+    lower, upper = math.floor(position), math.ceil(position)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def reference_stats(arrays, group_by='driver'):
+    """Pure-Python per-row implementation used to check the vectorized one."""
+    columns = {key: values.tolist() for key, values in arrays.items()}
+    groups = defaultdict(lambda: {'count': 0, 'distance': 0.0, 'durations': []})
+
+    for index in range(len(columns['driver'])):
+        if group_by == 'driver':
+            key = columns['driver'][index]
+        else:
+            key = math.floor(columns['pickup_time'][index] / 86400)
+        group = groups[key]
+        group['count'] += 1
+
+        lat1, lon1, lat2, lon2 = map(math.radians, (
+            columns['pickup_latitude'][index], columns['pickup_longitude'][index],
+            columns['dropoff_latitude'][index], columns['dropoff_longitude'][index],
+        ))
+        a = (math.sin((lat2 - lat1) / 2) ** 2
+             + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+        group['distance'] += 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+        duration = columns['dropoff_at'][index] - columns['pickup_at'][index]
+        if not math.isnan(duration) and duration >= 0:
+            group['durations'].append(duration)
+
+    results = []
+    for key in sorted(groups):
+        group = groups[key]
+        durations = sorted(group['durations'])
+        row = {
+            'key': key,
+            'ride_count': group['count'],
+            'completed_count': len(durations),
+            'distance_total_km': group['distance'],
+        }
+        for percentile in PERCENTILES:
+            row[f'duration_p{percentile}_s'] = (
+                _percentile(durations, percentile) if durations else None
+            )
+        results.append(row)
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Benchmark vectorized ride analytics against a pure-Python reference.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', type=int, default=5_000_000, help='Synthetic rides.')
+        parser.add_argument('--group-by', choices=['driver', 'day'], default='driver')
+        parser.add_argument('--skip-reference', action='store_true',
+                            help='Only time the vectorized path.')
+        parser.add_argument('--from-db', action='store_true',
+                            help='Also time loading the rides currently in the database.')
+
+    def handle(self, *args, **options):
+        group_by = options['group_by']
+
+        if options['from_db']:
+            started = time.perf_counter()
+            db_arrays = load_ride_arrays(Ride.objects.all())
+            loaded = time.perf_counter()
+            compute_ride_stats(db_arrays, group_by=group_by)
+            self.stdout.write(
+                f"database: {len(db_arrays['driver'])} rides loaded in {loaded - started:.2f}s, "
+                f"aggregated in {time.perf_counter() - loaded:.2f}s"
+            )
+
+        arrays = synthetic_rides(options['rides'])
+        started = time.perf_counter()
+        vectorized = compute_ride_stats(arrays, group_by=group_by)
+        vectorized_s = time.perf_counter() - started
+        self.stdout.write(
+            f"vectorized: {options['rides']} rides, {len(vectorized)} groups in {vectorized_s:.2f}s"
+        )
+        if options['skip_reference']:
+            return
+
+        started = time.perf_counter()
+        reference = reference_stats(arrays, group_by=group_by)
+        reference_s = time.perf_counter() - started
+        self.stdout.write(f"reference:  {options['rides']} rides in {reference_s:.2f}s")
+
+        if len(reference) != len(vectorized):
+            raise CommandError(f'Group count mismatch: {len(reference)} != {len(vectorized)}')
+        for expected, actual in zip(reference, vectorized):
+            for field in ['ride_count', 'completed_count', 'distance_total_km'] + [
+                f'duration_p{percentile}_s' for percentile in PERCENTILES
+            ]:
+                if expected[field] is None or actual[field] is None:
+                    matches = expected[field] is actual[field]
+                else:
+                    matches = math.isclose(expected[field], actual[field], rel_tol=1e-9, abs_tol=1e-6)
+                if not matches:
+                    raise CommandError(
+                        f"Mismatch for group {expected['key']} {field}: "
+                        f"{expected[field]} != {actual[field]}"
+                    )
+        self.stdout.write(self.style.SUCCESS(
+            f'Results match. Speedup: {reference_s / vectorized_s:.1f}x'
+        ))
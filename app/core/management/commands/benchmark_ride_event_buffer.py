@@ -0,0 +1,140 @@
+"""
+Benchmark synchronous RideEvent inserts against the write-behind buffer.
+
+Two measurements per mode:
+
+- throughput of status changes saved in a loop (as in a management
+  command or admin action), counting the INSERT statements issued;
+- PATCH latency through the WSGI handler, split into the time until the
+  response body is complete (what the client waits for) and the time
+  spent closing the response, where the buffer is flushed.
+
+The write-behind buffer only sees committed events, so this benchmark
+commits its rides and deletes them (with their events) at the end.
+"""
+import random
+import statistics
+import time
+import uuid
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.event_buffer import ride_event_buffer
+from core.loadtest import LoadTestContext, build_environ
+from core.models import Ride, RideEvent, User
+from core.purge import delete_rides
+
+STATUSES = ['en-route', 'pickup', 'dropoff']
+PATCH_SHAPE = {'name': 'ride_patch_status', 'method': 'PATCH',
+               'path': '/api/ride/rides/{ride_id}/', 'query': '',
+               'body': '{"status": "{status}"}', 'auth': 'token'}
+
+
+class InsertCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('INSERT'):
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark synchronous and write-behind RideEvent inserts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', type=int, default=1000,
+                            help='Rides whose status is changed in the throughput test.')
+        parser.add_argument('--patches', type=int, default=500,
+                            help='PATCH requests per mode in the latency test.')
+
+    def _create_rides(self, rider, count):
+        Ride.objects.bulk_create([
+            Ride(
+                id_rider=rider,
+                pickup_latitude=14.5,
+                pickup_longitude=121.0,
+                dropoff_latitude=14.6,
+                dropoff_longitude=121.1,
+                pickup_time=timezone.now(),
+            )
+            for _index in range(count)
+        ])
+        return list(Ride.objects.filter(id_rider=rider).order_by('id_ride'))
+
+    def _throughput(self, rides):
+        counter = InsertCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            for status in STATUSES[1:]:
+                for ride in rides:
+                    ride.status = status
+                    ride.save()
+            ride_event_buffer.flush()
+        return len(rides) * (len(STATUSES) - 1), time.perf_counter() - started, counter.count
+
+    def _patch_latency(self, handler, context, count):
+        rng = random.Random(0)
+        latencies, closes = [], []
+        for _index in range(count):
+            environ = build_environ(PATCH_SHAPE, context, rng)
+            statuses = []
+            started = time.perf_counter()
+            result = handler(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            for _chunk in result:
+                pass
+            responded = time.perf_counter()
+            result.close()
+            closes.append(time.perf_counter() - responded)
+            latencies.append(responded - started)
+            if not statuses[0].startswith('200'):
+                raise CommandError(f'PATCH failed: {statuses[0]}')
+        latencies.sort()
+        return {
+            'p50': statistics.median(latencies),
+            'p99': latencies[int(len(latencies) * 0.99) - 1],
+            'close': statistics.mean(closes),
+        }
+
+    def handle(self, *args, **options):
+        suffix = uuid.uuid4().hex[:8]
+        admin = User.objects.create_user(f'bench-admin-{suffix}@example.com', role='admin')
+        token = Token.objects.create(user=admin)
+        ride_ids, rider_ids = [], []
+        try:
+            handler = WSGIHandler()
+            for label, write_behind in (('sync', False), ('buffered', True)):
+                rider = User.objects.create_user(f'bench-rider-{label}-{suffix}@example.com')
+                rider_ids.append(rider.pk)
+                with override_settings(RIDE_EVENT_WRITE_BEHIND=write_behind):
+                    rides = self._create_rides(rider, options['rides'])
+                    ride_ids += [ride.pk for ride in rides]
+                    events, elapsed, inserts = self._throughput(rides)
+                    written = RideEvent.objects.filter(id_ride__in=[ride.pk for ride in rides]).count()
+                    if written != events:
+                        raise CommandError(f'{label}: expected {events} events, found {written}.')
+
+                    context = LoadTestContext(
+                        ride_ids=[ride.pk for ride in rides],
+                        rider_emails=[],
+                        token=token.key,
+                        host=settings.ALLOWED_HOSTS[0],
+                    )
+                    latency = self._patch_latency(handler, context, options['patches'])
+
+                self.stdout.write(
+                    f'{label:<9} {events / elapsed:9.1f} events/s  {inserts:>6} INSERTs  '
+                    f'PATCH p50 {latency["p50"] * 1000:6.2f} ms  '
+                    f'p99 {latency["p99"] * 1000:6.2f} ms  '
+                    f'(+{latency["close"] * 1000:.2f} ms after the response)'
+                )
+        finally:
+            delete_rides(ride_ids)
+            User.objects.filter(pk__in=[admin.pk, *rider_ids]).delete()
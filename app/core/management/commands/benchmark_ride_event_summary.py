@@ -0,0 +1,112 @@
+"""
+Benchmark ride list latency with the stored event summary
+(?events=summary) against the full events prefetch.
+
+Rides with several events each are inserted inside a transaction that
+is rolled back afterwards, and their summaries are filled in from the
+events. Both modes list the same rides through the API; the summary of
+every ride is checked against its full event list, and the SQL queries
+of each mode are counted.
+"""
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.event_summary import expected_summary
+from core.models import Ride, RideEvent, User
+
+STATUSES = ['en-route', 'pickup', 'dropoff']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ride list latency with ?events=summary against the events prefetch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', type=int, default=2000)
+        parser.add_argument('--events', type=int, default=5, help='Events per ride.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def _add_rides(self, rider, count, events):
+        now = timezone.now()
+        Ride.objects.bulk_create([
+            Ride(id_rider=rider, pickup_latitude=14.5, pickup_longitude=121.0,
+                 dropoff_latitude=14.6, dropoff_longitude=121.1, pickup_time=now)
+            for _index in range(count)
+        ], batch_size=1000)
+        rides = Ride.objects.filter(id_rider=rider)
+        descriptions = [RideEvent.created_description(STATUSES[0])] + [
+            RideEvent.status_change_description(STATUSES[number % 3], STATUSES[(number + 1) % 3])
+            for number in range(events - 1)
+        ]
+        RideEvent.objects.bulk_create([
+            RideEvent(id_ride_id=ride_id, description=description,
+                      created_at=now + timedelta(seconds=number))
+            for ride_id in rides.values_list('pk', flat=True)
+            for number, description in enumerate(descriptions)
+        ], batch_size=1000)
+        rides.update(**expected_summary())
+
+    def _measure(self, client, path, repeat):
+        timings = []
+        for _index in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(path)
+                timings.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise CommandError(f'{response.status_code}: {response.content[:200]!r}')
+        timings.sort()
+        return {
+            'p50': statistics.median(timings),
+            'p99': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+            'queries': len(queries),
+            'bytes': len(response.content),
+            'data': response.json(),
+        }
+
+    def _check(self, full, summary):
+        summaries = {ride['id_ride']: ride for ride in summary}
+        for ride in full:
+            compact = summaries[ride['id_ride']]
+            events = ride['events']
+            if (compact['event_count'] != len(events)
+                    or compact['last_event_id'] != events[0]['id_ride_event']
+                    or compact['last_event_description'] != events[0]['description']):
+                raise CommandError(f'Summary of ride {ride["id_ride"]} does not match its events.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            suffix = uuid.uuid4().hex[:8]
+            admin = User.objects.create_user(f'bench-admin-{suffix}@example.com', role='admin')
+            rider = User.objects.create_user(f'bench-rider-{suffix}@example.com')
+            token = Token.objects.create(user=admin)
+            client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0],
+                            HTTP_AUTHORIZATION=f'Token {token.key}')
+            self._add_rides(rider, options['rides'], options['events'])
+
+            base = f'/api/ride/rides/?id_rider__email={rider.email}'
+            results = {}
+            for label, path in (('full', base), ('summary', f'{base}&events=summary')):
+                results[label] = result = self._measure(client, path, options['repeat'])
+                self.stdout.write(
+                    f'{label:<8} {options["rides"]:>6} rides  p50 {result["p50"] * 1000:8.1f} ms  '
+                    f'p99 {result["p99"] * 1000:8.1f} ms  {result["queries"]} queries  '
+                    f'body {result["bytes"] / 2 ** 10:8.1f} KiB'
+                )
+            self._check(results['full']['data'], results['summary']['data'])
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'events=summary: {results["full"]["p50"] / results["summary"]["p50"]:.1f}x faster '
+            f'at p50, summaries match the events of all {options["rides"]} rides.'
+        ))
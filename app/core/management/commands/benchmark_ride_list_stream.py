@@ -0,0 +1,96 @@
+"""
+Benchmark peak memory of the ride list in JSON mode against NDJSON streaming.
+
+Rides with events are inserted inside a transaction that is rolled back
+afterwards; the whole response is consumed for each mode while
+tracemalloc records the peak allocation.
+"""
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.models import Ride, RideEvent, User
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ride list peak memory for JSON against ?format=ndjson.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,5000,20000',
+                            help='Comma separated total ride counts to test.')
+
+    def _add_rides(self, rider, count):
+        now = timezone.now()
+        Ride.objects.bulk_create(
+            [
+                Ride(
+                    id_rider=rider,
+                    pickup_latitude=14.5,
+                    pickup_longitude=121.0,
+                    dropoff_latitude=14.6,
+                    dropoff_longitude=121.1,
+                    pickup_time=now,
+                )
+                for _index in range(count)
+            ],
+            batch_size=1000,
+        )
+        ride_ids = Ride.objects.filter(id_rider=rider, events__isnull=True).values_list('pk', flat=True)
+        RideEvent.objects.bulk_create(
+            [
+                RideEvent(id_ride_id=ride_id, description=description, created_at=now)
+                for ride_id in ride_ids
+                for description in ("Ride created with status 'en-route'",
+                                    "Status changed from 'en-route' to 'pickup'")
+            ],
+            batch_size=1000,
+        )
+
+    def _measure(self, client, path):
+        tracemalloc.start()
+        started = time.perf_counter()
+        response = client.get(path)
+        if response.status_code != 200:
+            raise CommandError(f'{response.status_code}: {response.getvalue()[:200]!r}')
+        size = 0
+        if response.streaming:
+            for chunk in response.streaming_content:
+                size += len(chunk)
+        else:
+            size = len(response.content)
+        elapsed = time.perf_counter() - started
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return elapsed, peak, size
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(value) for value in options['sizes'].split(','))
+
+        with transaction.atomic():
+            suffix = uuid.uuid4().hex[:8]
+            admin = User.objects.create_user(f'bench-admin-{suffix}@example.com', role='admin')
+            rider = User.objects.create_user(f'bench-rider-{suffix}@example.com')
+            token = Token.objects.create(user=admin)
+            client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0],
+                            HTTP_AUTHORIZATION=f'Token {token.key}')
+            base = f'/api/ride/rides/?id_rider__email={rider.email}'
+
+            created = 0
+            for size in sizes:
+                self._add_rides(rider, size - created)
+                created = size
+                for label, path in (('json', base), ('ndjson', f'{base}&format=ndjson')):
+                    elapsed, peak, body = self._measure(client, path)
+                    self.stdout.write(
+                        f'{size:>7} rides  {label:<7} {elapsed:7.2f}s  '
+                        f'peak {peak / 2 ** 20:8.1f} MiB  body {body / 2 ** 20:7.1f} MiB'
+                    )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,84 @@
+"""
+Benchmark the batched ride purge against Django's cascading delete().
+
+Creates a synthetic dataset owned by a throwaway rider, deletes part of
+it with QuerySet.delete() and the rest with core.purge, and reports
+throughput and peak Python memory for both.
+"""
+import time
+import tracemalloc
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Ride, RideEvent, User
+from core.purge import DEFAULT_BATCH_SIZE, iter_purge
+
+EVENTS_PER_RIDE = 3
+INSERT_CHUNK = 5000
+
+
+class Command(BaseCommand):
+    help = 'Benchmark batched ride purge against the ORM cascade delete.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', type=int, default=1_000_000,
+                            help='Rides purged with the batched purge.')
+        parser.add_argument('--compare-rides', type=int, default=50_000,
+                            help='Rides deleted with QuerySet.delete() for comparison.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def _populate(self, rider, count):
+        now = timezone.now()
+        for start in range(0, count, INSERT_CHUNK):
+            rides = Ride.objects.bulk_create([
+                Ride(
+                    id_rider=rider,
+                    pickup_latitude=14.5,
+                    pickup_longitude=121.0,
+                    dropoff_latitude=14.6,
+                    dropoff_longitude=121.1,
+                    pickup_time=now,
+                )
+                for _index in range(min(INSERT_CHUNK, count - start))
+            ])
+            RideEvent.objects.bulk_create([
+                RideEvent(id_ride=ride, description=f'Benchmark event {number}')
+                for ride in rides
+                for number in range(EVENTS_PER_RIDE)
+            ])
+
+    def _measure(self, label, count, run):
+        tracemalloc.start()
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f'{label:<10} {count:>9} rides  {elapsed:8.2f}s  {count / elapsed:10.0f} rides/s  '
+            f'peak memory {peak / 1024 / 1024:8.1f} MiB'
+        )
+
+    def handle(self, *args, **options):
+        rider = User.objects.create_user(f'bench-purge-{uuid.uuid4().hex[:8]}@example.com')
+        try:
+            if options['compare_rides']:
+                self._populate(rider, options['compare_rides'])
+                self._measure(
+                    'delete()', options['compare_rides'],
+                    lambda: Ride.objects.filter(id_rider=rider).delete(),
+                )
+
+            self._populate(rider, options['rides'])
+            self._measure(
+                'purge', options['rides'],
+                lambda: list(iter_purge(
+                    Ride.objects.filter(id_rider=rider), options['batch_size'], sleep=0,
+                )),
+            )
+        finally:
+            for _progress in iter_purge(Ride.objects.filter(id_rider=rider)):
+                pass
+            rider.delete()
@@ -0,0 +1,112 @@
+"""
+Benchmark ride write throughput as the number of SQLite shards grows.
+
+For every shard count a fresh set of SQLite shard databases is created
+in a temporary directory and several writer processes insert rides at
+random pickup points through Ride.save() (so the router and the event
+signal run as in the API). With one database all writers queue on the
+same write lock; with more shards they mostly write to different files.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+WRITER_SCRIPT = """
+import json, random, sys, time
+import django
+django.setup()
+from django.db import OperationalError
+from django.utils import timezone
+from core.models import Ride
+
+count, seed = int(sys.argv[1]), int(sys.argv[2])
+rng = random.Random(seed)
+retries = 0
+started = time.time()
+for _index in range(count):
+    latitude, longitude = rng.uniform(-60, 60), rng.uniform(-180, 180)
+    while True:
+        try:
+            Ride(
+                id_rider_id=1,
+                pickup_latitude=latitude,
+                pickup_longitude=longitude,
+                dropoff_latitude=latitude + 0.05,
+                dropoff_longitude=longitude + 0.05,
+                pickup_time=timezone.now(),
+            ).save()
+            break
+        except OperationalError:
+            retries += 1
+print(json.dumps({'started': started, 'finished': time.time(), 'retries': retries}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ride write throughput against the number of SQLite shards.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', default='1,2,4',
+                            help='Comma separated shard counts to test.')
+        parser.add_argument('--writers', type=int, default=4,
+                            help='Concurrent writer processes (like gunicorn workers).')
+        parser.add_argument('--rides', type=int, default=500, help='Rides per writer.')
+
+    def _env(self, shard_dir, shards):
+        return dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'app.settings'),
+            RIDE_SHARD_DIR=shard_dir,
+            RIDE_SHARD_COUNT=str(shards),
+        )
+
+    def _run_shard_count(self, shards, writers, rides):
+        with tempfile.TemporaryDirectory() as shard_dir:
+            env = self._env(shard_dir, shards)
+            for index in range(shards):
+                subprocess.run(
+                    [sys.executable, 'manage.py', 'migrate', '--database', f'ride_shard_{index}',
+                     '--verbosity', '0'],
+                    cwd=settings.BASE_DIR, env=env, check=True,
+                )
+
+            processes = [
+                subprocess.Popen(
+                    [sys.executable, '-c', WRITER_SCRIPT, str(rides), str(seed)],
+                    cwd=settings.BASE_DIR, env=env, stdout=subprocess.PIPE, text=True,
+                )
+                for seed in range(writers)
+            ]
+            results = []
+            for process in processes:
+                output, _errors = process.communicate()
+                if process.returncode:
+                    raise CommandError(f'Writer process failed with exit code {process.returncode}.')
+                results.append(json.loads(output))
+
+        # Measure the window in which writers were inserting, not interpreter startup.
+        elapsed = (max(result['finished'] for result in results)
+                   - min(result['started'] for result in results))
+
+        total = writers * rides
+        retries = sum(result['retries'] for result in results)
+        self.stdout.write(
+            f'{shards:>3} shards  {total:>7} rides  {elapsed:8.2f}s  '
+            f'{total / elapsed:9.1f} rides/s  {retries} lock retries'
+        )
+        return total / elapsed
+
+    def handle(self, *args, **options):
+        shard_counts = [int(value) for value in options['shards'].split(',')]
+        baseline = None
+        for shards in shard_counts:
+            throughput = self._run_shard_count(shards, options['writers'], options['rides'])
+            baseline = baseline or throughput
+            self.stdout.write(f'             scaling vs {shard_counts[0]} shard(s): '
+                              f'{throughput / baseline:.2f}x')
@@ -0,0 +1,98 @@
+"""
+Benchmark batch status transitions against individual PATCH requests.
+
+Runs against the real URLconf through the Django test client inside a
+transaction that is rolled back afterwards.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.models import Ride, User
+
+STATUSES = ['en-route', 'pickup', 'dropoff']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark batch ride transitions against individual PATCH calls.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', type=int, default=500, help='Rides per run.')
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Transitions per batch request.')
+
+    def _create_rides(self, rider, count):
+        rides = Ride.objects.bulk_create([
+            Ride(
+                id_rider=rider,
+                pickup_latitude=14.5,
+                pickup_longitude=121.0,
+                dropoff_latitude=14.6,
+                dropoff_longitude=121.1,
+                pickup_time=timezone.now(),
+            )
+            for _index in range(count)
+        ])
+        if rides and rides[0].pk is None:
+            rides = list(Ride.objects.filter(id_rider=rider).order_by('id_ride'))
+        return [ride.pk for ride in rides]
+
+    def _check(self, response):
+        if response.status_code != 200:
+            raise CommandError(f'{response.status_code}: {response.content[:200]!r}')
+
+    def _report(self, label, transitions, elapsed):
+        self.stdout.write(
+            f'{label:<8} {transitions:>7} transitions  {elapsed:8.2f}s  '
+            f'{transitions / elapsed:10.1f} transitions/s'
+        )
+        return transitions / elapsed
+
+    def handle(self, *args, **options):
+        count, batch_size = options['rides'], options['batch_size']
+        steps = list(zip(STATUSES, STATUSES[1:]))
+
+        with transaction.atomic():
+            suffix = uuid.uuid4().hex[:8]
+            admin = User.objects.create_user(f'bench-admin-{suffix}@example.com', role='admin')
+            rider = User.objects.create_user(f'bench-rider-{suffix}@example.com')
+            token = Token.objects.create(user=admin)
+            client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0],
+                            HTTP_AUTHORIZATION=f'Token {token.key}')
+
+            ride_ids = self._create_rides(rider, count)
+            started = time.perf_counter()
+            for from_status, to_status in steps:
+                for ride_id in ride_ids:
+                    response = client.patch(
+                        f'/api/ride/rides/{ride_id}/', {'status': to_status},
+                        content_type='application/json',
+                    )
+                    self._check(response)
+            single = self._report('patch', count * len(steps), time.perf_counter() - started)
+
+            Ride.objects.filter(id_rider=rider).delete()
+            ride_ids = self._create_rides(rider, count)
+            started = time.perf_counter()
+            for from_status, to_status in steps:
+                for start in range(0, count, batch_size):
+                    response = client.post(
+                        '/api/ride/rides/transitions/',
+                        [
+                            {'id_ride': ride_id, 'from_status': from_status, 'to_status': to_status}
+                            for ride_id in ride_ids[start:start + batch_size]
+                        ],
+                        content_type='application/json',
+                    )
+                    self._check(response)
+            batch = self._report('batch', count * len(steps), time.perf_counter() - started)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {batch / single:.1f}x'))
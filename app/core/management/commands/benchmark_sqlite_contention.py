@@ -0,0 +1,187 @@
+"""
+Benchmark concurrent writes to SQLite with and without production mode.
+
+For each mode a fresh SQLite database is migrated in a temporary
+directory, and several worker processes (like gunicorn workers) replay
+a write-heavy request mix against app.wsgi.application for a fixed
+time: ride status PATCHes, ride creation, batch transitions, ride
+detail reads and the occasional NDJSON export of every ride. Every
+request that fails with "database is locked" is counted.
+
+Without WAL, a long read (the export) keeps writers from committing,
+and writers that wait longer than the busy timeout fail.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SETUP_SCRIPT = """
+import json, sys
+import django
+django.setup()
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from core.models import Ride, User
+
+admin = User.objects.create_user('bench-admin@example.com', role='admin')
+rider = User.objects.create_user('bench-rider@example.com')
+Ride.objects.bulk_create([
+    Ride(id_rider=rider, pickup_latitude=14.5, pickup_longitude=121.0,
+         dropoff_latitude=14.6, dropoff_longitude=121.1, pickup_time=timezone.now())
+    for _index in range(int(sys.argv[1]))
+], batch_size=1000)
+print(json.dumps({
+    'token': Token.objects.create(user=admin).key,
+    'rider_id': rider.pk,
+    'ride_ids': list(Ride.objects.values_list('pk', flat=True)),
+}))
+"""
+
+WORKER_SCRIPT = """
+import json, logging, random, sys, time
+import django
+django.setup()
+from django.core.signals import got_request_exception
+from django.db import OperationalError
+from app.wsgi import application
+from core.loadtest import LoadTestContext, build_environ, call_application
+
+logging.disable(logging.CRITICAL)
+shapes, context, duration, seed = json.loads(sys.stdin.read())
+context = LoadTestContext(**context)
+stats = {shape['name']: {'requests': 0, 'locked': 0, 'errors': 0} for shape in shapes}
+failures = []
+
+def record_failure(sender, request=None, **kwargs):
+    failures.append(sys.exc_info()[1])
+
+got_request_exception.connect(record_failure)
+rng = random.Random(seed)
+weights = [shape['weight'] for shape in shapes]
+started = time.time()
+while time.time() - started < duration:
+    shape = rng.choices(shapes, weights)[0]
+    del failures[:]
+    status = call_application(application, build_environ(shape, context, rng))
+    entry = stats[shape['name']]
+    entry['requests'] += 1
+    if any(isinstance(error, OperationalError) and 'locked' in str(error) for error in failures):
+        entry['locked'] += 1
+    elif status >= 500:
+        entry['errors'] += 1
+print(json.dumps({'started': started, 'finished': time.time(), 'stats': stats}))
+"""
+
+
+def contention_shapes(rider_id):
+    return [
+        {'name': 'ride_patch_status', 'method': 'PATCH', 'path': '/api/ride/rides/{ride_id}/',
+         'body': '{"status": "{status}"}', 'auth': 'token', 'weight': 40},
+        {'name': 'ride_create', 'method': 'POST', 'path': '/api/ride/rides/',
+         'body': json.dumps({
+             'status': 'en-route', 'id_rider': rider_id,
+             'pickup_latitude': 14.5, 'pickup_longitude': 121.0,
+             'dropoff_latitude': 14.6, 'dropoff_longitude': 121.1,
+             'pickup_time': '2026-01-01T08:00:00Z',
+         }), 'auth': 'token', 'weight': 15},
+        {'name': 'ride_transitions', 'method': 'POST', 'path': '/api/ride/rides/transitions/',
+         'body': '[{"id_ride": {ride_id}, "from_status": "{status}", "to_status": "{status}"},'
+                 ' {"id_ride": {ride_id}, "from_status": "{status}", "to_status": "{status}"}]',
+         'auth': 'token', 'weight': 15},
+        {'name': 'ride_detail', 'method': 'GET', 'path': '/api/ride/rides/{ride_id}/',
+         'auth': 'token', 'weight': 20},
+        {'name': 'ride_export', 'method': 'GET', 'path': '/api/ride/rides/',
+         'query': 'format=ndjson', 'auth': 'token', 'weight': 1},
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark "database is locked" errors under concurrent writes, per SQLite mode.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Concurrent worker processes (like gunicorn workers).')
+        parser.add_argument('--seconds', type=float, default=30.0,
+                            help='Duration of each run.')
+        parser.add_argument('--rides', type=int, default=50000,
+                            help='Rides created before the run.')
+
+    def _python(self, script, env, args=(), stdin=None):
+        return subprocess.Popen(
+            [sys.executable, '-c', script, *args],
+            cwd=settings.BASE_DIR, env=env, text=True,
+            stdin=subprocess.PIPE if stdin is not None else None, stdout=subprocess.PIPE,
+        )
+
+    def _run_mode(self, production, options):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ,
+                DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'app.settings'),
+                SQLITE_PATH=os.path.join(directory, 'db.sqlite3'),
+                SQLITE_PRODUCTION=str(production),
+                RIDE_SHARD_COUNT='0',
+                METRICS_DIR=os.path.join(directory, 'metrics'),
+            )
+            subprocess.run([sys.executable, 'manage.py', 'migrate', '--verbosity', '0'],
+                           cwd=settings.BASE_DIR, env=env, check=True)
+            setup = self._python(SETUP_SCRIPT, env, [str(options['rides'])])
+            output, _errors = setup.communicate()
+            if setup.returncode:
+                raise CommandError('Setup failed.')
+            data = json.loads(output)
+
+            context = {'ride_ids': data['ride_ids'], 'rider_emails': [],
+                       'token': data['token'], 'host': settings.ALLOWED_HOSTS[0]}
+            shapes = contention_shapes(data['rider_id'])
+            workers = []
+            for seed in range(options['workers']):
+                worker = self._python(WORKER_SCRIPT, env, stdin=True)
+                worker.stdin.write(json.dumps([shapes, context, options['seconds'], seed]))
+                worker.stdin.close()
+                workers.append(worker)
+            results = []
+            for worker in workers:
+                output = worker.stdout.read()
+                worker.wait()
+                if worker.returncode:
+                    raise CommandError(f'Worker failed with exit code {worker.returncode}.')
+                results.append(json.loads(output))
+
+        elapsed = (max(result['finished'] for result in results)
+                   - min(result['started'] for result in results))
+        totals = {}
+        for result in results:
+            for name, entry in result['stats'].items():
+                total = totals.setdefault(name, {'requests': 0, 'locked': 0, 'errors': 0})
+                for key, value in entry.items():
+                    total[key] += value
+        return elapsed, totals
+
+    def handle(self, *args, **options):
+        rates = {}
+        for production in (False, True):
+            label = 'production' if production else 'default'
+            elapsed, totals = self._run_mode(production, options)
+            requests = sum(entry['requests'] for entry in totals.values())
+            locked = sum(entry['locked'] for entry in totals.values())
+            errors = sum(entry['errors'] for entry in totals.values())
+            rates[label] = locked / requests
+            self.stdout.write(
+                f'{label:<11} {requests:>7} requests  {requests / elapsed:8.1f} req/s  '
+                f'{locked:>5} locked ({locked / requests:.2%})  {errors} other 5xx'
+            )
+            for name, entry in totals.items():
+                self.stdout.write(
+                    f'    {name:<20} {entry["requests"]:>7}  {entry["locked"]:>5} locked'
+                )
+        style = self.style.SUCCESS if rates['production'] == 0 else self.style.WARNING
+        self.stdout.write(style(
+            f'Lock error rate: {rates["default"]:.2%} default, '
+            f'{rates["production"]:.2%} production mode.'
+        ))
@@ -0,0 +1,109 @@
+"""
+Measure worker import time and cold start (time to the first request).
+
+Each run starts a fresh interpreter, like a new gunicorn worker, so the
+numbers can be tracked across releases.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+COLD_START_SCRIPT = """
+import json, time
+started = time.perf_counter()
+from app.wsgi import application
+loaded = time.perf_counter()
+from django.conf import settings
+from django.test import Client
+client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+client.get({path!r})
+first = time.perf_counter()
+client.get({path!r})
+second = time.perf_counter()
+print(json.dumps({{
+    'import_s': loaded - started,
+    'first_request_s': first - loaded,
+    'second_request_s': second - first,
+}}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Benchmark worker import time (python -X importtime) and time to first request.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to start.')
+        parser.add_argument('--path', default='/api/schema', help='URL requested after startup.')
+        parser.add_argument('--top', type=int, default=15, help='Slowest imports to list.')
+        parser.add_argument('--json', action='store_true', help='Print a single JSON summary.')
+
+    def _run(self, args):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'app.settings'))
+        return subprocess.run(
+            [sys.executable, *args], cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True, check=True,
+        )
+
+    def _import_times(self):
+        """
+        Return (total_us, packages) for importing the WSGI app.
+
+        packages maps each root package to its largest cumulative import
+        time, so nested imports are not counted twice.
+        """
+        result = self._run(['-X', 'importtime', '-c', 'from app.wsgi import application'])
+        total_us, packages = 0, {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _self_us, cumulative, module = line[len('import time:'):].split('|')
+            cumulative = int(cumulative)
+            if not module.startswith('  '):
+                total_us += cumulative
+            root = module.strip().split('.')[0]
+            packages[root] = max(packages.get(root, 0), cumulative)
+        return total_us, packages
+
+    def handle(self, *args, **options):
+        total_import_us, packages = self._import_times()
+
+        samples = [
+            json.loads(self._run(['-c', COLD_START_SCRIPT.format(path=options['path'])]).stdout)
+            for _run in range(options['runs'])
+        ]
+        summary = {
+            'importtime_total_ms': total_import_us / 1000,
+            'slowest_imports': [
+                {'module': module, 'cumulative_ms': cumulative / 1000}
+                for module, cumulative in sorted(
+                    packages.items(), key=lambda item: item[1], reverse=True
+                )[:options['top']]
+            ],
+        }
+        for key in ('import_s', 'first_request_s', 'second_request_s'):
+            values = [sample[key] * 1000 for sample in samples]
+            summary[key[:-len('_s')] + '_ms'] = {
+                'median': statistics.median(values),
+                'min': min(values),
+                'max': max(values),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+
+        self.stdout.write(f"python -X importtime total: {summary['importtime_total_ms']:.1f} ms")
+        for item in summary['slowest_imports']:
+            self.stdout.write(f"  {item['cumulative_ms']:9.1f} ms  {item['module']}")
+        for key in ('import_ms', 'first_request_ms', 'second_request_ms'):
+            stats = summary[key]
+            self.stdout.write(
+                f"{key:<18} median {stats['median']:8.1f} ms  "
+                f"min {stats['min']:8.1f} ms  max {stats['max']:8.1f} ms"
+            )
@@ -0,0 +1,66 @@
+"""
+Check the stored event summary of every ride against its events.
+
+Rides are scanned in id order in batches, on every database holding
+rides. Mismatched rides are reported; with --repair their summary is
+recomputed from the events. The command exits with an error when
+mismatches are left unrepaired, so it can run as a periodic check.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.event_summary import check_summaries
+from core.models import Ride
+from core.sharding import ride_databases
+
+
+class Command(BaseCommand):
+    help = 'Check (and with --repair, fix) the denormalized ride event summaries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true',
+                            help='Rewrite mismatched summaries from the events.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--show', type=int, default=10,
+                            help='Print the differing fields of up to N rides.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        checked = mismatched = shown = 0
+        for using in ride_databases():
+            last_id = 0
+            while True:
+                ride_ids = list(
+                    Ride.objects.using(using).filter(id_ride__gt=last_id)
+                    .order_by('id_ride').values_list('id_ride', flat=True)[:options['batch_size']]
+                )
+                if not ride_ids:
+                    break
+                last_id = ride_ids[-1]
+                mismatches = check_summaries(
+                    Ride.objects.using(using).filter(id_ride__in=ride_ids),
+                    repair=options['repair'],
+                )
+                checked += len(ride_ids)
+                mismatched += len(mismatches)
+                for id_ride, fields in mismatches.items():
+                    if shown >= options['show']:
+                        break
+                    shown += 1
+                    differences = ', '.join(
+                        f'{field} {stored!r} != {expected!r}'
+                        for field, (stored, expected) in fields.items()
+                    )
+                    self.stdout.write(f'{using} ride {id_ride}: {differences}')
+
+        elapsed = time.perf_counter() - started
+        if mismatched and not options['repair']:
+            raise CommandError(
+                f'{mismatched} of {checked} rides have a stale event summary '
+                f'(checked in {elapsed:.1f}s); run with --repair to fix them.'
+            )
+        action = 'repaired' if options['repair'] else 'found'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} rides in {elapsed:.1f}s, {mismatched} mismatched {action}.'
+        ))
@@ -0,0 +1,192 @@
+"""
+Replay a weighted request mix against the WSGI app with a concurrency ramp.
+"""
+import json
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rest_framework.authtoken.models import Token
+
+from core.loadtest import (
+    DEFAULT_SHAPES,
+    LatencyHistogram,
+    LoadTestContext,
+    load_shapes,
+    run_worker,
+)
+from core.models import Ride, User
+from core.sharding import ride_databases
+
+SAMPLE_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Replay a weighted request mix against app.wsgi.application and report latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shapes',
+                            help='JSON list of shapes or JSONL recorded by the recorder middleware.')
+        parser.add_argument('--ramp', default='1,2,4,8',
+                            help='Comma separated worker process counts, one stage each.')
+        parser.add_argument('--stage-seconds', type=float, default=10.0)
+        parser.add_argument('--admin-email',
+                            help='Admin user whose token/session is used (default: first admin).')
+        parser.add_argument('--login-email', help='Credentials for token login requests.')
+        parser.add_argument('--login-password')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--throttle', action='store_true',
+                            help='Keep the API throttles on; all requests share one token and '
+                                 'client IP, so they are throttled as one client.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def _context(self, options):
+        admins = User.objects.filter(role='admin', is_active=True)
+        if options['admin_email']:
+            admins = admins.filter(email=options['admin_email'])
+        admin = admins.order_by('id_user').first()
+        if admin is None:
+            raise CommandError('No active admin user found; create one or pass --admin-email.')
+
+        token, _created = Token.objects.get_or_create(user=admin)
+        session = SessionStore()
+        session[SESSION_KEY] = str(admin.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = admin.get_session_auth_hash()
+        session.create()
+
+        ride_ids = []
+        for alias in ride_databases():
+            ride_ids += list(
+                Ride.objects.using(alias).order_by('?').values_list('id_ride', flat=True)[:SAMPLE_SIZE]
+            )
+        rider_emails = list(
+            User.objects.filter(role='rider').order_by('?').values_list('email', flat=True)[:SAMPLE_SIZE]
+        )
+        host = next((host for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        return LoadTestContext(
+            ride_ids=ride_ids,
+            rider_emails=rider_emails,
+            login_email=options['login_email'],
+            login_password=options['login_password'],
+            token=token.key,
+            session_cookie=f'{settings.SESSION_COOKIE_NAME}={session.session_key}',
+            host=host.lstrip('.'),
+        ), session
+
+    def _run_stage(self, shapes, context, workers, duration, seed, throttle):
+        # Worker processes open their own database connections.
+        connections.close_all()
+        mp = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods()
+                                         else 'spawn')
+        results = mp.Queue()
+        processes = [
+            mp.Process(target=run_worker,
+                       args=(shapes, context.as_dict(), duration, seed + index, results, throttle))
+            for index in range(workers)
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        reports = [results.get(timeout=duration + 120) for _process in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        stage = {'workers': workers, 'elapsed_s': elapsed, 'shapes': {}}
+        total = LatencyHistogram()
+        errors = client_errors = build_errors = 0
+        for shape in shapes:
+            histogram = LatencyHistogram()
+            shape_errors = shape_client_errors = shape_build_errors = 0
+            for report in reports:
+                entry = report[shape['name']]
+                histogram.merge(LatencyHistogram(entry['histogram']))
+                shape_errors += entry['errors']
+                shape_client_errors += entry['client_errors']
+                shape_build_errors += entry['build_errors']
+            total.merge(histogram)
+            errors += shape_errors
+            client_errors += shape_client_errors
+            build_errors += shape_build_errors
+            stage['shapes'][shape['name']] = self._summary(histogram, shape_errors,
+                                                           shape_client_errors, duration)
+            stage['shapes'][shape['name']]['build_errors'] = shape_build_errors
+        stage.update(self._summary(total, errors, client_errors, duration))
+        # Requests that could not be built from their shape (unknown placeholder).
+        stage['build_errors'] = build_errors
+        stage['histogram'] = total.rows()
+        return stage
+
+    def _summary(self, histogram, errors, client_errors, duration):
+        count = histogram.count
+        return {
+            'requests': count,
+            'throughput_rps': count / duration,
+            'p50_ms': histogram.percentile(50),
+            'p90_ms': histogram.percentile(90),
+            'p99_ms': histogram.percentile(99),
+            'error_rate': errors / count if count else 0.0,
+            'client_error_rate': client_errors / count if count else 0.0,
+        }
+
+    def _print_stage(self, stage):
+        self.stdout.write(
+            f"\n{stage['workers']} workers: {stage['requests']} requests, "
+            f"{stage['throughput_rps']:.1f} req/s, p50 {stage['p50_ms'] or 0:.1f} ms, "
+            f"p90 {stage['p90_ms'] or 0:.1f} ms, p99 {stage['p99_ms'] or 0:.1f} ms, "
+            f"5xx {stage['error_rate']:.2%}, 4xx {stage['client_error_rate']:.2%}"
+        )
+        if stage['build_errors']:
+            self.stdout.write(self.style.WARNING(
+                f"  {stage['build_errors']} requests skipped: their shape could not be "
+                f"filled in (unknown placeholder)."
+            ))
+        for name, summary in stage['shapes'].items():
+            self.stdout.write(
+                f"  {name:<32} {summary['requests']:>7}  {summary['throughput_rps']:8.1f} req/s  "
+                f"p50 {summary['p50_ms'] or 0:8.1f}  p99 {summary['p99_ms'] or 0:8.1f} ms  "
+                f"5xx {summary['error_rate']:.2%}  4xx {summary['client_error_rate']:.2%}"
+            )
+        self.stdout.write('  latency histogram:')
+        for lower, upper, count in stage['histogram']:
+            if count:
+                self.stdout.write(f'    {lower:>6}-{upper:<6} ms {count:>8}')
+
+    def handle(self, *args, **options):
+        shapes = load_shapes(options['shapes']) if options['shapes'] else DEFAULT_SHAPES
+        if not (options['login_email'] and options['login_password']):
+            shapes = [shape for shape in shapes if 'login_password' not in (shape.get('body') or '')]
+        if not shapes:
+            raise CommandError('No request shapes to replay.')
+
+        context, session = self._context(options)
+        stages = []
+        try:
+            for workers in [int(value) for value in options['ramp'].split(',')]:
+                stage = self._run_stage(shapes, context, workers, options['stage_seconds'],
+                                        options['seed'] * 1000, options['throttle'])
+                stages.append(stage)
+                if not options['json']:
+                    self._print_stage(stage)
+        finally:
+            session.delete()
+
+        best = max(stages, key=lambda stage: stage['throughput_rps'])
+        saturation = next(
+            (stage['workers'] for stage in stages
+             if stage['throughput_rps'] >= 0.95 * best['throughput_rps']),
+            best['workers'],
+        )
+        if options['json']:
+            self.stdout.write(json.dumps({'stages': stages, 'saturation_workers': saturation},
+                                         indent=2, default=str))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"\nPeak {best['throughput_rps']:.1f} req/s; throughput saturates at "
+            f"about {saturation} worker(s)."
+        ))
@@ -0,0 +1,104 @@
+"""
+Purge old rides and their events in bounded batches.
+"""
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+
+from core.models import Ride
+from core.purge import DEFAULT_BATCH_SIZE, iter_purge
+from core.sharding import ride_databases
+from core.utils import Checkpoint
+
+
+class Command(BaseCommand):
+    help = 'Delete rides (and their events) with pickup_time before a cutoff, in batches.'
+
+    def add_arguments(self, parser):
+        cutoff = parser.add_mutually_exclusive_group()
+        cutoff.add_argument('--older-than-days', type=int,
+                            help='Purge rides picked up more than N days ago.')
+        cutoff.add_argument('--before', help='Purge rides picked up before this date/datetime.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Rides deleted per transaction.')
+        parser.add_argument('--sleep', type=float, default=0.1,
+                            help='Seconds to pause between batches.')
+        parser.add_argument('--checkpoint',
+                            help='JSON file to record progress in. Pass it alone to resume '
+                                 'an interrupted purge with the same cutoff.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the rides that would be purged.')
+
+    def _cutoff(self, options, checkpoint):
+        if options['older_than_days'] is not None:
+            return timezone.now() - datetime.timedelta(days=options['older_than_days'])
+        if options['before']:
+            value = parse_datetime(options['before'])
+            if value is None:
+                date = parse_date(options['before'])
+                if date is None:
+                    raise CommandError(f"Invalid --before value '{options['before']}'.")
+                value = datetime.datetime.combine(date, datetime.time.min)
+            if timezone.is_naive(value):
+                value = timezone.make_aware(value)
+            return value
+        if checkpoint.get('cutoff'):
+            return parse_datetime(checkpoint.get('cutoff'))
+        raise CommandError('Give --older-than-days or --before (or a --checkpoint to resume).')
+
+    def handle(self, *args, **options):
+        checkpoint = Checkpoint(options['checkpoint'])
+        cutoff = self._cutoff(options, checkpoint)
+        if checkpoint.get('cutoff') and parse_datetime(checkpoint.get('cutoff')) != cutoff:
+            # A new cutoff starts a new purge; ids from the old run do not apply.
+            checkpoint.state = {}
+
+        # Databases are visited in ascending id range order, so one
+        # last_id cursor covers every ride shard.
+        querysets = [
+            Ride.objects.using(alias).filter(pickup_time__lt=cutoff) for alias in ride_databases()
+        ]
+        start_after = checkpoint.get('last_id', 0)
+        remaining = sum(
+            queryset.filter(id_ride__gt=start_after).count() for queryset in querysets
+        )
+        self.stdout.write(
+            f'{remaining} rides picked up before {cutoff.isoformat()} to purge'
+            + (f' (resuming after id {start_after})' if start_after else '')
+        )
+        if options['dry_run'] or not remaining:
+            return
+
+        rides_total = checkpoint.get('rides', 0)
+        events_total = checkpoint.get('events', 0)
+        purged = 0
+        started = time.perf_counter()
+        batches = (
+            progress
+            for queryset in querysets
+            for progress in iter_purge(
+                queryset, options['batch_size'], options['sleep'], start_after
+            )
+        )
+        for progress in batches:
+            purged += progress['rides']
+            rides_total += progress['rides']
+            events_total += progress['events']
+            checkpoint.save(
+                cutoff=cutoff.isoformat(),
+                last_id=progress['last_id'],
+                rides=rides_total,
+                events=events_total,
+            )
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"last id {progress['last_id']}: {rides_total} rides, {events_total} events "
+                f"deleted ({purged / elapsed:.0f} rides/s)"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {rides_total} rides and {events_total} events.'
+        ))
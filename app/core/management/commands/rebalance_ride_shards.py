@@ -0,0 +1,207 @@
+"""
+Move rides (and their events) to the shard that owns their pickup point.
+
+Run it after enabling sharding (to move rides out of the default
+database) or after changing RIDE_SHARDS / RIDE_SHARD_CELL_DEGREES.
+
+Moved rides and their events get new ids from the target shard's id
+range (a ride's id names its shard), which breaks references held by
+clients. The command therefore refuses to run without --renumber, and
+--id-map records every old and new ride id. Change feed consumers (see
+core.feed) do not lose events: the copies are new events at the end of
+the target database, served again with their new ids.
+
+The id map is also the journal of the move. Each batch is copied in a
+target transaction, its old and new ids are written (and fsynced) to
+the id map before that transaction commits, and only then is the batch
+deleted from the source. After a crash, re-running the command with the
+same --id-map first deletes the source rides whose copy committed (the
+ride under the new id matches the old one), so no ride is lost or left
+twice; batches whose copy did not commit are copied again.
+"""
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.event_summary import check_summaries
+from core.models import Ride, RideEvent
+from core.purge import delete_rides
+from core.sharding import (
+    check_ride_id_ranges,
+    ride_databases,
+    shard_for_point,
+    sharding_enabled,
+)
+from core.sqlite import write_transaction
+
+RIDE_COPY_FIELDS = [
+    'id_ride',
+    'status',
+    'id_rider_id',
+    'id_driver_id',
+    'pickup_latitude',
+    'pickup_longitude',
+    'dropoff_latitude',
+    'dropoff_longitude',
+    'pickup_time',
+]
+# Fields that identify a ride's copy when resuming from the id map.
+MATCH_FIELDS = ('id_rider_id', 'pickup_latitude', 'pickup_longitude', 'pickup_time')
+RESUME_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Move rides and their events to the shard owning their pickup point.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the rides that would move.')
+        parser.add_argument('--renumber', action='store_true',
+                            help='Confirm that moved rides and events may get new ids.')
+        parser.add_argument('--id-map',
+                            help='JSONL journal to append {source, target, old_id, new_id} '
+                                 'to for every moved ride; required unless --dry-run.')
+
+    def _resume(self, path):
+        """
+        Finish the moves of an interrupted run: delete the source rides of
+        the id map whose copy exists in the target. Returns their number.
+        """
+        moves = {}
+        try:
+            with open(path) as id_map:
+                for line in id_map:
+                    if line.strip():
+                        entry = json.loads(line)
+                        moves.setdefault((entry['source'], entry['target']), {})[
+                            entry['old_id']] = entry['new_id']
+        except FileNotFoundError:
+            return 0
+
+        finished = 0
+        for (source, target), new_ids in moves.items():
+            old_ids = list(new_ids)
+            for start in range(0, len(old_ids), RESUME_BATCH_SIZE):
+                batch = old_ids[start:start + RESUME_BATCH_SIZE]
+                left = {
+                    ride['id_ride']: ride for ride in
+                    Ride.objects.using(source).filter(id_ride__in=batch)
+                    .values('id_ride', *MATCH_FIELDS)
+                }
+                if not left:
+                    continue
+                copies = {
+                    ride['id_ride']: ride for ride in
+                    Ride.objects.using(target)
+                    .filter(id_ride__in=[new_ids[old_id] for old_id in left])
+                    .values('id_ride', *MATCH_FIELDS)
+                }
+                # A copy that did not commit leaves its id free for another
+                # ride: only a matching ride proves the copy.
+                copied = [
+                    old_id for old_id, ride in left.items()
+                    if (copy := copies.get(new_ids[old_id])) is not None
+                    and all(copy[field] == ride[field] for field in MATCH_FIELDS)
+                ]
+                if copied:
+                    delete_rides(copied, using=source)
+                    finished += len(copied)
+        return finished
+
+    def _move(self, source, target, rides, id_map):
+        """
+        Copy rides and their events to target, journal the new ids, then
+        delete the rides from source. Returns {old id: new id}.
+        """
+        old_ids = [ride['id_ride'] for ride in rides]
+        with write_transaction(using=target):
+            created = Ride.objects.using(target).bulk_create([
+                Ride(**{field: ride[field] for field in RIDE_COPY_FIELDS if field != 'id_ride'})
+                for ride in rides
+            ])
+            new_ids = dict(zip(old_ids, (ride.pk for ride in created)))
+            if None in new_ids.values():
+                raise CommandError(f'Database {target} does not return ids from bulk inserts.')
+            RideEvent.objects.using(target).bulk_create([
+                RideEvent(
+                    id_ride_id=new_ids[event['id_ride_id']],
+                    description=event['description'],
+                    created_at=event['created_at'],
+                )
+                for event in RideEvent.objects.using(source)
+                .filter(id_ride__in=old_ids)
+                .order_by('id_ride_event')
+                .values('id_ride_id', 'description', 'created_at')
+            ])
+            # The copied events have new ids.
+            check_summaries(Ride.objects.using(target).filter(pk__in=new_ids.values()),
+                            repair=True)
+            # Journaled before the copy commits (see the module docstring).
+            for old_id, new_id in new_ids.items():
+                id_map.write(json.dumps({'source': source, 'target': target,
+                                         'old_id': old_id, 'new_id': new_id}) + '\n')
+            id_map.flush()
+            os.fsync(id_map.fileno())
+        delete_rides(old_ids, using=source)
+        return new_ids
+
+    def handle(self, *args, **options):
+        if not sharding_enabled():
+            raise CommandError('Ride sharding is not enabled (RIDE_SHARDS is empty).')
+        if not options['dry_run'] and not (options['renumber'] and options['id_map']):
+            raise CommandError(
+                'Moved rides and events get new ids. Pass --renumber and --id-map (the '
+                'journal recording the new ride ids) once clients holding ride ids are '
+                'prepared.'
+            )
+        errors = check_ride_id_ranges(databases=ride_databases())
+        if errors:
+            raise CommandError('\n'.join(error.msg for error in errors))
+
+        if options['dry_run']:
+            self._rebalance(options, None)
+            return
+        finished = self._resume(options['id_map'])
+        if finished:
+            self.stdout.write(f'Finished {finished} moves of an interrupted run.')
+        with open(options['id_map'], 'a') as id_map:
+            self._rebalance(options, id_map)
+
+    def _rebalance(self, options, id_map):
+        started = time.perf_counter()
+        moved_total = 0
+        for source in ride_databases():
+            moved = scanned = last_id = 0
+            while True:
+                rides = list(
+                    Ride.objects.using(source)
+                    .filter(id_ride__gt=last_id)
+                    .order_by('id_ride')
+                    .values(*RIDE_COPY_FIELDS)[:options['batch_size']]
+                )
+                if not rides:
+                    break
+                last_id = rides[-1]['id_ride']
+                scanned += len(rides)
+
+                by_target = {}
+                for ride in rides:
+                    target = shard_for_point(ride['pickup_latitude'], ride['pickup_longitude'])
+                    if target != source:
+                        by_target.setdefault(target, []).append(ride)
+                for target, target_rides in by_target.items():
+                    if not options['dry_run']:
+                        self._move(source, target, target_rides, id_map)
+                    moved += len(target_rides)
+
+            moved_total += moved
+            self.stdout.write(f'{source}: scanned {scanned} rides, '
+                              f'{"would move" if options["dry_run"] else "moved"} {moved}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{moved_total} rides {"to move" if options["dry_run"] else "moved"} '
+            f'in {time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,22 @@
+"""
+Recount the pickup/dropoff heatmap from every ride database.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.heatmap import REBUILD_CHUNK_SIZE, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed heatmap cells from all rides.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=REBUILD_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        cells = rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {cells} heatmap cells in {time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,51 @@
+"""
+Checkpoint the WAL and run PRAGMA optimize on the SQLite databases.
+
+Meant to run periodically in SQLite production mode (see core.sqlite),
+either from cron or as a long-running process with --interval.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.sqlite import CHECKPOINT_MODES, maintain, sqlite_databases
+
+
+class Command(BaseCommand):
+    help = 'Checkpoint the WAL and run PRAGMA optimize on SQLite databases.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='databases',
+                            help='Database alias; repeat for several. Defaults to every '
+                                 'SQLite database.')
+        parser.add_argument('--mode', choices=CHECKPOINT_MODES, default='TRUNCATE',
+                            help='wal_checkpoint mode. TRUNCATE waits for writers and '
+                                 'empties the WAL file.')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Repeat every N seconds until interrupted.')
+
+    def _run(self, databases, mode):
+        for alias in databases:
+            result = maintain(alias, mode)
+            if result['log_frames'] < 0:
+                state = 'not in WAL mode, optimized'
+            else:
+                state = (f"{result['checkpointed_frames']}/{result['log_frames']} frames "
+                         f"checkpointed")
+                if result['busy']:
+                    state += ' (busy, retried next run)'
+            self.stdout.write(f'{alias}: {state}')
+
+    def handle(self, *args, **options):
+        databases = options['databases'] or sqlite_databases()
+        for alias in databases:
+            if alias not in connections or connections[alias].vendor != 'sqlite':
+                raise CommandError(f'{alias!r} is not a SQLite database.')
+
+        while True:
+            self._run(databases, options['mode'])
+            if not options['interval']:
+                return
+            connections.close_all()
+            time.sleep(options['interval'])
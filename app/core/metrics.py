@@ -0,0 +1,240 @@
+"""
+Process-shared metrics exposed in the Prometheus text format.
+
+Every process (gunicorn worker, management command) adds to its own
+memory-mapped file in settings.METRICS_DIR, so recording a value is a
+dict lookup and an in-place float update with no locks shared between
+processes. The /metrics view reads and sums the files of every process,
+including exited ones, so counters never go backwards.
+
+Histograms store one counter per bucket (not cumulative) plus _sum and
+_count; buckets are made cumulative when exported. With METRICS_DIR
+empty every recording function is a no-op.
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+# name: (type, help text, histogram buckets)
+METRICS = {
+    'http_request_duration_seconds': (
+        'histogram', 'Request latency per view, method and status class.', LATENCY_BUCKETS),
+    'http_request_db_queries_total': (
+        'counter', 'Database queries run while handling requests, per view.', None),
+    'http_requests_throttled_total': (
+        'counter', 'Requests rejected by a throttle, per throttle scope.', None),
+    'http_requests_shed_total': (
+        'counter', 'Expensive requests shed by core.loadshed, per class and status.', None),
+    'ride_events_created_total': (
+        'counter', 'RideEvent rows created, per source.', None),
+    'report_duration_seconds': (
+        'histogram', 'Duration of reports and exports.', DURATION_BUCKETS),
+}
+
+INITIAL_SIZE = 1 << 16
+HEADER = struct.Struct('i')
+VALUE = struct.Struct('d')
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+class MmapedValues:
+    """
+    Append-only file of (key, float) slots shared through mmap.
+
+    Layout: a 4-byte used size, then entries of a 4-byte key length, the
+    UTF-8 key padded to 8 bytes and an 8-byte float. Only the owning
+    process writes; readers may see a value mid-update at worst.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(INITIAL_SIZE)
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._positions = {}
+        for key, position, _value in self._entries(self._map):
+            self._positions[key] = position
+        self._used = HEADER.unpack_from(self._map, 0)[0] or 8
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entries(data):
+        used = HEADER.unpack_from(data, 0)[0] or 8
+        position = 8
+        while position < used:
+            length = HEADER.unpack_from(data, position)[0]
+            position += HEADER.size
+            key = bytes(data[position:position + length]).decode()
+            position += length + (-(HEADER.size + length) % 8)
+            yield key, position, VALUE.unpack_from(data, position)[0]
+            position += VALUE.size
+
+    @classmethod
+    def read(cls, path):
+        """(key, value) pairs stored in a file."""
+        with open(path, 'rb') as values_file:
+            data = values_file.read()
+        if len(data) < 8:
+            return []
+        return [(key, value) for key, _position, value in cls._entries(data)]
+
+    def _add_key(self, key):
+        encoded = key.encode()
+        padding = -(HEADER.size + len(encoded)) % 8
+        entry = HEADER.pack(len(encoded)) + encoded + b' ' * padding + VALUE.pack(0.0)
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._map.close()
+            self._file.truncate(self._capacity)
+            self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._map[self._used:self._used + len(entry)] = entry
+        position = self._used + len(entry) - VALUE.size
+        self._used += len(entry)
+        HEADER.pack_into(self._map, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def add(self, key, amount):
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None:
+                position = self._add_key(key)
+            VALUE.pack_into(self._map, position, VALUE.unpack_from(self._map, position)[0] + amount)
+
+
+_store = None
+_store_pid = None
+_keys = {}
+
+
+def _values():
+    """This process's store, reopened after a fork."""
+    global _store, _store_pid
+    pid = os.getpid()
+    if _store_pid != pid:
+        directory = metrics_dir()
+        os.makedirs(directory, exist_ok=True)
+        _store = MmapedValues(os.path.join(directory, f'metrics-{pid}.db'))
+        _store_pid = pid
+    return _store
+
+
+def _key(name, labels):
+    key = _keys.get((name, labels))
+    if key is None:
+        key = _keys[(name, labels)] = json.dumps([name, labels])
+    return key
+
+
+def inc(name, amount=1, **labels):
+    """Add to a counter."""
+    if not metrics_dir():
+        return
+    _values().add(_key(name, tuple(sorted(labels.items()))), amount)
+
+
+def observe(name, value, **labels):
+    """Record one observation in a histogram declared in METRICS."""
+    if not metrics_dir():
+        return
+    store = _values()
+    labels = tuple(sorted(labels.items()))
+    bucket = next((bound for bound in METRICS[name][2] if value <= bound), math.inf)
+    store.add(_key(f'{name}_bucket', labels + (('le', bucket),)), 1)
+    store.add(_key(f'{name}_sum', labels), value)
+    store.add(_key(f'{name}_count', labels), 1)
+
+
+@contextmanager
+def timed(name, **labels):
+    """Observe the duration of a with block in a histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def collect():
+    """Sum every process's values into {(name, labels): value}."""
+    totals = {}
+    directory = metrics_dir()
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return totals
+    for filename in names:
+        if not (filename.startswith('metrics-') and filename.endswith('.db')):
+            continue
+        try:
+            entries = MmapedValues.read(os.path.join(directory, filename))
+        except FileNotFoundError:
+            continue
+        for key, value in entries:
+            name, labels = json.loads(key)
+            labels = tuple(tuple(label) for label in labels)
+            totals[(name, labels)] = totals.get((name, labels), 0.0) + value
+    return totals
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == math.inf else repr(bound)
+
+
+def render_prometheus(totals=None):
+    """Prometheus text exposition (version 0.0.4) of the collected values."""
+    totals = collect() if totals is None else totals
+    lines = []
+    for metric, (kind, description, bounds) in METRICS.items():
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} {kind}')
+        if kind == 'counter':
+            for (name, labels), value in sorted(totals.items()):
+                if name == metric:
+                    lines.append(f'{metric}{_format_labels(labels)} {value!r}')
+            continue
+
+        series = {}
+        for (name, labels), value in totals.items():
+            if name == f'{metric}_bucket':
+                bound = float(dict(labels)['le'])
+                rest = tuple(label for label in labels if label[0] != 'le')
+                series.setdefault(rest, {}).setdefault('buckets', {})[bound] = value
+            elif name in (f'{metric}_sum', f'{metric}_count'):
+                series.setdefault(labels, {})[name.rsplit('_', 1)[1]] = value
+        for labels, values in sorted(series.items()):
+            buckets = dict.fromkeys(bounds + (math.inf,), 0.0)
+            buckets.update(values.get('buckets', {}))
+            cumulative = 0.0
+            for bound in sorted(buckets):
+                cumulative += buckets[bound]
+                bucket_labels = labels + (('le', _format_bound(bound)),)
+                lines.append(f'{metric}_bucket{_format_labels(bucket_labels)} {cumulative!r}')
+            lines.append(f'{metric}_sum{_format_labels(labels)} {values.get("sum", 0.0)!r}')
+            lines.append(f'{metric}_count{_format_labels(labels)} {values.get("count", 0.0)!r}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,255 @@
+"""
+Middleware for the core app.
+"""
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+from urllib.parse import parse_qsl, quote
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, RequestDataTooBig
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from core import loadshed, metrics
+from core.profiling import profile_dir, profiling_requested, run_profiled
+from ride.permissions import IsAdminRole
+
+NUMERIC_SEGMENT = re.compile(r'/\d+(?=/|$)')
+SECRET_FIELDS = {'password': '{login_password}', 'email': '{login_email}'}
+# Parameters replayed with values from LoadTestContext (see core.loadtest).
+VALUE_PLACEHOLDERS = {'status': '{status}', 'id_rider__email': '{rider_email}'}
+# Parameters whose values come from a fixed vocabulary, recorded as sent.
+PLAIN_PARAMETERS = {'ordering', 'events', 'group_by', 'format'}
+
+
+def value_template(name, value):
+    """
+    Placeholder recorded instead of a query or body value: only the
+    parameter name and the type of its value are kept.
+    """
+    if name in VALUE_PLACEHOLDERS:
+        return VALUE_PLACEHOLDERS[name]
+    if name in PLAIN_PARAMETERS and isinstance(value, str):
+        return value
+    if isinstance(value, bool) or value is None:
+        return value
+    for kind, parse in (('int', int), ('float', float)):
+        try:
+            parse(value)
+        except (TypeError, ValueError):
+            continue
+        return f'{{{kind}}}'
+    return '{str}'
+
+
+class RequestShapeRecorderMiddleware:
+    """
+    Append the shape of every request to settings.LOADTEST_RECORD_FILE.
+
+    Shapes (method, path template, query template, body template, auth
+    kind) are replayed by the loadtest command. Numeric path segments
+    become {ride_id}, credentials become placeholders, and query and body
+    values are recorded as their type ({int}, {float}, {str}; see
+    value_template); only JSON bodies are read, and headers and tokens
+    are never recorded. Without LOADTEST_RECORD_FILE the middleware
+    removes itself at startup and costs nothing.
+    """
+
+    def __init__(self, get_response):
+        self.path = getattr(settings, 'LOADTEST_RECORD_FILE', None)
+        if not self.path:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.lock = threading.Lock()
+
+    def _body_template(self, request):
+        # Reading a multipart upload would load it into memory (or fail
+        # with RequestDataTooBig) before the view streams it.
+        if request.content_type != 'application/json':
+            return None
+        try:
+            body = json.loads(request.body) if request.body else None
+        except (RequestDataTooBig, ValueError):
+            return None
+        if not isinstance(body, dict):
+            return None
+        return json.dumps({
+            field: SECRET_FIELDS.get(field) or value_template(field, value)
+            for field, value in body.items()
+        })
+
+    def _query_template(self, request):
+        return '&'.join(
+            f'{quote(name)}={quote(value_template(name, value), safe="{}")}'
+            for name, value in parse_qsl(request.META.get('QUERY_STRING', ''),
+                                         keep_blank_values=True)
+        )
+
+    def __call__(self, request):
+        # Read the body before the view consumes the stream.
+        body = self._body_template(request) if request.method in ('POST', 'PUT', 'PATCH') else None
+        response = self.get_response(request)
+
+        if request.path.startswith('/' + settings.STATIC_URL.lstrip('/')):
+            return response
+        if request.META.get('HTTP_AUTHORIZATION', '').startswith('Token '):
+            auth = 'token'
+        elif settings.SESSION_COOKIE_NAME in request.COOKIES:
+            auth = 'session'
+        else:
+            auth = None
+        shape = {
+            'method': request.method,
+            'path': NUMERIC_SEGMENT.sub('/{ride_id}', request.path),
+            'query': self._query_template(request),
+            'body': body,
+            'auth': auth,
+        }
+        with self.lock, open(self.path, 'a') as record_file:
+            record_file.write(json.dumps(shape) + '\n')
+        return response
+
+
+class RequestProfilerMiddleware:
+    """
+    Profile requests from admins that ask for it (see core.profiling).
+
+    Requests without the profiling header or query flag go straight to
+    the view. The user is taken from the session or, for API calls, from
+    the token, and must pass IsAdminRole. Disabled entirely when
+    REQUEST_PROFILE_DIR is empty.
+    """
+
+    def __init__(self, get_response):
+        if not profile_dir():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def _admin_user(self, request):
+        user = request.user
+        if not user.is_authenticated:
+            try:
+                user, _token = TokenAuthentication().authenticate(request) or (user, None)
+            except AuthenticationFailed:
+                return None
+        if IsAdminRole().has_permission(SimpleNamespace(user=user), None):
+            return user
+        return None
+
+    def __call__(self, request):
+        if not profiling_requested(request):
+            return self.get_response(request)
+        user = self._admin_user(request)
+        if user is None:
+            return self.get_response(request)
+        request.profiling_user = user
+        return run_profiled(request, self.get_response)
+
+
+class LoadSheddingMiddleware:
+    """
+    Shed expensive requests once the in-flight budget is used up (see
+    core.loadshed). Slots are released when the response is closed, so
+    streamed responses hold them until fully sent. Disabled entirely
+    when LOAD_SHED_BUDGET is 0.
+    """
+
+    def __init__(self, get_response):
+        if not loadshed.shed_budget():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        name = loadshed.request_class(request)
+        if name is None:
+            return self.get_response(request)
+        owner = loadshed.client_key(request)
+        slots = loadshed.acquire(name, owner)
+        if slots is None:
+            return loadshed.shed_response(name, owner)
+
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            loadshed.release(slots)
+            raise
+
+        def finish():
+            loadshed.release(slots)
+            loadshed.record_duration(name, time.perf_counter() - started)
+
+        response._resource_closers.append(finish)
+        return response
+
+
+class QueryCounter:
+    """Connection execute wrapper counting queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.connections = []
+
+    def wrap(self, connection):
+        connection.execute_wrappers.append(self)
+        self.connections.append(connection)
+
+    def unwrap(self):
+        for connection in self.connections:
+            connection.execute_wrappers.remove(self)
+        self.connections = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """
+    Record request latency and database query counts per view in
+    core.metrics. Disabled entirely when METRICS_DIR is empty.
+
+    Only connections this thread already has are wrapped; connections
+    opened during the request (a ride shard, say) get the counter from
+    the connection_created signal, so unused databases are not touched.
+    """
+
+    active = threading.local()
+
+    def __init__(self, get_response):
+        if not metrics.metrics_dir():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        connection_created.connect(self._connection_created, weak=False,
+                                   dispatch_uid='metrics_query_counter')
+
+    @classmethod
+    def _connection_created(cls, sender, connection, **kwargs):
+        counter = getattr(cls.active, 'counter', None)
+        if counter is not None and counter not in connection.execute_wrappers:
+            counter.wrap(connection)
+
+    def __call__(self, request):
+        counter = self.active.counter = QueryCounter()
+        started = time.perf_counter()
+        try:
+            for connection in connections.all(initialized_only=True):
+                counter.wrap(connection)
+            response = self.get_response(request)
+        finally:
+            self.active.counter = None
+            counter.unwrap()
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        metrics.observe('http_request_duration_seconds', duration, view=view,
+                        method=request.method, status=f'{response.status_code // 100}xx')
+        if counter.count:
+            metrics.inc('http_request_db_queries_total', counter.count, view=view)
+        return response
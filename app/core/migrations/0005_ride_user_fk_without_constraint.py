@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_alter_rideevent_created_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="ride",
+            name="id_driver",
+            field=models.ForeignKey(
+                blank=True,
+                db_column="id_driver",
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="rides_as_driver",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="ride",
+            name="id_rider",
+            field=models.ForeignKey(
+                db_column="id_rider",
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="rides_as_rider",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
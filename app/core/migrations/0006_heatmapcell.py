@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_ride_user_fk_without_constraint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HeatmapCell",
+            fields=[
+                (
+                    "id_heatmap_cell",
+                    models.AutoField(primary_key=True, serialize=False),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("pickup", "Pickup"), ("dropoff", "Dropoff")],
+                        max_length=10,
+                    ),
+                ),
+                ("zoom", models.PositiveSmallIntegerField()),
+                ("tile_x", models.PositiveIntegerField()),
+                ("tile_y", models.PositiveIntegerField()),
+                ("hour", models.PositiveSmallIntegerField()),
+                ("cell_x", models.PositiveSmallIntegerField()),
+                ("cell_y", models.PositiveSmallIntegerField()),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "db_table": "heatmap_cell",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "kind",
+                            "zoom",
+                            "tile_x",
+                            "tile_y",
+                            "hour",
+                            "cell_x",
+                            "cell_y",
+                        ),
+                        name="heatmap_cell_unique",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_event_summaries(apps, schema_editor):
+    # A copy of core.event_summary.expected_summary() as of this
+    # migration, so later changes to it do not change the backfill.
+    Ride = apps.get_model("core", "Ride")
+    RideEvent = apps.get_model("core", "RideEvent")
+    events = RideEvent.objects.filter(id_ride=OuterRef("pk")).order_by()
+    latest = events.order_by("-created_at", "-id_ride_event")
+    pickup_event = Q(description__endswith="to 'pickup'") | Q(
+        description__startswith="Ride created with status 'pickup'"
+    )
+    dropoff_event = Q(description__endswith="to 'dropoff'")
+    Ride.objects.using(schema_editor.connection.alias).update(
+        event_count=Coalesce(
+            Subquery(
+                events.values("id_ride").annotate(count=Count("pk")).values("count")
+            ),
+            0,
+        ),
+        last_event_id=Subquery(latest.values("id_ride_event")[:1]),
+        last_event_description=Coalesce(
+            Subquery(latest.values("description")[:1]), Value("")
+        ),
+        last_event_at=Subquery(latest.values("created_at")[:1]),
+        pickup_at=Subquery(
+            events.filter(pickup_event).order_by("created_at").values("created_at")[:1]
+        ),
+        dropoff_at=Subquery(
+            events.filter(dropoff_event)
+            .order_by("-created_at")
+            .values("created_at")[:1]
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_heatmapcell"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ride",
+            name="dropoff_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="ride",
+            name="event_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="ride",
+            name="last_event_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="ride",
+            name="last_event_description",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=255
+            ),
+        ),
+        migrations.AddField(
+            model_name="ride",
+            name="last_event_id",
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="ride",
+            name="pickup_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_event_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_ride_event_summary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HeatmapSource",
+            fields=[
+                (
+                    "database",
+                    models.CharField(max_length=100, primary_key=True, serialize=False),
+                ),
+                ("last_ride_id", models.BigIntegerField()),
+            ],
+            options={
+                "db_table": "heatmap_source",
+            },
+        ),
+    ]
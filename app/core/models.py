@@ -69,13 +69,15 @@ class Ride(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name='rides_as_rider',
-        db_column='id_rider'
+        db_column='id_rider',
+        db_constraint=False,  # users and sharded rides may live in different databases
     )
     id_driver = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name='rides_as_driver',
         db_column='id_driver',
+        db_constraint=False,
         null=True,
         blank=True
     )
@@ -84,12 +86,48 @@ class Ride(models.Model):
     dropoff_latitude = models.FloatField()
     dropoff_longitude = models.FloatField()
     pickup_time = models.DateTimeField()
+
+    # Summary of the ride's events, maintained by core.event_summary with
+    # every RideEvent insert so clients can skip loading the events.
+    event_count = models.PositiveIntegerField(default=0, editable=False)
+    last_event_id = models.IntegerField(null=True, blank=True, editable=False)
+    last_event_description = models.CharField(
+        max_length=255, blank=True, default='', editable=False
+    )
+    last_event_at = models.DateTimeField(null=True, blank=True, editable=False)
+    pickup_at = models.DateTimeField(null=True, blank=True, editable=False)
+    dropoff_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    EVENT_SUMMARY_FIELDS = (
+        'event_count',
+        'last_event_id',
+        'last_event_description',
+        'last_event_at',
+        'pickup_at',
+        'dropoff_at',
+    )
     
     class Meta:
         db_table = 'ride'
     
     def __str__(self):
         return f"Ride {self.id_ride} - {self.status}"
+
+    def save(self, *args, **kwargs):
+        """
+        Save the ride, leaving the event summary out of updates.
+
+        Only core.event_summary writes the summary, relative to the stored
+        values, so saving an instance loaded before new events were
+        inserted cannot roll it back.
+        """
+        if (not self._state.adding and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.EVENT_SUMMARY_FIELDS
+            ]
+        super().save(*args, **kwargs)
     
 class RideEvent(models.Model):
     """Model for tracking ride events/changes."""
@@ -107,6 +145,69 @@ class RideEvent(models.Model):
     class Meta:
         db_table = 'ride_event'
         ordering = ['-created_at']
+
+    @staticmethod
+    def created_description(status):
+        """Description of the event logged when a ride is created."""
+        return f"Ride created with status '{status}'"
+
+    @staticmethod
+    def status_change_description(old_status, new_status):
+        """Description of the event logged on a status change."""
+        return f"Status changed from '{old_status}' to '{new_status}'"
     
     def __str__(self):
         return f"Event for Ride {self.id_ride_id}: {self.description}"
+
+
+class HeatmapCell(models.Model):
+    """
+    Ride count for one heatmap grid cell, zoom level and hour of day
+    (or the whole day, see core.heatmap.ALL_HOURS).
+
+    Cells are addressed by the XYZ (Web Mercator) tile containing them and
+    their offset inside that tile; see core.heatmap.
+    """
+
+    KIND_CHOICES = [
+        ('pickup', 'Pickup'),
+        ('dropoff', 'Dropoff'),
+    ]
+
+    id_heatmap_cell = models.AutoField(primary_key=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    zoom = models.PositiveSmallIntegerField()
+    tile_x = models.PositiveIntegerField()
+    tile_y = models.PositiveIntegerField()
+    hour = models.PositiveSmallIntegerField()
+    cell_x = models.PositiveSmallIntegerField()
+    cell_y = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'heatmap_cell'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'zoom', 'tile_x', 'tile_y', 'hour', 'cell_x', 'cell_y'],
+                name='heatmap_cell_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} z{self.zoom}/{self.tile_x}/{self.tile_y} h{self.hour}: {self.count}"
+
+
+class HeatmapSource(models.Model):
+    """
+    Highest ride id of one ride database counted by the last heatmap
+    rebuild; rides up to it are not counted again (see core.heatmap).
+    """
+
+    database = models.CharField(max_length=100, primary_key=True)
+    last_ride_id = models.BigIntegerField()
+
+    class Meta:
+        db_table = 'heatmap_source'
+
+    def __str__(self):
+        return f"{self.database}: {self.last_ride_id}"
@@ -0,0 +1,41 @@
+"""
+Fast JSON parser, used for every API view.
+
+Parses UTF-8 bodies with orjson when it is installed. Bodies orjson
+rejects (invalid JSON, but also lone surrogates, which the stdlib
+accepts) are parsed again by DRF's JSONParser, so results and error
+messages are the same as before. So are bodies with 20 or more digits in
+a row, as orjson reads integers over 64 bits as floats.
+"""
+import io
+import re
+
+from rest_framework.parsers import JSONParser, get_encoding
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+LONG_NUMBER = re.compile(rb'\d{20}')
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser that parses with orjson, falling back to the stdlib."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        if (
+            orjson is None
+            or not self.strict
+            or get_encoding(parser_context).lower().replace('_', '-') not in ('utf-8', 'utf8')
+        ):
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        if LONG_NUMBER.search(body):
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,208 @@
+"""
+On-demand request profiling.
+
+An admin request carrying the PROFILE_HEADER header or the PROFILE_PARAM
+query flag runs under cProfile with every SQL query captured (see
+core.middleware.RequestProfilerMiddleware). The result is stored in
+settings.REQUEST_PROFILE_DIR as a ring buffer of at most
+settings.REQUEST_PROFILE_LIMIT profiles, each a JSON summary (request,
+SQL, top functions, call tree) plus the raw .prof file for pstats or
+snakeviz. Query string values and SQL parameters (tokens, emails, ...)
+are not stored: only the query parameter names and the number of SQL
+parameters. Other requests are not affected.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = '_profile'
+PROFILE_ID = re.compile(r'^[0-9]+-[0-9a-f]{8}$')
+
+TOP_FUNCTIONS = 40
+TREE_MIN_FRACTION = 0.01
+TREE_MAX_DEPTH = 25
+MAX_SQL_LENGTH = 2000
+
+
+def profile_dir():
+    return getattr(settings, 'REQUEST_PROFILE_DIR', None)
+
+
+def profiling_requested(request):
+    if PROFILE_HEADER in request.META:
+        return True
+    return PROFILE_PARAM in request.META.get('QUERY_STRING', '') and PROFILE_PARAM in request.GET
+
+
+class QueryRecorder:
+    """Connection execute wrapper collecting SQL, parameter counts and timings."""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'database': self.alias,
+                'sql': sql[:MAX_SQL_LENGTH],
+                'param_count': _param_count(params, many),
+                'many': many,
+                'duration_ms': (time.perf_counter() - started) * 1000,
+            })
+
+
+def _param_count(params, many):
+    if params is None:
+        return 0
+    if many:
+        # executemany() gets an iterable of parameter lists.
+        return None
+    return len(params)
+
+
+def _function_name(function):
+    filename, line, name = function
+    if filename == '~':
+        return name
+    if filename.startswith(os.getcwd()):
+        filename = os.path.relpath(filename)
+    return f'{filename}:{line}({name})'
+
+
+def call_tree(stats):
+    """
+    Nested {'function', 'calls', 'cumulative_ms', 'children'} built from
+    pstats caller data, pruned below TREE_MIN_FRACTION of the root's time.
+    """
+    callees = {}
+    for function, (_cc, _nc, _tt, _ct, callers) in stats.stats.items():
+        for caller, (_ccc, caller_calls, _ctt, caller_cumulative) in callers.items():
+            callees.setdefault(caller, []).append((function, caller_calls, caller_cumulative))
+    if not stats.stats:
+        return []
+    # The outermost frame (the middleware chain) has the largest cumulative
+    # time; recursion through middleware means it may still have callers.
+    root = max(stats.stats, key=lambda function: stats.stats[function][3])
+    total = stats.stats[root][3] or 1
+
+    def build(function, calls, cumulative, path):
+        node = {
+            'function': _function_name(function),
+            'calls': calls,
+            'cumulative_ms': cumulative * 1000,
+            'children': [],
+        }
+        if len(path) < TREE_MAX_DEPTH:
+            for child, child_calls, child_cumulative in sorted(
+                callees.get(function, []), key=lambda item: -item[2]
+            ):
+                if child_cumulative / total >= TREE_MIN_FRACTION and child not in path:
+                    node['children'].append(
+                        build(child, child_calls, child_cumulative, path | {child})
+                    )
+        return node
+
+    return [build(root, stats.stats[root][1], stats.stats[root][3], {root})]
+
+
+def run_profiled(request, get_response):
+    """Run get_response(request) under cProfile and SQL capture; store the profile."""
+    recorders = [QueryRecorder(alias) for alias in connections]
+    profiler = cProfile.Profile()
+    started = time.time()
+    with ExitStack() as stack:
+        for recorder in recorders:
+            stack.enter_context(connections[recorder.alias].execute_wrapper(recorder))
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+    duration = time.time() - started
+
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    queries = sorted(
+        (query for recorder in recorders for query in recorder.queries),
+        key=lambda query: -query['duration_ms'],
+    )
+    profile_id = save_profile(profiler, {
+        'method': request.method,
+        'path': request.path,
+        'query_params': sorted(request.GET),
+        'user': str(getattr(request, 'profiling_user', '')),
+        'status': response.status_code,
+        'streaming': response.streaming,
+        'started': started,
+        'duration_ms': duration * 1000,
+        'sql_count': len(queries),
+        'sql_ms': sum(query['duration_ms'] for query in queries),
+        'sql': queries,
+        'top_functions': stats.stream.getvalue(),
+        'call_tree': call_tree(stats),
+    })
+    response['X-Profile-Id'] = profile_id
+    return response
+
+
+def save_profile(profiler, summary):
+    """Write a profile to the ring buffer and drop the oldest beyond the limit."""
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    profile_id = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+    summary['id'] = profile_id
+    profiler.dump_stats(os.path.join(directory, f'{profile_id}.prof'))
+    tmp_path = os.path.join(directory, f'.{profile_id}.json.tmp')
+    with open(tmp_path, 'w') as summary_file:
+        json.dump(summary, summary_file)
+    os.replace(tmp_path, os.path.join(directory, f'{profile_id}.json'))
+
+    for old_id in list_profile_ids()[settings.REQUEST_PROFILE_LIMIT:]:
+        for suffix in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, old_id + suffix))
+            except FileNotFoundError:
+                pass  # removed by another worker
+    return profile_id
+
+
+def list_profile_ids():
+    """Stored profile ids, newest first."""
+    try:
+        names = os.listdir(profile_dir())
+    except FileNotFoundError:
+        return []
+    ids = [name[:-5] for name in names if name.endswith('.json') and PROFILE_ID.match(name[:-5])]
+    return sorted(ids, key=lambda profile_id: int(profile_id.split('-')[0]), reverse=True)
+
+
+def profile_path(profile_id, suffix):
+    """Path of a stored profile file, or None for ids that are not profile ids."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    return os.path.join(profile_dir(), profile_id + suffix)
+
+
+def load_profile(profile_id):
+    path = profile_path(profile_id, '.json')
+    if path is None:
+        return None
+    try:
+        with open(path) as summary_file:
+            return json.load(summary_file)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,46 @@
+"""
+Chunked purge of rides and their events.
+
+Django's QuerySet.delete() collects every related RideEvent in Python
+before deleting. Here rides are deleted in bounded id batches, events
+first, with raw DELETE ... WHERE id_ride IN (...) statements, each batch
+in its own short transaction so locks are released between batches.
+"""
+import time
+
+from core.models import Ride, RideEvent
+from core.sqlite import write_transaction
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def delete_rides(ride_ids, using='default'):
+    """Delete the given rides and their events. Returns (rides, events) deleted."""
+    with write_transaction(using=using):
+        events = RideEvent.objects.using(using).filter(id_ride__in=ride_ids)._raw_delete(using)
+        rides = Ride.objects.using(using).filter(id_ride__in=ride_ids)._raw_delete(using)
+    return rides, events
+
+
+def iter_purge(queryset, batch_size=DEFAULT_BATCH_SIZE, sleep=0.0, start_after=0):
+    """
+    Delete every ride of queryset in batches ordered by id_ride.
+
+    Yields a progress dict after each batch. start_after skips rides with
+    a lower or equal id, which lets an interrupted purge resume.
+    """
+    using = queryset.db
+    last_id = start_after
+    while True:
+        ride_ids = list(
+            queryset.filter(id_ride__gt=last_id)
+            .order_by('id_ride')
+            .values_list('id_ride', flat=True)[:batch_size]
+        )
+        if not ride_ids:
+            return
+        rides, events = delete_rides(ride_ids, using=using)
+        last_id = ride_ids[-1]
+        yield {'last_id': last_id, 'rides': rides, 'events': events}
+        if sleep:
+            time.sleep(sleep)
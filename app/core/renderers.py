@@ -0,0 +1,127 @@
+"""
+Fast JSON and MessagePack renderers, used for every API view.
+
+FastJSONRenderer renders with orjson when it is installed and returns
+exactly the bytes DRF's JSONRenderer would. Datetimes, decimals and the
+other values orjson would format differently go through DRF's encoder,
+and output orjson cannot produce identically (indented output, integers
+over 64 bits, non-string keys, floats that json.dumps writes in exponent
+notation) is rendered by JSONRenderer itself. So is data holding NaN or
+infinity, which orjson writes as null: JSONRenderer raises ValueError
+for it, as without orjson. Values converted by the encoder (numpy
+arrays, querysets, ...) may hide such floats, so output with a null
+that comes from data holding them is rendered by JSONRenderer too.
+"""
+import datetime
+import math
+import re
+import uuid
+from decimal import Decimal
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+DIGITS = frozenset(b'0123456789')
+# orjson writes 1e16 and 2.5e-7 where json.dumps writes 1e+16 and 2.5e-07.
+EXPONENT = re.compile(rb'e[-\d]')
+LINE_SEPARATORS = b'\xe2\x80'
+# Values DRF's encoder converts to strings, never to NaN or infinity.
+STRING_ENCODED = (str, datetime.date, datetime.time, datetime.timedelta, uuid.UUID, bytes)
+
+
+def floats_may_differ(content):
+    """
+    Whether orjson output may contain a float json.dumps writes differently.
+
+    Those are the floats json.dumps writes in exponent notation: orjson
+    uses exponents without "+" or leading zeros, and fixed notation below
+    1e-4. False positives (inside strings) only cost a slower render.
+    """
+    if b'0.0000' in content:
+        return True
+    return any(content[match.start() - 1] in DIGITS for match in EXPONENT.finditer(content))
+
+
+def may_contain_non_finite(data):
+    """
+    Whether data holds a NaN or infinite float or Decimal at any depth,
+    or a value the encoder's default() converts into something that may
+    (anything but JSON types and STRING_ENCODED values).
+    """
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if value is None or isinstance(value, (bool, int, STRING_ENCODED)):
+            continue
+        if isinstance(value, (float, Decimal)):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        else:
+            return True
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer that renders with orjson when the output is identical."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or not self.compact or self.ensure_ascii or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if floats_may_differ(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        # orjson writes NaN and infinity as null; only then is data walked.
+        if b'null' in ret and may_contain_non_finite(data):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Escaped by JSONRenderer to keep the output a strict JavaScript subset.
+        if LINE_SEPARATORS in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Render data as MessagePack, for internal services.
+
+    Floats are packed as doubles; datetimes and other values without a
+    MessagePack type are converted by DRF's JSON encoder, so they match
+    the JSON output.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    encoder_class = JSONRenderer.encoder_class
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=self.encoder_class().default,
+                             use_bin_type=True, datetime=False)
@@ -0,0 +1,86 @@
+"""
+Precomputed OpenAPI schema.
+
+The schema is generated once (at container start by
+`manage.py spectacular`, or on the first request when no file exists),
+rendered once per format and then served from memory with an ETag.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from drf_spectacular.views import SpectacularAPIView
+
+_lock = threading.Lock()
+_schema = None
+_rendered = {}
+
+
+def load_schema_file(path):
+    """Return the schema stored at path, or None when it does not exist."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as schema_file:
+        if str(path).endswith('.json'):
+            return json.load(schema_file)
+        import yaml
+
+        return yaml.safe_load(schema_file)
+
+
+def clear_schema_cache():
+    """Forget the in-memory schema (e.g. after regenerating the file)."""
+    global _schema
+    with _lock:
+        _schema = None
+        _rendered.clear()
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    """SpectacularAPIView serving a precomputed schema with an ETag."""
+
+    def _get_schema_response(self, request):
+        # Keep live generation for DEBUG and for localized/versioned variants.
+        if settings.DEBUG or request.GET.get('lang') or request.GET.get('version'):
+            return super()._get_schema_response(request)
+
+        renderer = request.accepted_renderer
+        body, etag = self._get_rendered(request, renderer)
+
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = HttpResponse(body, content_type=content_type)
+        response['ETag'] = etag
+        response['Content-Disposition'] = f'inline; filename="{self._get_filename(request, None)}"'
+        return response
+
+    def _get_schema(self, request):
+        global _schema
+        if _schema is None:
+            with _lock:
+                if _schema is None:
+                    schema = load_schema_file(settings.OPENAPI_SCHEMA_FILE)
+                    if schema is None:
+                        generator = self.generator_class(urlconf=self.urlconf, patterns=self.patterns)
+                        schema = generator.get_schema(request=request, public=self.serve_public)
+                    _schema = schema
+        return _schema
+
+    def _get_rendered(self, request, renderer):
+        key = renderer.media_type
+        if key not in _rendered:
+            body = renderer.render(self._get_schema(request), renderer_context={})
+            etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+            with _lock:
+                _rendered.setdefault(key, (body, etag))
+        return _rendered[key]
@@ -0,0 +1,237 @@
+"""
+Region-based sharding of rides.
+
+Rides (and their events) live in the databases listed in
+settings.RIDE_SHARDS. A ride's shard is derived from the grid cell of
+its pickup point. Each shard hands out ride ids from its own range
+(shard n owns [(n + 1) * SHARD_ID_SPAN, (n + 2) * SHARD_ID_SPAN)), so an
+existing ride can be located from its id alone. Ids below SHARD_ID_SPAN
+belong to the default database, where rides lived before sharding;
+rebalance_ride_shards moves them out. check_ride_id_ranges (a database
+system check, run by migrate) refuses databases holding ids outside
+their range, such as a default database whose ids already reached
+SHARD_ID_SPAN before sharding was enabled.
+
+Users stay in the default database. With no shards configured every
+function here falls back to the default database and the router is a
+no-op.
+"""
+import heapq
+import itertools
+import math
+import zlib
+
+from django.conf import settings
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.models import Q
+
+SHARD_ID_SPAN = 10 ** 8
+# AutoField is a 32-bit integer on PostgreSQL.
+MAX_SHARDS = (2 ** 31 - 1) // SHARD_ID_SPAN - 1
+SHARDED_MODELS = {'ride', 'rideevent'}
+
+
+def ride_shards():
+    """Database aliases holding ride shards, in shard order."""
+    shards = list(getattr(settings, 'RIDE_SHARDS', []))
+    if len(shards) > MAX_SHARDS:
+        raise ImproperlyConfigured(f'At most {MAX_SHARDS} ride shards are supported.')
+    return shards
+
+
+def sharding_enabled():
+    return bool(ride_shards())
+
+
+def ride_databases():
+    """Every database that may hold rides, in ascending id range order."""
+    return [DEFAULT_DB_ALIAS] + [alias for alias in ride_shards() if alias != DEFAULT_DB_ALIAS]
+
+
+def shard_key(latitude, longitude):
+    """Grid cell of a point, used as the shard key."""
+    cell = getattr(settings, 'RIDE_SHARD_CELL_DEGREES', 1.0)
+    return math.floor(latitude / cell), math.floor(longitude / cell)
+
+
+def shard_for_point(latitude, longitude):
+    """Database alias owning rides picked up at the given point."""
+    shards = ride_shards()
+    if not shards:
+        return DEFAULT_DB_ALIAS
+    row, column = shard_key(latitude, longitude)
+    return shards[zlib.crc32(f'{row}:{column}'.encode()) % len(shards)]
+
+
+def shard_for_ride_id(id_ride):
+    """Database alias holding the ride with the given id."""
+    index = int(id_ride) // SHARD_ID_SPAN - 1
+    shards = ride_shards()
+    if index < 0 or index >= len(shards):
+        return DEFAULT_DB_ALIAS
+    return shards[index]
+
+
+def shard_id_base(alias):
+    """First ride/event id handed out by a shard."""
+    return (ride_shards().index(alias) + 1) * SHARD_ID_SPAN
+
+
+def id_range_filter(alias):
+    """Q matching the ride/event ids that belong in a database."""
+    allowed = Q(pk__lt=SHARD_ID_SPAN) if alias == DEFAULT_DB_ALIAS else Q(pk__in=[])
+    if alias in ride_shards():
+        base = shard_id_base(alias)
+        allowed |= Q(pk__gte=base, pk__lt=base + SHARD_ID_SPAN)
+    return allowed
+
+
+def check_ride_id_ranges(app_configs=None, databases=None, **kwargs):
+    """
+    Database system check: with sharding enabled, every ride and event id
+    must lie in its database's range, or shard_for_ride_id() would send
+    lookups of it to another database.
+    """
+    from core.models import Ride, RideEvent
+
+    errors = []
+    if not sharding_enabled():
+        return errors
+    for alias in ride_databases():
+        if databases is None or alias not in databases:
+            continue
+        for model in (Ride, RideEvent):
+            try:
+                outside = model.objects.using(alias).exclude(id_range_filter(alias)).exists()
+            except DatabaseError:
+                continue  # not migrated yet
+            if outside:
+                errors.append(checks.Error(
+                    f'Database {alias!r} holds {model._meta.verbose_name} ids outside its '
+                    f'id range, so ride sharding cannot locate them.',
+                    hint='Ids at or above SHARD_ID_SPAN in the default database belong to '
+                         'shards; renumber or move these rows before enabling RIDE_SHARDS.',
+                    obj=alias,
+                    id='core.E001',
+                ))
+    return errors
+
+
+def _is_sharded(model):
+    return model._meta.app_label == 'core' and model._meta.model_name in SHARDED_MODELS
+
+
+class RideShardRouter:
+    """Route Ride and RideEvent writes (and related reads) to their shard."""
+
+    def _db_for_instance(self, instance):
+        if instance is None:
+            return None
+        if instance._state.db:
+            return instance._state.db
+        model_name = instance._meta.model_name
+        if model_name == 'ride':
+            if instance.pk is not None:
+                return shard_for_ride_id(instance.pk)
+            return shard_for_point(instance.pickup_latitude, instance.pickup_longitude)
+        if model_name == 'rideevent' and instance.id_ride_id is not None:
+            return shard_for_ride_id(instance.id_ride_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        if not sharding_enabled() or not _is_sharded(model):
+            return None
+        return self._db_for_instance(hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        if not sharding_enabled() or not _is_sharded(model):
+            return None
+        return self._db_for_instance(hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Rides reference users across databases.
+        if sharding_enabled() and (_is_sharded(type(obj1)) or _is_sharded(type(obj2))):
+            return True
+        return None
+
+
+def init_shard_sequences(using, **kwargs):
+    """post_migrate hook: start a shard's ride/event ids at its id range."""
+    if using not in ride_shards():
+        return
+    base = shard_id_base(using)
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for table, column in (('ride', 'id_ride'), ('ride_event', 'id_ride_event')):
+            if connection.vendor == 'sqlite':
+                cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute(
+                        'INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, base - 1]
+                    )
+                elif row[0] < base - 1:
+                    cursor.execute(
+                        'UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [base - 1, table]
+                    )
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'SELECT setval(pg_get_serial_sequence(%s, %s), '
+                    f'GREATEST(%s, (SELECT COALESCE(MAX({column}), 0) FROM {table})))',
+                    [table, column, base - 1],
+                )
+
+
+class ShardedRideList:
+    """
+    Scatter-gather view over one ride queryset per database.
+
+    Each queryset must already be filtered and ordered the same way.
+    Slicing fetches at most `stop` rows from every shard and merges them
+    by the first ordering field, so it works with Django's Paginator.
+    """
+
+    def __init__(self, querysets):
+        self.querysets = querysets
+        ordering = querysets[0].query.order_by or querysets[0].model._meta.ordering or ['pk']
+        field = ordering[0]
+        self.reverse = field.startswith('-')
+        self.field = field.lstrip('-')
+        self._count = None
+
+    def _key(self, ride):
+        return getattr(ride, 'pk' if self.field == 'pk' else self.field)
+
+    def count(self):
+        if self._count is None:
+            self._count = sum(queryset.count() for queryset in self.querysets)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return heapq.merge(*self.querysets, key=self._key, reverse=self.reverse)
+
+    def iterator(self, chunk_size):
+        """Merge the shards' chunked iterators without caching any result."""
+        return heapq.merge(
+            *(queryset.iterator(chunk_size=chunk_size) for queryset in self.querysets),
+            key=self._key, reverse=self.reverse,
+        )
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop = index.start or 0, index.stop
+            if index.step not in (None, 1):
+                raise ValueError('Stepped slices are not supported.')
+            if stop is None:
+                return list(self)[start:]
+            merged = heapq.merge(
+                *(queryset[:stop] for queryset in self.querysets),
+                key=self._key, reverse=self.reverse,
+            )
+            return list(itertools.islice(merged, start, stop))
+        return self[index:index + 1][0]
@@ -1,33 +1,96 @@
-from django.db.models.signals import post_save, pre_save
+import logging
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from .models import Ride, RideEvent
+from . import metrics
+from .event_buffer import ride_event_buffer, write_behind_enabled
+from .event_summary import create_events, summarize
+from .heatmap import record_ride
+from .models import Ride, RideEvent, User
+from .purge import delete_rides
+from .sharding import ride_shards
+
+logger = logging.getLogger(__name__)
 
 
 @receiver(pre_save, sender=Ride)
-def track_ride_changes(sender, instance, **kwargs):
-    """Store old values before save."""
+def track_ride_changes(sender, instance, using, **kwargs):
+    """Store old values before save, and refresh the event summary."""
+    instance._old_status = None
     if instance.pk:
-        try:
-            instance._old_status = Ride.objects.get(pk=instance.pk).status
-        except Ride.DoesNotExist:
-            instance._old_status = None
-    else:
-        instance._old_status = None
+        row = Ride.objects.using(using).filter(pk=instance.pk).values(
+            'status', *Ride.EVENT_SUMMARY_FIELDS
+        ).first()
+        if row is not None:
+            instance._old_status = row.pop('status')
+            for field, value in row.items():
+                setattr(instance, field, value)
 
 
 @receiver(post_save, sender=Ride)
-def create_ride_event(sender, instance, created, **kwargs):
+def create_ride_event(sender, instance, created, using, **kwargs):
     """Create RideEvent entries when Ride is created or updated."""
     
     if created:
-        RideEvent.objects.create(
-            id_ride=instance,
-            description=f"Ride created with status '{instance.status}'"
-        )
+        description = RideEvent.created_description(instance.status)
     else:
         # Check if status changed
-        if hasattr(instance, '_old_status') and instance._old_status != instance.status:
-            RideEvent.objects.create(
-                id_ride=instance,
-                description=f"Status changed from '{instance._old_status}' to '{instance.status}'"
-            )
\ No newline at end of file
+        if not (hasattr(instance, '_old_status') and instance._old_status != instance.status):
+            return
+        description = RideEvent.status_change_description(
+            instance._old_status, instance.status
+        )
+
+    if write_behind_enabled():
+        ride_event_buffer.add(RideEvent(id_ride=instance, description=description), using)
+        return
+    events = create_events([RideEvent(id_ride=instance, description=description)], using)
+    summary = summarize(events, {field: getattr(instance, field)
+                                 for field in Ride.EVENT_SUMMARY_FIELDS})
+    for field, value in summary.items():
+        setattr(instance, field, value)
+    transaction.on_commit(
+        lambda: metrics.inc('ride_events_created_total', source='signals'), using=using
+    )
+
+
+@receiver(post_save, sender=Ride)
+def update_heatmap(sender, instance, created, using, **kwargs):
+    """Count new rides in the heatmap once the ride is committed."""
+    if not created:
+        return
+
+    def record():
+        # Runs right away outside a transaction: a failure must not fail
+        # the request that created the ride. rebuild_heatmap repairs it.
+        try:
+            record_ride(instance, using)
+        except Exception:
+            logger.exception('Could not count ride %s in the heatmap', instance.pk)
+
+    transaction.on_commit(record, using=using)
+
+
+@receiver(post_delete, sender=User)
+def delete_sharded_rides(sender, instance, using, **kwargs):
+    """
+    Delete a deleted user's rides in the ride shards. The CASCADE only
+    reaches the database the user was deleted from.
+    """
+    user_id = instance.pk  # None once the delete is done
+
+    def delete():
+        for alias in ride_shards():
+            if alias == using:
+                continue
+            ride_ids = list(
+                Ride.objects.using(alias)
+                .filter(Q(id_rider=user_id) | Q(id_driver=user_id))
+                .values_list('id_ride', flat=True)
+            )
+            if ride_ids:
+                delete_rides(ride_ids, using=alias)
+
+    transaction.on_commit(delete, using=using)
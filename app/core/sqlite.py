@@ -0,0 +1,64 @@
+"""
+SQLite production mode for single-node deployments.
+
+With settings.SQLITE_PRODUCTION every SQLite connection runs
+settings.SQLITE_INIT_COMMAND when it opens: a busy timeout, the WAL
+journal (readers and the writer no longer block each other),
+synchronous=NORMAL (safe with WAL) and memory-mapped reads.
+
+Write paths use write_transaction(), which starts the transaction with
+BEGIN IMMEDIATE on SQLite. A plain (deferred) transaction that reads
+before it writes has to upgrade its read lock, and SQLite fails such an
+upgrade with "database is locked" right away when another connection
+has written in the meantime, without waiting for the busy timeout.
+Taking the write lock up front makes writers queue instead.
+
+The WAL file is checkpointed and PRAGMA optimize run by the
+sqlite_maintenance command.
+"""
+from django.db import connections, transaction
+
+CHECKPOINT_MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+
+class ImmediateAtomic(transaction.Atomic):
+    """Atomic block whose outermost transaction begins with BEGIN IMMEDIATE on SQLite."""
+
+    def __enter__(self):
+        connection = transaction.get_connection(self.using)
+        if connection.vendor != 'sqlite' or connection.in_atomic_block:
+            return super().__enter__()
+        # Connecting resets transaction_mode from the database OPTIONS.
+        connection.ensure_connection()
+        mode, connection.transaction_mode = connection.transaction_mode, 'IMMEDIATE'
+        try:
+            return super().__enter__()
+        finally:
+            connection.transaction_mode = mode
+
+
+def write_transaction(using=None, savepoint=True):
+    """transaction.atomic() for blocks that write; takes the write lock up front on SQLite."""
+    return ImmediateAtomic(using, savepoint, False)
+
+
+def sqlite_databases():
+    """Aliases of the configured SQLite databases."""
+    return [alias for alias in connections if connections[alias].vendor == 'sqlite']
+
+
+def maintain(using, mode='TRUNCATE'):
+    """
+    Checkpoint the WAL of a database and run PRAGMA optimize.
+
+    Returns {'busy', 'log_frames', 'checkpointed_frames'} as reported by
+    PRAGMA wal_checkpoint; the frame counts are -1 when the database is
+    not in WAL mode.
+    """
+    if mode not in CHECKPOINT_MODES:
+        raise ValueError(f'Unknown checkpoint mode {mode!r}.')
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'PRAGMA wal_checkpoint({mode})')
+        busy, log_frames, checkpointed_frames = cursor.fetchone()
+        cursor.execute('PRAGMA optimize')
+    return {'busy': busy, 'log_frames': log_frames, 'checkpointed_frames': checkpointed_frames}
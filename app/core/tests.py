@@ -0,0 +1,521 @@
+"""
+Tests for the core app.
+"""
+import fcntl
+import json
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from core import event_buffer, heatmap, loadshed, renderers
+from core.event_buffer import RideEventBuffer
+from core.event_summary import check_summaries, create_events
+from core.feed import format_cursor, iter_event_feed, parse_cursor
+from core.heatmap import ALL_HOURS
+from core.models import HeatmapCell, Ride, RideEvent, User
+from core.purge import delete_rides
+from core.renderers import FastJSONRenderer
+from core.throttling import TokenBucketThrottle
+from core.sharding import (
+    SHARD_ID_SPAN,
+    RideShardRouter,
+    ShardedRideList,
+    check_ride_id_ranges,
+    ride_databases,
+    shard_for_point,
+    shard_for_ride_id,
+)
+
+SHARDS = ['ride_shard_0', 'ride_shard_1']
+
+
+def create_ride(rider, using='default', **fields):
+    """Create a ride in a database (None: in its shard, see the router)."""
+    fields = {
+        'id_rider_id': rider.pk,
+        'pickup_latitude': 14.5, 'pickup_longitude': 121.0,
+        'dropoff_latitude': 14.6, 'dropoff_longitude': 121.1,
+        'pickup_time': timezone.now(),
+        **fields,
+    }
+    ride = Ride(**fields)
+    ride.save(using=using)
+    return ride
+
+
+def read_feed(**kwargs):
+    return [json.loads(line) for _cursor, chunk in iter_event_feed(**kwargs)
+            for line in chunk.splitlines()]
+
+
+class EventFeedTests(TestCase):
+    """iter_event_feed(): lag cutoff and cursors."""
+
+    databases = '__all__'  # the feed reads every ride database
+
+    def setUp(self):
+        rider = User.objects.create_user('rider@example.com')
+        self.ride = create_ride(rider)
+        self.now = timezone.now()
+        self.created = RideEvent.objects.get(id_ride=self.ride)
+
+    def add_event(self, seconds_ago):
+        return RideEvent.objects.create(
+            id_ride=self.ride, description='Note',
+            created_at=self.now - timedelta(seconds=seconds_ago),
+        )
+
+    def test_lag_cutoff_and_resume(self):
+        RideEvent.objects.filter(pk=self.created.pk).update(
+            created_at=self.now - timedelta(seconds=120)
+        )
+        old = self.add_event(60)
+        young = self.add_event(5)
+        # Older than the lag, but after the young event: must not be
+        # served before it, or a resumed cursor would skip the young one.
+        late = self.add_event(100)
+
+        lines = read_feed(lag=30)
+        self.assertEqual([line['id_ride_event'] for line in lines], [self.created.pk, old.pk])
+        self.assertEqual(lines[-1]['cursor'], str(old.pk))
+        self.assertEqual(lines[0]['ride']['id_ride'], self.ride.pk)
+
+        self.assertEqual(read_feed(after=lines[-1]['cursor'], lag=30), [])
+        lines = read_feed(after=lines[-1]['cursor'], lag=0)
+        self.assertEqual([line['id_ride_event'] for line in lines], [young.pk, late.pk])
+        self.assertEqual(read_feed(after=lines[-1]['cursor'], lag=0), [])
+
+    def test_event_dated_in_the_future_does_not_stop_the_feed(self):
+        future = self.add_event(-24 * 60 * 60)
+        RideEvent.objects.filter(pk=self.created.pk).update(
+            created_at=self.now - timedelta(seconds=120)
+        )
+        later = self.add_event(60)
+        lines = read_feed(lag=30)
+        self.assertEqual([line['id_ride_event'] for line in lines],
+                         [self.created.pk, future.pk, later.pk])
+
+    def test_limit(self):
+        RideEvent.objects.filter(pk=self.created.pk).update(
+            created_at=self.now - timedelta(seconds=120)
+        )
+        events = [self.add_event(60) for _index in range(3)]
+        lines = read_feed(lag=30, limit=2)
+        self.assertEqual([line['id_ride_event'] for line in lines], [self.created.pk, events[0].pk])
+        lines = read_feed(after=lines[-1]['cursor'], lag=30, limit=2)
+        self.assertEqual([line['id_ride_event'] for line in lines], [events[1].pk, events[2].pk])
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(parse_cursor('0'), {'default': 0})
+        self.assertEqual(parse_cursor(''), {})
+        self.assertEqual(parse_cursor('42'), {'default': 42})
+        self.assertEqual(parse_cursor('7, 42'), {'default': 42})
+        self.assertEqual(format_cursor({}), '0')
+        self.assertEqual(format_cursor(parse_cursor('42')), '42')
+        for value in ('-1', 'abc', '1,x'):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_cursor(value)
+
+
+@override_settings(RIDE_SHARDS=SHARDS)
+class ShardRoutingTests(SimpleTestCase):
+    """Shard lookup by id and pickup point, and the router."""
+
+    def test_shard_for_ride_id(self):
+        for id_ride, alias in [
+            (1, 'default'),
+            (SHARD_ID_SPAN - 1, 'default'),
+            (SHARD_ID_SPAN, 'ride_shard_0'),
+            (2 * SHARD_ID_SPAN - 1, 'ride_shard_0'),
+            (2 * SHARD_ID_SPAN, 'ride_shard_1'),
+            (3 * SHARD_ID_SPAN - 1, 'ride_shard_1'),
+            (3 * SHARD_ID_SPAN, 'default'),
+        ]:
+            with self.subTest(id_ride=id_ride):
+                self.assertEqual(shard_for_ride_id(id_ride), alias)
+
+    def test_shard_for_point(self):
+        self.assertIn(shard_for_point(14.5, 121.0), SHARDS)
+        # One shard per grid cell.
+        self.assertEqual(shard_for_point(14.1, 121.1), shard_for_point(14.9, 121.9))
+        with override_settings(RIDE_SHARDS=[]):
+            self.assertEqual(shard_for_point(14.5, 121.0), 'default')
+
+    def test_router(self):
+        router = RideShardRouter()
+        self.assertEqual(router.db_for_write(Ride, instance=Ride(pk=2 * SHARD_ID_SPAN + 5)),
+                         'ride_shard_1')
+        ride = Ride(pickup_latitude=14.5, pickup_longitude=121.0)
+        self.assertEqual(router.db_for_write(Ride, instance=ride), shard_for_point(14.5, 121.0))
+        event = RideEvent(id_ride_id=SHARD_ID_SPAN + 1)
+        self.assertEqual(router.db_for_read(RideEvent, instance=event), 'ride_shard_0')
+        self.assertIsNone(router.db_for_write(User, instance=User()))
+        with override_settings(RIDE_SHARDS=[]):
+            self.assertIsNone(router.db_for_write(Ride, instance=ride))
+
+    def test_multi_position_cursor(self):
+        cursor = f'7, {SHARD_ID_SPAN + 3}, {2 * SHARD_ID_SPAN + 9}, 5'
+        positions = parse_cursor(cursor)
+        self.assertEqual(positions, {
+            'default': 7, 'ride_shard_0': SHARD_ID_SPAN + 3, 'ride_shard_1': 2 * SHARD_ID_SPAN + 9,
+        })
+        self.assertEqual(format_cursor(positions),
+                         f'7,{SHARD_ID_SPAN + 3},{2 * SHARD_ID_SPAN + 9}')
+        self.assertEqual(format_cursor({'ride_shard_1': 2 * SHARD_ID_SPAN}),
+                         str(2 * SHARD_ID_SPAN))
+
+
+class ShardedRideListTests(TestCase):
+    """The merge of per-database querysets, here two halves of one table."""
+
+    def setUp(self):
+        rider = User.objects.create_user('rider@example.com')
+        now = timezone.now()
+        self.rides = [create_ride(rider, pickup_time=now + timedelta(minutes=minutes))
+                      for minutes in (5, 1, 4, 2, 3, 6)]
+
+    def ride_list(self, *ordering):
+        even = [ride.pk for ride in self.rides[::2]]
+        return ShardedRideList([
+            Ride.objects.filter(pk__in=even).order_by(*ordering),
+            Ride.objects.exclude(pk__in=even).order_by(*ordering),
+        ])
+
+    def test_merge_order(self):
+        by_time = sorted(self.rides, key=lambda ride: ride.pickup_time)
+        self.assertEqual(list(self.ride_list('pickup_time')), by_time)
+        self.assertEqual(list(self.ride_list('-pickup_time')), by_time[::-1])
+        self.assertEqual(list(self.ride_list('pk').iterator(chunk_size=2)),
+                         sorted(self.rides, key=lambda ride: ride.pk))
+
+    def test_pagination(self):
+        rides = self.ride_list('-pickup_time')
+        by_time = sorted(self.rides, key=lambda ride: ride.pickup_time, reverse=True)
+        self.assertEqual(len(rides), 6)
+        self.assertEqual(rides[0:2], by_time[0:2])
+        self.assertEqual(rides[2:4], by_time[2:4])
+        self.assertEqual(rides[4:10], by_time[4:])
+        self.assertEqual(rides[3], by_time[3])
+        self.assertEqual(rides[1:], by_time[1:])
+
+
+@unittest.skipUnless(settings.RIDE_SHARDS, 'ride sharding is not enabled (RIDE_SHARD_COUNT)')
+class ShardedDatabaseTests(TestCase):
+    """Rides in real shard databases; run with RIDE_SHARD_COUNT=2."""
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.rider = User.objects.create_user('rider@example.com')
+
+    def test_rides_get_ids_of_their_shard(self):
+        ride = create_ride(self.rider, using=None)
+        alias = ride._state.db
+        self.assertIn(alias, settings.RIDE_SHARDS)
+        self.assertEqual(shard_for_ride_id(ride.pk), alias)
+        self.assertEqual(RideEvent.objects.using(alias).get().id_ride_id, ride.pk)
+        self.assertEqual(read_feed(lag=0)[0]['id_ride_event'],
+                         RideEvent.objects.using(alias).get().pk)
+
+    def test_deleting_a_user_deletes_their_sharded_rides(self):
+        driver = User.objects.create_user('driver@example.com')
+        as_rider = create_ride(self.rider, using=None)
+        as_driver = create_ride(driver, using=None, id_driver_id=self.rider.pk)
+        kept = create_ride(driver, using=None)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rider.delete()
+        for ride in (as_rider, as_driver):
+            self.assertFalse(Ride.objects.using(ride._state.db).filter(pk=ride.pk).exists())
+            self.assertFalse(RideEvent.objects.using(ride._state.db)
+                             .filter(id_ride=ride.pk).exists())
+        self.assertTrue(Ride.objects.using(kept._state.db).filter(pk=kept.pk).exists())
+
+    def test_id_range_check(self):
+        self.assertEqual(check_ride_id_ranges(databases=ride_databases()), [])
+        create_ride(self.rider, using='default', id_ride=SHARD_ID_SPAN + 1)
+        self.assertEqual([error.id for error in check_ride_id_ranges(databases=ride_databases())],
+                         ['core.E001'])
+
+    def test_rebalance_resumes_from_the_id_map(self):
+        ride = create_ride(self.rider)
+        target = shard_for_point(14.5, 121.0)
+        with tempfile.TemporaryDirectory() as directory:
+            id_map = os.path.join(directory, 'id-map.jsonl')
+            # A run that crashed after the copy committed: the copy exists
+            # and is journaled, the source ride is still there.
+            copy = Ride.objects.using(target).create(
+                **{field: getattr(ride, field) for field in (
+                    'status', 'id_rider_id', 'pickup_latitude', 'pickup_longitude',
+                    'dropoff_latitude', 'dropoff_longitude', 'pickup_time',
+                )},
+            )
+            with open(id_map, 'w') as journal:
+                journal.write(json.dumps({'source': 'default', 'target': target,
+                                          'old_id': ride.pk, 'new_id': copy.pk}) + '\n')
+            call_command('rebalance_ride_shards', renumber=True, id_map=id_map,
+                         stdout=open(os.devnull, 'w'))
+        self.assertFalse(Ride.objects.using('default').exists())
+        self.assertEqual(list(Ride.objects.using(target).values_list('pk', flat=True)),
+                         [copy.pk])
+
+
+class RequestShapeRecorderTests(TestCase):
+    """RequestShapeRecorderMiddleware records JSON bodies only."""
+
+    def recorded(self, *args, **kwargs):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'shapes.jsonl')
+            with override_settings(LOADTEST_RECORD_FILE=path):
+                self.client.post(*args, **kwargs)
+            with open(path) as record_file:
+                return [json.loads(line) for line in record_file]
+
+    def test_json_body(self):
+        [shape] = self.recorded('/api/user/token/', {'email': 'a@example.com', 'password': 'x'},
+                                content_type='application/json')
+        self.assertEqual(shape['body'], json.dumps({'email': '{login_email}',
+                                                    'password': '{login_password}'}))
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=10)
+    def test_multipart_body_is_not_read(self):
+        upload = SimpleUploadedFile('users.csv', b'email\n' + b'a@example.com\n' * 10)
+        [shape] = self.recorded('/api/user/import/', {'file': upload})
+        self.assertIsNone(shape['body'])
+        self.assertEqual(shape['path'], '/api/user/import/')
+
+
+class HeatmapTests(TestCase):
+    """Heatmap rebuild and the high-water mark of record_ride()."""
+
+    databases = '__all__'  # the rebuild counts every ride database
+
+    def pickup_total(self):
+        return HeatmapCell.objects.get(kind='pickup', zoom=4, hour=ALL_HOURS).count
+
+    def test_rebuild_and_record(self):
+        rider = User.objects.create_user('rider@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            ride = create_ride(rider)
+        self.assertEqual(self.pickup_total(), 1)
+        heatmap.rebuild()
+        self.assertEqual(self.pickup_total(), 1)
+        # Recorded late, after the rebuild counted it.
+        heatmap.record_ride(ride, 'default')
+        self.assertEqual(self.pickup_total(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_ride(rider)
+        self.assertEqual(self.pickup_total(), 2)
+
+
+@override_settings(RIDE_EVENT_BUFFER_SECONDS=60)
+class RideEventBufferTests(TransactionTestCase):
+    """RideEventBuffer.flush() with batches the database rejects."""
+
+    def setUp(self):
+        rider = User.objects.create_user('rider@example.com')
+        self.ride = create_ride(rider)
+        self.gone = create_ride(rider)
+        self.buffer = RideEventBuffer()
+
+    def queue(self, *rides):
+        for ride in rides:
+            self.buffer.add(RideEvent(id_ride_id=ride.pk, description='Note'), 'default')
+
+    def test_events_of_deleted_rides_are_dropped(self):
+        delete_rides([self.gone.pk])
+        self.queue(self.ride, self.gone, self.ride)
+        with self.assertLogs('core.event_buffer', 'WARNING') as logs:
+            self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn(f'of ride {self.gone.pk}', logs.output[0])
+        self.assertEqual(len(self.buffer), 0)
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.event_count, 3)
+        self.assertEqual(check_summaries(Ride.objects.all()), {})
+
+    @override_settings(RIDE_EVENT_BUFFER_MAX_RETRIES=2, RIDE_EVENT_BUFFER_MAX_EVENTS=3)
+    def test_failed_batches_are_retried_within_limits(self):
+        with mock.patch.object(event_buffer, 'create_events', side_effect=OperationalError),\
+                self.assertLogs('core.event_buffer', 'ERROR'):
+            self.queue(self.ride, self.ride)
+            self.buffer.flush()
+            self.queue(self.ride, self.ride)
+            self.buffer.flush()
+            self.assertEqual(len(self.buffer), 3)
+            self.buffer.flush()
+            self.assertEqual(len(self.buffer), 0)
+        self.queue(self.ride)
+        self.assertEqual(self.buffer.flush(), 1)
+
+
+@unittest.skipIf(renderers.orjson is None, 'orjson is not installed')
+class FastJSONRendererTests(SimpleTestCase):
+    """FastJSONRenderer renders what JSONRenderer renders, or raises likewise."""
+
+    def assertSameOutput(self, data):
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_same_output(self):
+        self.assertSameOutput({
+            'id': 1, 'name': 'Ride  ', 'pickup_at': None, 'distance': 1e16,
+            'created_at': timezone.now(), 'values': numpy.array([1.5, 2.0]),
+        })
+
+    def test_non_finite_values_raise(self):
+        for data in ({'value': float('nan')}, {'value': [Decimal('Infinity')]},
+                     {'value': None, 'values': numpy.array([float('nan')])}):
+            with self.subTest(data=data), self.assertRaises(ValueError):
+                FastJSONRenderer().render(data)
+
+
+class BurstThrottle(TokenBucketThrottle):
+    scope = 'test'
+    rate = '3/m'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': request.ident}
+
+
+class TokenBucketThrottleTests(SimpleTestCase):
+    """Burst and refill of TokenBucketThrottle."""
+
+    def allowed(self, ident, now):
+        throttle = BurstThrottle()
+        with mock.patch('core.throttling.time.time', return_value=now):
+            allowed = throttle.allow_request(SimpleNamespace(ident=ident), None)
+        return allowed, None if allowed else throttle.wait()
+
+    def test_burst_then_refill(self):
+        for _request in range(3):
+            self.assertEqual(self.allowed('burst', 1000.0), (True, None))
+        allowed, wait = self.allowed('burst', 1000.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 20.0)
+        # One token refills every 20 seconds, up to the burst of 3.
+        self.assertFalse(self.allowed('burst', 1010.0)[0])
+        self.assertTrue(self.allowed('burst', 1020.0)[0])
+        self.assertFalse(self.allowed('burst', 1020.0)[0])
+        self.assertEqual([self.allowed('burst', 2000.0)[0] for _request in range(4)],
+                         [True, True, True, False])
+
+    def test_disabled(self):
+        with override_settings(THROTTLE_ENABLED=False):
+            self.assertEqual([self.allowed('disabled', 1000.0)[0] for _request in range(5)],
+                             [True] * 5)
+
+
+class LoadShedTests(SimpleTestCase):
+    """Slot files of core.loadshed."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(LOAD_SHED_DIR=directory.name, LOAD_SHED_BUDGET=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_acquire_and_release(self):
+        first = loadshed.acquire('ride_list', 'client-a')
+        self.assertEqual(len(first), 1)
+        self.assertIsNone(loadshed.acquire('ride_export', 'client-b'))
+        self.assertEqual(loadshed.holders(), {'client-a'})
+        second = loadshed.acquire('ride_list', 'client-b')
+        self.assertEqual(loadshed.holders(), {'client-a', 'client-b'})
+        loadshed.release(first + second)
+        self.assertEqual(loadshed.holders(), set())
+        slots = loadshed.acquire('ride_export', 'client-b')
+        self.assertEqual(len(slots), 2)
+        loadshed.release(slots)
+
+    def test_holders_does_not_lock_free_slots(self):
+        slots = loadshed.acquire('ride_list', 'client-a')
+        with mock.patch('core.loadshed.fcntl.flock', wraps=fcntl.flock) as flock:
+            self.assertEqual(loadshed.holders(), {'client-a'})
+        # Only the held slot was probed, and with a shared lock.
+        self.assertEqual([call.args[1] for call in flock.call_args_list],
+                         [fcntl.LOCK_SH | fcntl.LOCK_NB])
+        loadshed.release(slots)
+
+    def test_owner_left_by_a_killed_worker(self):
+        path = os.path.join(settings.LOAD_SHED_DIR, 'slot-0')
+        with open(path, 'w') as slot_file:
+            slot_file.write('client-a')
+        self.assertEqual(loadshed.holders(), set())
+
+
+class EventSummaryTests(TestCase):
+    """Stored event summaries against expected_summary() of the events."""
+
+    def setUp(self):
+        self.rider = User.objects.create_user('rider@example.com')
+
+    def assertSummaryMatches(self, ride):
+        self.assertEqual(check_summaries(Ride.objects.filter(pk=ride.pk)), {})
+        stored = Ride.objects.values(*Ride.EVENT_SUMMARY_FIELDS).get(pk=ride.pk)
+        self.assertEqual({field: getattr(ride, field) for field in Ride.EVENT_SUMMARY_FIELDS},
+                         stored)
+
+    def test_signal_path(self):
+        ride = create_ride(self.rider)
+        self.assertSummaryMatches(ride)
+        for status in ('pickup', 'dropoff', 'en-route'):
+            ride.status = status
+            ride.save()
+            self.assertSummaryMatches(ride)
+        self.assertEqual(ride.event_count, 4)
+        self.assertIsNotNone(ride.pickup_at)
+        self.assertIsNotNone(ride.dropoff_at)
+        self.assertEqual(ride.last_event_description,
+                         RideEvent.status_change_description('dropoff', 'en-route'))
+
+    def test_created_status(self):
+        picked_up = create_ride(self.rider, status='pickup')
+        self.assertSummaryMatches(picked_up)
+        self.assertIsNotNone(picked_up.pickup_at)
+        # Only a change to 'dropoff' sets dropoff_at (see STATUS_EVENTS).
+        dropped_off = create_ride(self.rider, status='dropoff')
+        self.assertSummaryMatches(dropped_off)
+        self.assertIsNone(dropped_off.dropoff_at)
+
+    @override_settings(RIDE_EVENT_WRITE_BEHIND=True)
+    def test_write_behind_path(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ride = create_ride(self.rider)
+            ride.status = 'pickup'
+            ride.save()
+        event_buffer.ride_event_buffer.flush()
+        ride.refresh_from_db()
+        self.assertEqual(ride.event_count, 2)
+        self.assertSummaryMatches(ride)
+
+    def test_stale_instance_save_keeps_the_summary(self):
+        ride = create_ride(self.rider)
+        stale = Ride.objects.get(pk=ride.pk)
+        create_events([RideEvent(id_ride_id=ride.pk, description='Note')], 'default')
+        stale.dropoff_latitude = 14.7
+        stale.save()
+        ride.refresh_from_db()
+        self.assertEqual((ride.event_count, ride.last_event_description, ride.dropoff_latitude),
+                         (2, 'Note', 14.7))
+        self.assertEqual(check_summaries(Ride.objects.filter(pk=ride.pk)), {})
+
+    def test_repair(self):
+        ride = create_ride(self.rider)
+        Ride.objects.filter(pk=ride.pk).update(event_count=7, dropoff_at=timezone.now())
+        mismatches = check_summaries(Ride.objects.all(), repair=True)
+        self.assertEqual(set(mismatches[ride.pk]), {'event_count', 'dropoff_at'})
+        self.assertEqual(mismatches[ride.pk]['event_count'], (7, 1))
+        self.assertEqual(check_summaries(Ride.objects.all()), {})
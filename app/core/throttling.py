@@ -0,0 +1,112 @@
+"""
+Token bucket throttles for the ride and token APIs.
+
+Rates use DRF's "N/period" format in DEFAULT_THROTTLE_RATES: a bucket
+holds up to N requests and refills at N per period, so a client may
+burst N requests and then sustain the rate. Throttled requests get 429
+with Retry-After (the time until one request's worth has refilled).
+
+Buckets live in a dict in each worker process, so with 4 workers a
+client may get up to 4 times the rate when its requests are spread
+over them. Setting THROTTLE_CACHE to a CACHES alias keeps the buckets
+in that cache instead, shared by every worker; updates are not atomic
+there, so concurrent requests of one client may occasionally both be
+let through. THROTTLE_ENABLED = False turns every throttle off (the
+load test replays all requests with one token and IP).
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+from core import metrics
+
+# In-process buckets are pruned once there are this many.
+MAX_LOCAL_BUCKETS = 10000
+
+
+class LocalBuckets:
+    """Token buckets of this process: {key: (tokens, updated, expires)}."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def get(self, key):
+        return self._buckets.get(key)
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            if len(self._buckets) >= MAX_LOCAL_BUCKETS:
+                now = time.monotonic()
+                # Drop buckets that have refilled completely.
+                self._buckets = {
+                    bucket_key: state for bucket_key, state in self._buckets.items()
+                    if state[2] > now
+                }
+            self._buckets[key] = value + (time.monotonic() + timeout,)
+
+
+local_buckets = LocalBuckets()
+
+
+def bucket_store():
+    alias = getattr(settings, 'THROTTLE_CACHE', None)
+    return caches[alias] if alias else local_buckets
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """SimpleRateThrottle with a token bucket instead of a request history."""
+
+    def allow_request(self, request, view):
+        if self.rate is None or not getattr(settings, 'THROTTLE_ENABLED', True):
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        store = bucket_store()
+        refill = self.num_requests / self.duration
+        now = time.time()
+        state = store.get(self.key)
+        tokens, updated = (self.num_requests, now) if state is None else state[:2]
+        tokens = min(self.num_requests, tokens + (now - updated) * refill)
+        if tokens >= 1:
+            tokens -= 1
+            self._wait = None
+        else:
+            self._wait = (1 - tokens) / refill
+        store.set(self.key, (tokens, now), (self.num_requests - tokens) / refill + 1)
+        if self._wait is not None:
+            metrics.inc('http_requests_throttled_total', scope=self.scope)
+            return False
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+class RideTokenThrottle(TokenBucketThrottle):
+    """Per auth token."""
+    scope = 'ride_token'
+
+    def get_cache_key(self, request, view):
+        token = getattr(request.auth, 'key', None)
+        if token is None:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': token}
+
+
+class RideIPThrottle(TokenBucketThrottle):
+    """Per client IP, across tokens."""
+    scope = 'ride_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class LoginIPThrottle(RideIPThrottle):
+    """Per client IP, for token requests (password attempts)."""
+    scope = 'login_ip'
@@ -1,23 +1,17 @@
-from django.db import connection
+import json
+import os
+
+from django.db import connections
 from django.contrib.auth import get_user_model
 
+from core.sharding import ride_databases
+
 User = get_user_model()
 
-def get_long_trips_report():
-    """
-    Get report of trips that took more than 1 hour from pickup to dropoff.
-    Groups by month and driver.
-    """
-    
-    # Get the actual table name from the User model
-    user_table = User._meta.db_table
-    
-    # SQLite compatible SQL - handles both patterns
-    sql = f"""
+LONG_TRIPS_SQL = """
     SELECT 
         strftime('%Y-%m', pickup_event.created_at) as month,
-        driver.first_name || ' ' || driver.last_name as driver_name,
-        driver.id_user as driver_id,
+        r.id_driver as driver_id,
         COUNT(DISTINCT r.id_ride) as trip_count
     FROM ride r
     INNER JOIN ride_event pickup_event ON r.id_ride = pickup_event.id_ride 
@@ -25,21 +19,43 @@ def get_long_trips_report():
              OR pickup_event.description LIKE "Ride created with status 'pickup'%")
     INNER JOIN ride_event dropoff_event ON r.id_ride = dropoff_event.id_ride 
         AND dropoff_event.description LIKE "%to 'dropoff'%"
-    INNER JOIN {user_table} driver ON r.id_driver = driver.id_user
     WHERE 
-        (julianday(dropoff_event.created_at) - julianday(pickup_event.created_at)) * 24 > 1
-    GROUP BY strftime('%Y-%m', pickup_event.created_at), driver.id_user
-    ORDER BY month DESC, driver_name
+        r.id_driver IS NOT NULL
+        AND (julianday(dropoff_event.created_at) - julianday(pickup_event.created_at)) * 24 > 1
+    GROUP BY strftime('%Y-%m', pickup_event.created_at), r.id_driver
+"""
+
+
+def get_long_trips_report():
     """
-    
-    with connection.cursor() as cursor:
-        cursor.execute(sql)
-        columns = [col[0] for col in cursor.description]
-        
-        return [
-            dict(zip(columns, row))
-            for row in cursor.fetchall()
-        ]
+    Get report of trips that took more than 1 hour from pickup to dropoff.
+    Groups by month and driver.
+
+    Trips are counted in every database holding rides (see core.sharding)
+    and drivers are looked up in the default database, where users live.
+    """
+    counts = {}
+    for alias in ride_databases():
+        # SQLite compatible SQL - handles both patterns
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LONG_TRIPS_SQL)
+            for month, driver_id, trip_count in cursor.fetchall():
+                counts[month, driver_id] = counts.get((month, driver_id), 0) + trip_count
+
+    drivers = User.objects.in_bulk({driver_id for _month, driver_id in counts})
+    results = [
+        {
+            'month': month,
+            'driver_name': f'{drivers[driver_id].first_name} {drivers[driver_id].last_name}',
+            'driver_id': driver_id,
+            'trip_count': trip_count,
+        }
+        for (month, driver_id), trip_count in counts.items()
+        if driver_id in drivers
+    ]
+    results.sort(key=lambda row: row['driver_name'])
+    results.sort(key=lambda row: row['month'], reverse=True)
+    return results
 
 
 def get_long_trips_report_formatted():
@@ -58,4 +74,27 @@ def get_long_trips_report_formatted():
         
         return output
     except Exception as e:
-        return f"Error generating report: {str(e)}"
\ No newline at end of file
+        return f"Error generating report: {str(e)}"
+
+
+class Checkpoint:
+    """JSON file recording the progress of a long-running command so it can resume."""
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        if path and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                self.state = json.load(checkpoint_file)
+
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+
+    def save(self, **values):
+        self.state.update(values)
+        if not self.path:
+            return
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as checkpoint_file:
+            json.dump(self.state, checkpoint_file)
+        os.replace(tmp_path, self.path)
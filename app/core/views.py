@@ -0,0 +1,94 @@
+"""
+Views of the core app: request profile admin pages and the metrics endpoint.
+"""
+import datetime
+import hmac
+from functools import wraps
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import render
+
+from core.metrics import metrics_dir, render_prometheus
+from core.profiling import (
+    PROFILE_PARAM,
+    list_profile_ids,
+    load_profile,
+    profile_path,
+)
+from ride.permissions import IsAdminRole
+
+
+def admin_role_required(view):
+    """
+    Restrict a view to users passing IsAdminRole, like the profiled
+    requests themselves; admin.site.admin_view only checks is_staff.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not IsAdminRole().has_permission(SimpleNamespace(user=request.user), None):
+            raise PermissionDenied
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _with_started_at(summary):
+    summary['started_at'] = datetime.datetime.fromtimestamp(
+        summary['started'], tz=datetime.timezone.utc
+    )
+    return summary
+
+
+@admin_role_required
+def request_profile_list(request):
+    """List stored profiles, newest first."""
+    profiles = [
+        _with_started_at(summary)
+        for summary in map(load_profile, list_profile_ids()) if summary is not None
+    ]
+    return render(request, 'admin/request_profiles/list.html', {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'profiles': profiles,
+        'profile_param': PROFILE_PARAM,
+    })
+
+
+@admin_role_required
+def request_profile_detail(request, profile_id):
+    """Show one profile, or download its .prof file with ?download=1."""
+    if request.GET.get('download'):
+        path = profile_path(profile_id, '.prof')
+        try:
+            return FileResponse(open(path, 'rb'), as_attachment=True,
+                                filename=f'{profile_id}.prof')
+        except (TypeError, FileNotFoundError):
+            raise Http404
+    summary = load_profile(profile_id)
+    if summary is None:
+        raise Http404
+    return render(request, 'admin/request_profiles/detail.html', {
+        **admin.site.each_context(request),
+        'title': f"{summary['method']} {summary['path']}",
+        'profile': _with_started_at(summary),
+    })
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of the metrics of every worker process,
+    for scrapers sending settings.METRICS_TOKEN as a bearer token.
+    """
+    if not metrics_dir():
+        raise Http404
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        # View names, rates and shard layout are not public.
+        return HttpResponse(status=403)
+    if not hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(render_prometheus(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
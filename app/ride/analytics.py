@@ -0,0 +1,173 @@
+"""
+Ride analytics computed with vectorized NumPy aggregation.
+
+Columns are pulled in bulk with values_list() and chunked iteration,
+then distances, durations and per-group percentiles are computed on
+whole arrays instead of per-row Python loops.
+"""
+import datetime
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+PERCENTILES = (50, 90, 95)
+CHUNK_SIZE = 20000
+
+COLUMNS = (
+    'id_driver',
+    'pickup_time',
+    'pickup_at',
+    'dropoff_at',
+    'pickup_latitude',
+    'pickup_longitude',
+    'dropoff_latitude',
+    'dropoff_longitude',
+)
+
+
+def _timestamps(values):
+    return np.fromiter(
+        (value.timestamp() if value is not None else np.nan for value in values),
+        dtype=np.float64,
+        count=len(values),
+    )
+
+
+def _floats(values):
+    return np.fromiter(
+        (value if value is not None else np.nan for value in values),
+        dtype=np.float64,
+        count=len(values),
+    )
+
+
+def load_ride_arrays(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Load the columns needed for analytics into NumPy arrays.
+
+    Pickup and dropoff times are the first pickup event and the last
+    dropoff event of each ride, read from its event summary (see
+    core.event_summary). Missing drivers are stored as -1 and missing
+    times as NaN.
+    """
+    rows = (
+        queryset.order_by()
+        .values_list(*COLUMNS)
+        .iterator(chunk_size=chunk_size)
+    )
+
+    chunks = []
+    while True:
+        chunk = [row for _index, row in zip(range(chunk_size), rows)]
+        if not chunk:
+            break
+        (drivers, pickup_time, pickup_at, dropoff_at,
+         pickup_lat, pickup_lon, dropoff_lat, dropoff_lon) = zip(*chunk)
+        chunks.append({
+            'driver': np.fromiter(
+                (driver if driver is not None else -1 for driver in drivers),
+                dtype=np.int64, count=len(drivers),
+            ),
+            'pickup_time': _timestamps(pickup_time),
+            'pickup_at': _timestamps(pickup_at),
+            'dropoff_at': _timestamps(dropoff_at),
+            'pickup_latitude': _floats(pickup_lat),
+            'pickup_longitude': _floats(pickup_lon),
+            'dropoff_latitude': _floats(dropoff_lat),
+            'dropoff_longitude': _floats(dropoff_lon),
+        })
+
+    if not chunks:
+        return {key: np.empty(0, dtype=np.int64 if key == 'driver' else np.float64)
+                for key in ('driver',) + COLUMNS[1:]}
+    return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between coordinate arrays."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def grouped_percentiles(keys, values, groups, percentiles=PERCENTILES):
+    """
+    Percentiles of values per key (linear interpolation, like np.percentile).
+
+    Returns an array of shape (len(groups), len(percentiles)); groups
+    without any non-NaN value get NaN.
+    """
+    result = np.full((len(groups), len(percentiles)), np.nan)
+    mask = ~np.isnan(values)
+    keys, values = keys[mask], values[mask]
+    if not len(values):
+        return result
+
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    present, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+
+    for column, percentile in enumerate(percentiles):
+        position = starts + (counts - 1) * (percentile / 100)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        weight = position - lower
+        values_at = values[lower] + (values[upper] - values[lower]) * weight
+        result[np.searchsorted(groups, present), column] = values_at
+    return result
+
+
+def compute_ride_stats(arrays, group_by='driver'):
+    """
+    Aggregate ride arrays per driver or per pickup day.
+
+    Returns a list of dicts sorted by group key.
+    """
+    if group_by == 'driver':
+        keys = arrays['driver']
+    elif group_by == 'day':
+        keys = np.floor(arrays['pickup_time'] / 86400).astype(np.int64)
+    else:
+        raise ValueError(f"Unsupported group_by '{group_by}'. Use 'driver' or 'day'.")
+
+    durations = arrays['dropoff_at'] - arrays['pickup_at']
+    durations[durations < 0] = np.nan
+    distances = haversine_km(
+        arrays['pickup_latitude'], arrays['pickup_longitude'],
+        arrays['dropoff_latitude'], arrays['dropoff_longitude'],
+    )
+
+    groups, inverse, ride_counts = np.unique(keys, return_inverse=True, return_counts=True)
+    completed = ~np.isnan(durations)
+    completed_counts = np.bincount(inverse, weights=completed, minlength=len(groups))
+    distance_totals = np.bincount(inverse, weights=distances, minlength=len(groups))
+    duration_percentiles = grouped_percentiles(keys, durations, groups)
+
+    results = []
+    for index, key in enumerate(groups.tolist()):
+        if group_by == 'driver':
+            group = {'id_driver': key if key != -1 else None}
+        else:
+            group = {'day': (datetime.date(1970, 1, 1) + datetime.timedelta(days=key)).isoformat()}
+        group.update({
+            'ride_count': int(ride_counts[index]),
+            'completed_count': int(completed_counts[index]),
+            'distance_total_km': float(distance_totals[index]),
+            'distance_mean_km': float(distance_totals[index] / ride_counts[index]),
+        })
+        for column, percentile in enumerate(PERCENTILES):
+            value = duration_percentiles[index, column]
+            group[f'duration_p{percentile}_s'] = None if math.isnan(value) else float(value)
+        results.append(group)
+    return results
+
+
+def get_ride_stats(querysets, group_by='driver'):
+    """Load rides from one queryset per database and aggregate them per driver or day."""
+    loaded = [load_ride_arrays(queryset) for queryset in querysets]
+    arrays = {key: np.concatenate([chunk[key] for chunk in loaded]) for key in loaded[0]}
+    return compute_ride_stats(arrays, group_by=group_by)
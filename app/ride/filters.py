@@ -0,0 +1,27 @@
+"""
+Filters for the ride API.
+"""
+import django_filters
+from django.contrib.auth import get_user_model
+
+from core.models import Ride
+from core.sharding import sharding_enabled
+
+
+class RideFilter(django_filters.FilterSet):
+    """Filter rides by status and rider email."""
+    id_rider__email = django_filters.CharFilter(method='filter_rider_email')
+
+    class Meta:
+        model = Ride
+        fields = {
+            'status': ['exact'],
+        }
+
+    def filter_rider_email(self, queryset, name, value):
+        if not sharding_enabled():
+            return queryset.filter(id_rider__email=value)
+        # Users live in the default database, so resolve the rider first
+        # instead of joining across databases.
+        rider_ids = get_user_model().objects.filter(email=value).values_list('id_user', flat=True)
+        return queryset.filter(id_rider__in=list(rider_ids))
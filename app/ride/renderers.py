@@ -0,0 +1,22 @@
+from rest_framework.renderers import BaseRenderer
+
+from core.renderers import FastJSONRenderer
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Render data as newline-delimited JSON: one line per list item."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+    json_renderer = FastJSONRenderer()
+
+    def render_line(self, item):
+        return self.json_renderer.render(item) + b'\n'
+
+    def render_lines(self, items):
+        return b''.join(self.render_line(item) for item in items)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return self.render_lines(data if isinstance(data, list) else [data])
@@ -32,4 +32,46 @@ class RideSerializer(serializers.ModelSerializer):
             'pickup_time',
             'events',  
         ]
-        read_only_fields = ['id_ride']
\ No newline at end of file
+        read_only_fields = ['id_ride']
+
+    def create(self, validated_data):
+        """
+        Create the ride through save() so the shard router sees its pickup point.
+
+        Users are assigned by id: assigning user instances would pin the
+        ride to the users' database.
+        """
+        data = dict(validated_data)
+        for field in ('id_rider', 'id_driver'):
+            if field in data:
+                user = data.pop(field)
+                data[f'{field}_id'] = user.pk if user is not None else None
+        ride = Ride(**data)
+        ride.save()
+        return ride
+
+
+class RideSummarySerializer(RideSerializer):
+    """
+    Compact Ride serializer: the stored event summary instead of the
+    events, so rides are serialized without loading any events.
+    """
+    events = None
+
+    class Meta(RideSerializer.Meta):
+        fields = [
+            field for field in RideSerializer.Meta.fields if field != 'events'
+        ] + list(Ride.EVENT_SUMMARY_FIELDS)
+
+class RideTransitionSerializer(serializers.Serializer):
+    """Serializer for one compare-and-set ride status transition."""
+    id_ride = serializers.IntegerField()
+    from_status = serializers.ChoiceField(choices=Ride.STATUS_CHOICES)
+    to_status = serializers.ChoiceField(choices=Ride.STATUS_CHOICES)
+
+
+class RideTransitionResultSerializer(serializers.Serializer):
+    """Outcome of one batch transition item."""
+    id_ride = serializers.IntegerField()
+    result = serializers.ChoiceField(choices=['updated', 'conflict', 'not_found'])
+    status = serializers.CharField(allow_null=True)
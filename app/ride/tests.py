@@ -0,0 +1,305 @@
+"""
+Tests for the ride API: analytics (against a plain-Python reference),
+batch status transitions and the event summary of ride lists.
+"""
+import math
+from datetime import datetime, timedelta, timezone
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.event_summary import check_summaries, create_events
+from core.models import Ride, RideEvent, User
+from ride.analytics import EARTH_RADIUS_KM, PERCENTILES, get_ride_stats, load_ride_arrays
+from ride.views import MAX_BATCH_TRANSITIONS
+
+BASE_TIME = datetime(2026, 3, 1, 8, 0, tzinfo=timezone.utc)
+
+
+def reference_distance(ride):
+    lat1, lon1, lat2, lon2 = map(math.radians, (
+        ride.pickup_latitude, ride.pickup_longitude,
+        ride.dropoff_latitude, ride.dropoff_longitude,
+    ))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def reference_percentile(values, percentile):
+    values = sorted(values)
+    position = (len(values) - 1) * percentile / 100
+    lower, upper = math.floor(position), math.ceil(position)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def reference_times(ride):
+    """First pickup and last dropoff event time of a ride, from its events."""
+    pickups, dropoffs = [], []
+    for event in ride.events.all():
+        if (event.description.endswith("to 'pickup'")
+                or event.description == RideEvent.created_description('pickup')):
+            pickups.append(event.created_at)
+        elif event.description.endswith("to 'dropoff'"):
+            dropoffs.append(event.created_at)
+    return min(pickups, default=None), max(dropoffs, default=None)
+
+
+def reference_stats(rides, group_by):
+    """get_ride_stats() computed row by row in plain Python."""
+    groups = {}
+    for ride in rides:
+        if group_by == 'driver':
+            key = ride.id_driver_id if ride.id_driver_id is not None else -1
+        else:
+            key = ride.pickup_time.date().isoformat()
+        groups.setdefault(key, []).append(ride)
+
+    results = []
+    for key in sorted(groups):
+        group_rides = groups[key]
+        durations = []
+        for ride in group_rides:
+            pickup_at, dropoff_at = reference_times(ride)
+            if pickup_at is None or dropoff_at is None:
+                continue
+            duration = (dropoff_at - pickup_at).total_seconds()
+            if duration >= 0:
+                durations.append(duration)
+        distance_total = sum(reference_distance(ride) for ride in group_rides)
+        if group_by == 'driver':
+            result = {'id_driver': key if key != -1 else None}
+        else:
+            result = {'day': key}
+        result.update({
+            'ride_count': len(group_rides),
+            'completed_count': len(durations),
+            'distance_total_km': distance_total,
+            'distance_mean_km': distance_total / len(group_rides),
+        })
+        for percentile in PERCENTILES:
+            result[f'duration_p{percentile}_s'] = (
+                reference_percentile(durations, percentile) if durations else None
+            )
+        results.append(result)
+    return results
+
+
+class RideStatsTests(TestCase):
+    """get_ride_stats() on rides loaded from the database."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = User.objects.create_user('rider@example.com')
+        cls.drivers = [
+            User.objects.create_user(f'driver-{index}@example.com', role='driver')
+            for index in range(2)
+        ]
+
+    def create_ride(self, driver, day=0, offset=0.0, pickup_after=None, dropoff_after=None,
+                    dropoff_events=1):
+        """
+        Create a ride with its events. pickup_after/dropoff_after are
+        minutes after the pickup time, None for no such event.
+        """
+        pickup_time = BASE_TIME + timedelta(days=day, minutes=offset)
+        ride = Ride.objects.create(
+            id_rider=self.rider, id_driver=driver,
+            pickup_latitude=14.5 + offset / 100, pickup_longitude=121.0,
+            dropoff_latitude=14.6, dropoff_longitude=121.1 + offset / 50,
+            pickup_time=pickup_time,
+        )
+        events = []
+        if pickup_after is not None:
+            events.append(RideEvent(
+                id_ride=ride, created_at=pickup_time + timedelta(minutes=pickup_after),
+                description=RideEvent.status_change_description('en-route', 'pickup'),
+            ))
+        if dropoff_after is not None:
+            for number in range(dropoff_events):
+                events.append(RideEvent(
+                    id_ride=ride,
+                    created_at=pickup_time + timedelta(minutes=dropoff_after - number),
+                    description=RideEvent.status_change_description('pickup', 'dropoff'),
+                ))
+        create_events(events, 'default')
+        return ride
+
+    def assertStatsEqual(self, actual, expected):
+        self.assertEqual(len(actual), len(expected))
+        for actual_group, expected_group in zip(actual, expected):
+            self.assertEqual(actual_group.keys(), expected_group.keys())
+            for key, value in expected_group.items():
+                if isinstance(value, float):
+                    self.assertAlmostEqual(actual_group[key], value, places=6, msg=key)
+                else:
+                    self.assertEqual(actual_group[key], value, msg=key)
+
+    def test_empty_input(self):
+        for group_by in ('driver', 'day'):
+            self.assertEqual(get_ride_stats([Ride.objects.none()], group_by=group_by), [])
+        arrays = load_ride_arrays(Ride.objects.none())
+        self.assertEqual(len(arrays['driver']), 0)
+
+    def test_matches_reference(self):
+        rides = [
+            self.create_ride(self.drivers[0], pickup_after=2, dropoff_after=30),
+            self.create_ride(self.drivers[0], offset=5, pickup_after=1, dropoff_after=45,
+                             dropoff_events=3),
+            self.create_ride(self.drivers[0], day=1, offset=9, pickup_after=4, dropoff_after=12),
+            self.create_ride(self.drivers[1], offset=3, pickup_after=0, dropoff_after=20),
+            self.create_ride(self.drivers[1], day=2, offset=1, pickup_after=3, dropoff_after=90),
+            # Missing driver.
+            self.create_ride(None, offset=7, pickup_after=5, dropoff_after=25),
+            self.create_ride(None, day=1, offset=2, pickup_after=1, dropoff_after=33),
+            # No dropoff, no pickup, and dropoff before pickup: NaN durations.
+            self.create_ride(self.drivers[1], offset=4, pickup_after=6),
+            self.create_ride(self.drivers[0], day=2, offset=8),
+            self.create_ride(self.drivers[1], day=1, offset=6, pickup_after=30, dropoff_after=10),
+        ]
+        for group_by in ('driver', 'day'):
+            with self.subTest(group_by=group_by):
+                self.assertStatsEqual(
+                    get_ride_stats([Ride.objects.all()], group_by=group_by),
+                    reference_stats(rides, group_by),
+                )
+
+    def test_group_without_completed_rides(self):
+        rides = [self.create_ride(None, pickup_after=1), self.create_ride(None)]
+        stats = get_ride_stats([Ride.objects.all()])
+        self.assertStatsEqual(stats, reference_stats(rides, 'driver'))
+        self.assertEqual(stats[0]['completed_count'], 0)
+        self.assertIsNone(stats[0]['duration_p50_s'])
+
+    def test_pickup_and_dropoff_times(self):
+        """The first pickup event and the last dropoff event are used."""
+        ride = self.create_ride(self.drivers[0], pickup_after=2, dropoff_after=40,
+                                dropoff_events=3)
+        arrays = load_ride_arrays(Ride.objects.filter(pk=ride.pk))
+        self.assertEqual(arrays['pickup_at'][0], (ride.pickup_time + timedelta(minutes=2)).timestamp())
+        self.assertEqual(arrays['dropoff_at'][0], (ride.pickup_time + timedelta(minutes=40)).timestamp())
+
+
+class RideTransitionTests(TestCase):
+    """POST /api/ride/rides/transitions/: compare-and-set status updates."""
+
+    url = '/api/ride/rides/transitions/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin@example.com', role='admin')
+        cls.token = Token.objects.create(user=cls.admin)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.rides = [
+            Ride.objects.create(
+                id_rider_id=self.admin.pk, pickup_latitude=14.5, pickup_longitude=121.0,
+                dropoff_latitude=14.6, dropoff_longitude=121.1, pickup_time=BASE_TIME,
+            )
+            for _index in range(3)
+        ]
+
+    def post(self, transitions):
+        return self.client.post(self.url, transitions, format='json')
+
+    def events(self, ride):
+        return list(RideEvent.objects.filter(id_ride=ride).order_by('id_ride_event')
+                    .values_list('description', flat=True))
+
+    def test_stale_from_status_is_not_applied(self):
+        ride = self.rides[0]
+        response = self.post([{'id_ride': ride.pk, 'from_status': 'pickup',
+                               'to_status': 'dropoff'}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [
+            {'id_ride': ride.pk, 'result': 'conflict', 'status': 'en-route'},
+        ])
+        ride.refresh_from_db()
+        self.assertEqual(ride.status, 'en-route')
+        self.assertEqual(self.events(ride), [RideEvent.created_description('en-route')])
+
+    def test_mixed_batch(self):
+        first, second, third = self.rides
+        response = self.post([
+            {'id_ride': first.pk, 'from_status': 'en-route', 'to_status': 'pickup'},
+            # Applied in order: sees the status set by the item before it.
+            {'id_ride': first.pk, 'from_status': 'pickup', 'to_status': 'dropoff'},
+            {'id_ride': second.pk, 'from_status': 'dropoff', 'to_status': 'pickup'},
+            {'id_ride': 10 ** 6, 'from_status': 'en-route', 'to_status': 'pickup'},
+            # Same status: applied, but nothing changed, so no event.
+            {'id_ride': third.pk, 'from_status': 'en-route', 'to_status': 'en-route'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(item['result'], item['status']) for item in response.json()], [
+            ('updated', 'dropoff'),
+            ('updated', 'dropoff'),
+            ('conflict', 'en-route'),
+            ('not_found', None),
+            ('updated', 'en-route'),
+        ])
+        created = RideEvent.created_description('en-route')
+        self.assertEqual(self.events(first), [
+            created,
+            RideEvent.status_change_description('en-route', 'pickup'),
+            RideEvent.status_change_description('pickup', 'dropoff'),
+        ])
+        self.assertEqual(self.events(second), [created])
+        self.assertEqual(self.events(third), [created])
+        first.refresh_from_db()
+        self.assertEqual(first.event_count, 3)
+        self.assertEqual(check_summaries(Ride.objects.all()), {})
+
+    def test_batch_size_limit(self):
+        ride = self.rides[0]
+        item = {'id_ride': ride.pk, 'from_status': 'en-route', 'to_status': 'pickup'}
+        response = self.post([item] * (MAX_BATCH_TRANSITIONS + 1))
+        self.assertEqual(response.status_code, 400)
+        ride.refresh_from_db()
+        self.assertEqual(ride.status, 'en-route')
+        self.assertEqual(len(self.events(ride)), 1)
+
+        response = self.post([item] * MAX_BATCH_TRANSITIONS)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['result'] for result in response.json()],
+                         ['updated'] + ['conflict'] * (MAX_BATCH_TRANSITIONS - 1))
+        self.assertEqual(len(self.events(ride)), 2)
+
+
+class RideEventSummaryListTests(TestCase):
+    """GET /api/ride/rides/?events=summary."""
+
+    def setUp(self):
+        admin = User.objects.create_user('admin@example.com', role='admin')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=admin).key}')
+        self.ride = Ride.objects.create(
+            id_rider_id=admin.pk, pickup_latitude=14.5, pickup_longitude=121.0,
+            dropoff_latitude=14.6, dropoff_longitude=121.1, pickup_time=BASE_TIME,
+        )
+        self.ride.status = 'pickup'
+        self.ride.save()
+
+    def test_summary_without_events(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/ride/rides/', {'events': 'summary'})
+        self.assertEqual(response.status_code, 200)
+        [ride] = response.json()
+        self.assertNotIn('events', ride)
+        self.assertEqual(ride['event_count'], 2)
+        self.assertEqual(ride['last_event_description'],
+                         RideEvent.status_change_description('en-route', 'pickup'))
+        self.assertIsNotNone(ride['pickup_at'])
+        self.assertFalse([query for query in queries if 'ride_event' in query['sql']])
+
+    def test_full_events(self):
+        response = self.client.get('/api/ride/rides/')
+        self.assertEqual(len(response.json()[0]['events']), 2)
+
+    def test_invalid_mode(self):
+        response = self.client.get('/api/ride/rides/', {'events': 'some'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,74 @@
+"""
+Batch ride status transitions.
+
+Each transition is a compare-and-set UPDATE (only applied when the ride
+still has the expected status), all in one transaction, and the
+matching RideEvent rows are inserted with a single bulk_create (and
+folded into the rides' event summaries). This bypasses the per-save
+signals in core.signals on purpose.
+
+With sharding enabled the batch is split per shard, with one
+transaction per shard.
+"""
+from django.db import transaction
+
+from core import metrics
+from core.event_summary import create_events
+from core.models import Ride, RideEvent
+from core.sharding import shard_for_ride_id
+from core.sqlite import write_transaction
+
+
+def apply_transitions(transitions):
+    """
+    Apply [{id_ride, from_status, to_status}] in order.
+
+    Returns one {id_ride, result, status} dict per item where result is
+    'updated', 'conflict' (ride has a different status) or 'not_found',
+    and status is the ride's status after the batch.
+    """
+    by_database = {}
+    for position, item in enumerate(transitions):
+        by_database.setdefault(shard_for_ride_id(item['id_ride']), []).append((position, item))
+
+    results = [None] * len(transitions)
+    for using, items in by_database.items():
+        for (position, _item), result in zip(items, _apply(using, [item for _position, item in items])):
+            results[position] = result
+    return results
+
+
+def _apply(using, transitions):
+    """Apply transitions that all belong to one database."""
+    results, events = [], []
+
+    with write_transaction(using=using):
+        for item in transitions:
+            updated = Ride.objects.using(using).filter(
+                pk=item['id_ride'], status=item['from_status']
+            ).update(status=item['to_status'])
+            results.append({'id_ride': item['id_ride'], 'result': 'updated' if updated else None})
+            if updated and item['from_status'] != item['to_status']:
+                events.append(RideEvent(
+                    id_ride_id=item['id_ride'],
+                    description=RideEvent.status_change_description(
+                        item['from_status'], item['to_status']
+                    ),
+                ))
+
+        create_events(events, using)
+        transaction.on_commit(
+            lambda: metrics.inc('ride_events_created_total', len(events), source='transitions'),
+            using=using,
+        )
+        statuses = dict(
+            Ride.objects.using(using).filter(
+                pk__in={result['id_ride'] for result in results}
+            ).values_list('id_ride', 'status')
+        )
+
+    for result in results:
+        result['status'] = statuses.get(result['id_ride'])
+        if result['result'] is None:
+            result['result'] = 'conflict' if result['status'] else 'not_found'
+    return results
@@ -11,5 +11,11 @@ router.register('rides', views.RideViewSet)
 app_name = 'ride'
 
 urlpatterns = [
+    path('events/feed/', views.RideEventFeedView.as_view(), name='ride-event-feed'),
+    path(
+        'heatmap/<str:kind>/<int:zoom>/<int:x>/<int:y>/',
+        views.HeatmapTileView.as_view(),
+        name='ride-heatmap-tile',
+    ),
     path('', include(router.urls)),
 ]
\ No newline at end of file
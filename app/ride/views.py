@@ -1,10 +1,55 @@
+import itertools
+
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema_view, extend_schema, OpenApiParameter
 from rest_framework import viewsets, authentication, permissions, filters
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from .serializers import RideSerializer
+from .analytics import get_ride_stats
+from .filters import RideFilter
+from .serializers import (
+    RideSerializer,
+    RideSummarySerializer,
+    RideTransitionSerializer,
+    RideTransitionResultSerializer,
+)
+from .transitions import apply_transitions
 from .permissions import IsAdminRole
+from .renderers import NDJSONRenderer
+from core import heatmap, metrics
+from core.feed import iter_event_feed, parse_cursor
 from core.models import Ride
+from core.purge import delete_rides
+from core.sharding import (
+    ShardedRideList,
+    ride_databases,
+    shard_for_point,
+    shard_for_ride_id,
+    sharding_enabled,
+)
+from core.sqlite import write_transaction
+from core.throttling import RideIPThrottle, RideTokenThrottle
+
+MAX_BATCH_TRANSITIONS = 500
+NDJSON_CHUNK_SIZE = 1000
+
+EVENTS_PARAMETER = OpenApiParameter(
+    name='events',
+    description='Use "summary" for the event count, latest event and pickup/dropoff '
+                'times instead of every event (no events are loaded)',
+    required=False,
+    type=str,
+    enum=['full', 'summary'],
+)
 
 
 @extend_schema_view(
@@ -41,13 +86,49 @@ from core.models import Ride
                 type=str,
                 enum=['pickup_time', '-pickup_time']
             ),
+
+            # GET /api/ride/rides/?format=ndjson (stream every matching ride, one per line)
+
+            OpenApiParameter(
+                name='format',
+                description='Use "ndjson" to stream all matching rides as newline-delimited '
+                            'JSON instead of building one JSON array',
+                required=False,
+                type=str,
+                enum=['json', 'ndjson']
+            ),
+
+            # GET /api/ride/rides/?events=summary (event summary instead of every event)
+
+            EVENTS_PARAMETER,
         ]
     ),
     create=extend_schema(tags=['rides']),
-    retrieve=extend_schema(tags=['rides']),
+    retrieve=extend_schema(tags=['rides'], parameters=[EVENTS_PARAMETER]),
     update=extend_schema(tags=['rides']),
     partial_update=extend_schema(tags=['rides']),
     destroy=extend_schema(tags=['rides']),
+    transitions=extend_schema(
+        tags=['rides'],
+        description="Apply queued status changes as compare-and-set updates in one "
+                    "transaction. Each item reports 'updated', 'conflict' or 'not_found'.",
+        request=RideTransitionSerializer(many=True),
+        responses=RideTransitionResultSerializer(many=True),
+    ),
+    analytics=extend_schema(
+        tags=['rides'],
+        description="Per-driver or per-day ride counts, trip distances and "
+                    "pickup-to-dropoff duration percentiles",
+        parameters=[
+            OpenApiParameter(
+                name='group_by',
+                description='Aggregate per driver or per pickup day',
+                required=False,
+                type=str,
+                enum=['driver', 'day']
+            ),
+        ]
+    ),
 )
 class RideViewSet(viewsets.ModelViewSet):
     """ViewSet for managing rides."""
@@ -55,13 +136,246 @@ class RideViewSet(viewsets.ModelViewSet):
     queryset = Ride.objects.select_related('id_rider', 'id_driver').prefetch_related('events')
     authentication_classes = [authentication.TokenAuthentication]
     permission_classes = [permissions.IsAuthenticated, IsAdminRole]
+    throttle_classes = [RideTokenThrottle, RideIPThrottle]
     pagination_class = PageNumberPagination
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
 
     """ViewSet for Filtering and Sorting"""
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = {
-        'status': ['exact'],
-        'id_rider__email': ['exact'],
-    }
+    filterset_class = RideFilter
     ordering_fields = ['pickup_time']
-    ordering = ['-pickup_time'] 
\ No newline at end of file
+    ordering = ['-pickup_time']
+
+    def events_summary(self):
+        """Whether the request asked for ?events=summary."""
+        if self.request is None:
+            return False
+        mode = self.request.query_params.get('events', 'full')
+        if mode not in ('full', 'summary'):
+            raise ValidationError({'events': "Must be 'full' or 'summary'."})
+        return mode == 'summary'
+
+    def get_serializer_class(self):
+        if self.events_summary():
+            return RideSummarySerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        if sharding_enabled():
+            # Users stay in the default database; no joins across shards.
+            queryset = Ride.objects.prefetch_related('events')
+        else:
+            queryset = super().get_queryset()
+        if self.events_summary():
+            queryset = queryset.prefetch_related(None)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """List rides, gathering them from every shard when sharding is enabled."""
+        if request.accepted_renderer.format == 'ndjson':
+            return self.stream_list(request)
+        if not sharding_enabled():
+            return super().list(request, *args, **kwargs)
+
+        rides = ShardedRideList([
+            self.filter_queryset(self.get_queryset().using(alias))
+            for alias in ride_databases()
+        ])
+        page = self.paginate_queryset(rides)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(rides, many=True)
+        return Response(serializer.data)
+
+    def stream_list(self, request):
+        """
+        Stream the filtered, ordered rides as NDJSON without pagination.
+
+        Rides are read with chunked iteration, so events are prefetched
+        one chunk at a time and memory does not grow with the result size.
+        """
+        if sharding_enabled():
+            rides = ShardedRideList([
+                self.filter_queryset(self.get_queryset().using(alias))
+                for alias in ride_databases()
+            ]).iterator(NDJSON_CHUNK_SIZE)
+        else:
+            rides = self.filter_queryset(self.get_queryset()).iterator(chunk_size=NDJSON_CHUNK_SIZE)
+
+        renderer = request.accepted_renderer
+        context = self.get_serializer_context()
+
+        def chunks():
+            while True:
+                chunk = list(itertools.islice(rides, NDJSON_CHUNK_SIZE))
+                if not chunk:
+                    return
+                yield renderer.render_lines(
+                    self.get_serializer_class()(chunk, many=True, context=context).data
+                )
+
+        return StreamingHttpResponse(chunks(), content_type=renderer.media_type)
+
+    def get_object(self):
+        """Look the ride up in the shard its id belongs to."""
+        if not sharding_enabled():
+            return super().get_object()
+
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            alias = shard_for_ride_id(lookup)
+        except (TypeError, ValueError):
+            raise Http404
+        queryset = self.filter_queryset(self.get_queryset().using(alias))
+        ride = get_object_or_404(queryset, pk=lookup)
+        self.check_object_permissions(self.request, ride)
+        return ride
+
+    def perform_create(self, serializer):
+        """Save the ride and its creation event in one write transaction."""
+        data = serializer.validated_data
+        with write_transaction(using=shard_for_point(data['pickup_latitude'],
+                                                     data['pickup_longitude'])):
+            serializer.save()
+
+    def perform_update(self, serializer):
+        """Save the ride and its status change event in one write transaction."""
+        with write_transaction(using=serializer.instance._state.db):
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        """Delete the ride and its events without loading the events."""
+        delete_rides([instance.pk], using=instance._state.db)
+
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        """Ride statistics for the filtered rides."""
+        group_by = request.query_params.get('group_by', 'driver')
+        if group_by not in ('driver', 'day'):
+            raise ValidationError({'group_by': "Must be 'driver' or 'day'."})
+        querysets = [
+            self.filter_queryset(Ride.objects.using(alias)) for alias in ride_databases()
+        ]
+        return Response({
+            'group_by': group_by,
+            'results': get_ride_stats(querysets, group_by=group_by),
+        })
+
+    @action(detail=False, methods=['post'])
+    def transitions(self, request):
+        """Apply a batch of status transitions."""
+        serializer = RideTransitionSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        if len(serializer.validated_data) > MAX_BATCH_TRANSITIONS:
+            raise ValidationError(
+                f'At most {MAX_BATCH_TRANSITIONS} transitions per batch.'
+            )
+        results = apply_transitions(serializer.validated_data)
+        return Response(RideTransitionResultSerializer(results, many=True).data)
+
+
+class RideEventFeedView(APIView):
+    """Stream RideEvents after a cursor as NDJSON (admin only)."""
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated, IsAdminRole]
+
+    @extend_schema(
+        tags=['rides'],
+        description="Change feed of ride events in id_ride_event order (per database "
+                    "with ride sharding), one JSON object per line with the ride's "
+                    "current fields. Pass the 'cursor' of the last line you "
+                    "processed as 'after' to resume. Events are served once they "
+                    "are RIDE_EVENT_FEED_LAG_SECONDS old, so that events committed "
+                    "late are not skipped.",
+        parameters=[
+            OpenApiParameter(
+                name='after',
+                description="Return events after this cursor: a line's 'cursor' "
+                            "(comma separated event ids) or an id_ride_event",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name='limit',
+                description='Maximum number of events to return',
+                required=False,
+                type=int,
+            ),
+        ],
+        responses={(200, 'application/x-ndjson'): OpenApiTypes.STR},
+    )
+    def get(self, request):
+        params = {}
+        after = request.query_params.get('after')
+        if after is not None:
+            try:
+                parse_cursor(after)
+            except ValueError:
+                raise ValidationError({'after': 'Must be a feed cursor (comma separated ids).'})
+            params['after'] = after
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            try:
+                params['limit'] = int(limit)
+            except ValueError:
+                raise ValidationError({'limit': 'Must be an integer.'})
+            if params['limit'] < 0:
+                raise ValidationError({'limit': 'Must not be negative.'})
+
+        def chunks():
+            # Timed over the whole stream, not just until the response starts.
+            with metrics.timed('report_duration_seconds', report='ride_event_feed'):
+                for _cursor, chunk in iter_event_feed(**params):
+                    yield chunk
+
+        return StreamingHttpResponse(chunks(), content_type='application/x-ndjson')
+
+
+class HeatmapTileView(APIView):
+    """Serve one precomputed pickup or dropoff heatmap tile (admin only)."""
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated, IsAdminRole]
+
+    @extend_schema(
+        tags=['rides'],
+        description="Ride counts per grid cell of an XYZ (Web Mercator) tile. Each cell is "
+                    "[cell_x, cell_y, count] with offsets inside the tile's "
+                    f"{heatmap.CELLS_PER_TILE}x{heatmap.CELLS_PER_TILE} grid. Zoom must be "
+                    f"one of {', '.join(map(str, heatmap.ZOOM_LEVELS))}.",
+        parameters=[
+            OpenApiParameter(
+                name='hour',
+                description='Only count rides picked up in this hour of day (0-23)',
+                required=False,
+                type=int,
+            ),
+        ],
+        responses=OpenApiTypes.OBJECT,
+    )
+    def get(self, request, kind, zoom, x, y):
+        if kind not in heatmap.KINDS or zoom not in heatmap.ZOOM_LEVELS:
+            raise Http404
+        if x >= 2 ** zoom or y >= 2 ** zoom:
+            raise Http404
+
+        hour = request.query_params.get('hour')
+        if hour is not None:
+            try:
+                hour = int(hour)
+            except ValueError:
+                raise ValidationError({'hour': 'Must be an integer.'})
+            if not 0 <= hour <= 23:
+                raise ValidationError({'hour': 'Must be between 0 and 23.'})
+
+        response = Response({
+            'kind': kind,
+            'zoom': zoom,
+            'x': x,
+            'y': y,
+            'hour': hour,
+            'cells_per_tile': heatmap.CELLS_PER_TILE,
+            'cells': heatmap.get_tile(kind, zoom, x, y, hour=hour),
+        })
+        patch_cache_control(response, private=True, max_age=settings.HEATMAP_TILE_MAX_AGE)
+        return response
@@ -0,0 +1,254 @@
+"""
+Bulk user provisioning.
+
+Rows are validated up front, passwords are hashed (in a process pool for
+the management command) and users are inserted with bulk_create in
+chunks instead of one create_user call (and one PBKDF2 hash plus one
+INSERT) per row.
+"""
+import csv
+import io
+import itertools
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+PASSWORD_MIN_LENGTH = 5
+DEFAULT_CHUNK_SIZE = 1000
+TEXT_FIELDS = ('email', 'first_name', 'last_name', 'phone_number')
+# Inserts retried after a concurrent import created some of the emails.
+MAX_INSERT_ATTEMPTS = 3
+
+
+class BulkImportResult:
+    """Outcome of a bulk import: created count and per-row errors."""
+
+    def __init__(self, total=0, created=0, errors=None):
+        self.total = total
+        self.created = created
+        self.errors = errors or []
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'created': self.created,
+            'failed': len(self.errors),
+            'errors': self.errors,
+        }
+
+
+def read_rows(stream, fmt):
+    """
+    Yield user dicts from a CSV or JSONL text stream.
+
+    Raises ValueError for an unsupported format, undecodable text or
+    malformed CSV.
+    """
+    if fmt not in ('csv', 'jsonl'):
+        raise ValueError(f"Unsupported format '{fmt}'. Use 'csv' or 'jsonl'.")
+    try:
+        if fmt == 'csv':
+            yield from csv.DictReader(stream)
+            return
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as exc:
+                yield {'__error__': f'Invalid JSON: {exc}'}
+    except UnicodeDecodeError:
+        raise ValueError('File is not valid UTF-8 text.')
+    except csv.Error as exc:
+        raise ValueError(f'Invalid CSV: {exc}')
+
+
+def guess_format(filename):
+    """Return the import format implied by a file name."""
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def decode_upload(uploaded_file):
+    """Wrap an uploaded (binary) file as a text stream."""
+    return io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig')
+
+
+def _text(row, key, strip=True):
+    """Return a row value as text ('' when missing)."""
+    value = row.get(key)
+    if value is None:
+        return ''
+    value = str(value)
+    return value.strip() if strip else value
+
+
+def validate_rows(rows):
+    """
+    Validate rows in bulk.
+
+    Returns (valid, errors) where valid is a list of (row_number, cleaned
+    dict) and errors a list of per-row error dicts. Email uniqueness is
+    checked against the file itself and against the database in one
+    query per chunk rather than one query per row.
+    """
+    User = get_user_model()
+    roles = {choice for choice, _label in User.ROLE_CHOICES}
+    max_lengths = {field: User._meta.get_field(field).max_length for field in TEXT_FIELDS}
+    valid, errors, seen = [], [], {}
+
+    for row_number, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            errors.append({'row': row_number, 'email': None, 'errors': ['Row must be an object.']})
+            continue
+        if '__error__' in row:
+            errors.append({'row': row_number, 'email': None, 'errors': [row['__error__']]})
+            continue
+
+        row_errors = []
+        email = User.objects.normalize_email(_text(row, 'email'))
+        if not email:
+            row_errors.append('Email is required.')
+        else:
+            try:
+                validate_email(email)
+            except ValidationError:
+                row_errors.append('Enter a valid email address.')
+
+        password = _text(row, 'password', strip=False)
+        if password and len(password) < PASSWORD_MIN_LENGTH:
+            row_errors.append(
+                f'Password must be at least {PASSWORD_MIN_LENGTH} characters.'
+            )
+
+        role = _text(row, 'role') or 'rider'
+        if role not in roles:
+            row_errors.append(f"Invalid role '{role}'.")
+
+        values = {field: _text(row, field) for field in TEXT_FIELDS}
+        values['email'] = email
+        for field, value in values.items():
+            if len(value) > max_lengths[field]:
+                row_errors.append(
+                    f'{field} must be at most {max_lengths[field]} characters.'
+                )
+
+        if email and email in seen:
+            row_errors.append(f'Duplicate email in file (first seen on row {seen[email]}).')
+
+        if row_errors:
+            errors.append({'row': row_number, 'email': email or None, 'errors': row_errors})
+            continue
+
+        seen[email] = row_number
+        valid.append((row_number, dict(values, password=password, role=role)))
+
+    valid = _drop_existing(valid, errors)
+    errors.sort(key=lambda error: error['row'])
+    return valid, errors
+
+
+def _drop_existing(valid, errors):
+    """Move rows whose email is already taken from valid to errors."""
+    User = get_user_model()
+    existing = set()
+    emails = [data['email'] for _row_number, data in valid]
+    for start in range(0, len(emails), DEFAULT_CHUNK_SIZE):
+        existing.update(
+            User.objects.filter(
+                email__in=emails[start:start + DEFAULT_CHUNK_SIZE]
+            ).values_list('email', flat=True)
+        )
+    if not existing:
+        return valid
+
+    remaining = []
+    for row_number, data in valid:
+        if data['email'] in existing:
+            errors.append({
+                'row': row_number,
+                'email': data['email'],
+                'errors': ['User with this email already exists.'],
+            })
+        else:
+            remaining.append((row_number, data))
+    return remaining
+
+
+def _init_worker():
+    """Make sure Django is configured in spawned worker processes."""
+    from django.apps import apps
+
+    if not apps.ready:
+        import django
+
+        django.setup()
+
+
+def _hash_password(password):
+    """Hash one password; empty passwords become unusable ones."""
+    return make_password(password or None)
+
+
+def hash_passwords(passwords, workers=None, chunksize=64):
+    """Hash passwords across a process pool, preserving order."""
+    if workers == 1 or len(passwords) < 2:
+        return [_hash_password(password) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        return list(pool.map(_hash_password, passwords, chunksize=chunksize))
+
+
+def import_users(rows, chunk_size=DEFAULT_CHUNK_SIZE, workers=None, dry_run=False,
+                 max_rows=None):
+    """
+    Validate, hash and bulk insert users. Returns a BulkImportResult.
+
+    Raises ValueError when the rows cannot be read (see read_rows) or
+    there are more than max_rows of them; nothing is imported then.
+    Emails created concurrently by someone else become per-row errors:
+    the insert is rolled back and retried without them.
+    """
+    User = get_user_model()
+    if max_rows is None:
+        rows = list(rows)
+    else:
+        rows = list(itertools.islice(rows, max_rows + 1))
+        if len(rows) > max_rows:
+            raise ValueError(f'Too many rows: at most {max_rows} per import.')
+    valid, errors = validate_rows(rows)
+    result = BulkImportResult(total=len(rows), errors=errors)
+
+    if dry_run or not valid:
+        return result
+
+    hashes = hash_passwords([data['password'] for _row_number, data in valid], workers=workers)
+    valid = [
+        (row_number, dict(data, password=password_hash))
+        for (row_number, data), password_hash in zip(valid, hashes)
+    ]
+
+    for attempt in range(1, MAX_INSERT_ATTEMPTS + 1):
+        users = [User(**data) for _row_number, data in valid]
+        try:
+            with transaction.atomic():
+                for start in range(0, len(users), chunk_size):
+                    User.objects.bulk_create(users[start:start + chunk_size])
+        except IntegrityError:
+            if attempt == MAX_INSERT_ATTEMPTS:
+                raise
+            remaining = _drop_existing(valid, result.errors)
+            if len(remaining) == len(valid):
+                raise
+            valid = remaining
+            result.errors.sort(key=lambda error: error['row'])
+            if not valid:
+                return result
+            continue
+        break
+    result.created = len(users)
+    return result
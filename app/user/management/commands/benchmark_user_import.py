@@ -0,0 +1,63 @@
+"""
+Compare bulk user import throughput against serial create_user calls.
+
+Everything runs inside a transaction that is rolled back, so no users
+are left behind.
+"""
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from user.bulk import import_users
+
+
+class Command(BaseCommand):
+    help = 'Benchmark bulk user import against serial create_user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=2000, help='Users per run.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Password hashing processes for the bulk run.')
+
+    def _rows(self, count):
+        prefix = uuid.uuid4().hex[:8]
+        return [
+            {
+                'email': f'bench-{prefix}-{index}@example.com',
+                'password': f'secret-{index}',
+                'first_name': 'Bench',
+                'last_name': f'Driver {index}',
+                'phone_number': '555-0100',
+                'role': 'driver',
+            }
+            for index in range(count)
+        ]
+
+    def _report(self, label, count, elapsed):
+        self.stdout.write(
+            f'{label:<8} {count:>7} users  {elapsed:8.2f}s  {count / elapsed:10.1f} users/s'
+        )
+        return count / elapsed
+
+    def handle(self, *args, **options):
+        count = options['count']
+        User = get_user_model()
+
+        with transaction.atomic():
+            rows = self._rows(count)
+            started = time.perf_counter()
+            for row in rows:
+                User.objects.create_user(**row)
+            serial = self._report('serial', count, time.perf_counter() - started)
+
+            rows = self._rows(count)
+            started = time.perf_counter()
+            result = import_users(rows, workers=options['workers'])
+            bulk = self._report('bulk', result.created, time.perf_counter() - started)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {bulk / serial:.1f}x'))
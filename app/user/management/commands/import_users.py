@@ -0,0 +1,49 @@
+"""
+Bulk import users from a CSV or JSONL file.
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user.bulk import DEFAULT_CHUNK_SIZE, guess_format, import_users, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk import users from a CSV or JSONL file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with header row) or JSONL file of users.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format (default: guessed from the file extension).')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Rows per bulk INSERT.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Password hashing processes (default: CPU count).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate only, do not create users.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        started = time.perf_counter()
+
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as stream:
+                result = import_users(
+                    read_rows(stream, fmt),
+                    chunk_size=options['chunk_size'],
+                    workers=options['workers'],
+                    dry_run=options['dry_run'],
+                )
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read {path}: {exc}')
+
+        elapsed = time.perf_counter() - started
+        for error in result.errors:
+            self.stderr.write(json.dumps(error))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.created} of {result.total} users created, "
+            f"{len(result.errors)} rows failed ({elapsed:.2f}s)."
+        ))
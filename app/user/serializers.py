@@ -55,4 +55,11 @@ class AuthTokenSerializer(serializers.Serializer):
             raise serializers.ValidationError(msg, code='authorization')
 
         attrs['user'] = user
-        return attrs
\ No newline at end of file
+        return attrs
+
+
+class BulkUserImportSerializer(serializers.Serializer):
+    """Serializer for a bulk user import upload."""
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=['csv', 'jsonl'], required=False)
+    dry_run = serializers.BooleanField(default=False)
@@ -0,0 +1,123 @@
+"""
+Tests for the bulk user import.
+"""
+import io
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import User
+from user import bulk
+from user.bulk import import_users, read_rows
+
+IMPORT_URL = '/api/user/import/'
+
+
+def csv_rows(text):
+    return read_rows(io.StringIO(text), 'csv')
+
+
+class ImportUsersTests(TestCase):
+    """import_users() on CSV rows."""
+
+    def test_creates_users(self):
+        result = import_users(csv_rows(
+            'email,first_name,password\n'
+            'a@example.com,Ann,secret1\n'
+            'b@example.com,Bob,\n'
+        ), workers=1)
+        self.assertEqual((result.total, result.created, result.errors), (2, 2, []))
+        self.assertTrue(User.objects.get(email='a@example.com').check_password('secret1'))
+        self.assertFalse(User.objects.get(email='b@example.com').has_usable_password())
+
+    def test_duplicate_and_existing_emails(self):
+        User.objects.create_user('taken@example.com')
+        result = import_users(csv_rows(
+            'email\n'
+            'new@example.com\n'
+            'taken@example.com\n'
+            'new@example.com\n'
+        ), workers=1)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([(error['row'], error['errors']) for error in result.errors], [
+            (2, ['User with this email already exists.']),
+            (3, ['Duplicate email in file (first seen on row 1).']),
+        ])
+
+    def test_length_errors_per_row(self):
+        result = import_users(csv_rows(
+            'email,first_name,phone_number\n'
+            f'a@example.com,{"x" * 256},123\n'
+            f'b@example.com,Bob,{"1" * 21}\n'
+            'c@example.com,Cy,123\n'
+        ), workers=1)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([(error['row'], error['errors']) for error in result.errors], [
+            (1, ['first_name must be at most 255 characters.']),
+            (2, ['phone_number must be at most 20 characters.']),
+        ])
+        self.assertEqual(list(User.objects.values_list('email', flat=True)), ['c@example.com'])
+
+    def test_retries_without_emails_taken_concurrently(self):
+        """An IntegrityError drops the emails created meanwhile and retries the rest."""
+        validate_rows = bulk.validate_rows
+
+        def validate_then_race(rows):
+            valid, errors = validate_rows(rows)
+            User.objects.create_user('b@example.com')
+            return valid, errors
+
+        with mock.patch.object(bulk, 'validate_rows', validate_then_race):
+            result = import_users(csv_rows(
+                'email\na@example.com\nb@example.com\nc@example.com\n'
+            ), workers=1)
+        self.assertEqual(result.created, 2)
+        self.assertEqual(result.errors, [{
+            'row': 2, 'email': 'b@example.com',
+            'errors': ['User with this email already exists.'],
+        }])
+        self.assertEqual(User.objects.count(), 3)
+
+    def test_max_rows(self):
+        with self.assertRaisesMessage(ValueError, 'Too many rows'):
+            import_users(csv_rows('email\na@example.com\nb@example.com\n'),
+                         workers=1, max_rows=1)
+        self.assertFalse(User.objects.exists())
+
+
+class BulkImportApiTests(TestCase):
+    """POST /api/user/import/."""
+
+    def setUp(self):
+        admin = User.objects.create_user('admin@example.com', role='admin')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=admin).key}')
+
+    def upload(self, content, name='users.csv'):
+        return self.client.post(IMPORT_URL, {'file': SimpleUploadedFile(name, content)},
+                                format='multipart')
+
+    def test_import(self):
+        response = self.upload(b'email\nnew@example.com\n')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+
+    def test_unreadable_upload(self):
+        response = self.upload(b'email\n\xff\xfe\x00bad\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'file': ['File is not valid UTF-8 text.']})
+
+    @override_settings(BULK_IMPORT_MAX_BYTES=20)
+    def test_upload_too_large(self):
+        response = self.upload(b'email\n' + b'a@example.com\n' * 2)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('File too large', response.json()['file'][0])
+
+    @override_settings(BULK_IMPORT_MAX_ROWS=1)
+    def test_too_many_rows(self):
+        response = self.upload(b'email\na@example.com\nb@example.com\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(email='a@example.com').exists())
@@ -1,14 +1,22 @@
 """
 Views for the user API.
 """
+from django.conf import settings
 from drf_spectacular.utils import extend_schema
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, authentication, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
+from core.throttling import LoginIPThrottle
+from ride.permissions import IsAdminRole
+from user.bulk import decode_upload, guess_format, import_users, read_rows
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
+    BulkUserImportSerializer,
     )
 
 @extend_schema(tags=['users'])
@@ -21,6 +29,7 @@ class CreateTokenView(ObtainAuthToken):
     """Create a new auth token for user."""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    throttle_classes = [LoginIPThrottle]
 
 @extend_schema(tags=['users'])
 class ManageUserView(generics.RetrieveUpdateAPIView):
@@ -31,4 +40,36 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
 
     def get_object(self):
         """Retrieve and return the authenticated user."""
-        return self.request.user
\ No newline at end of file
+        return self.request.user
+
+
+@extend_schema(tags=['users'])
+class BulkImportUsersView(generics.GenericAPIView):
+    """Bulk import users from an uploaded CSV or JSONL file (admin only)."""
+    serializer_class = BulkUserImportSerializer
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated, IsAdminRole]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.validated_data['file']
+        fmt = serializer.validated_data.get('format') or guess_format(upload.name)
+        if upload.size > settings.BULK_IMPORT_MAX_BYTES:
+            raise ValidationError({'file': [
+                f'File too large: at most {settings.BULK_IMPORT_MAX_BYTES} bytes per import.'
+            ]})
+
+        try:
+            # Hashed in this worker: no process pool inside a request.
+            result = import_users(
+                read_rows(decode_upload(upload), fmt),
+                workers=1,
+                dry_run=serializer.validated_data['dry_run'],
+                max_rows=settings.BULK_IMPORT_MAX_ROWS,
+            )
+        except ValueError as exc:
+            raise ValidationError({'file': [str(exc)]})
+        response_status = status.HTTP_201_CREATED if result.created else status.HTTP_200_OK
+        return Response(result.as_dict(), status=response_status)
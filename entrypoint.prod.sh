@@ -2,4 +2,23 @@
 
 python manage.py collectstatic --noinput
 python manage.py migrate --noinput
-python -m gunicorn --bind 0.0.0.0:8000 --workers 4 app.wsgi:application
\ No newline at end of file
+python manage.py spectacular --format openapi-json --file openapi-schema.json
+# Per-process metric files of the previous run (see core.metrics).
+rm -rf "${METRICS_DIR:-metrics}"
+gunicorn=(python -m gunicorn --bind 0.0.0.0:8000 --workers 4 app.wsgi:application)
+if [ "$SQLITE_PRODUCTION" != "True" ]; then
+    exec "${gunicorn[@]}"
+fi
+
+# SQLite production mode: checkpoint the WAL and optimize every 5 minutes
+# (see core.sqlite) next to gunicorn. When either process stops, stop the
+# other and exit with its status, so the container is restarted instead of
+# running without maintenance (the WAL would grow without bound).
+python manage.py sqlite_maintenance --interval 300 &
+"${gunicorn[@]}" &
+trap 'kill -TERM $(jobs -p) 2>/dev/null' TERM INT
+wait -n
+status=$?
+kill -TERM $(jobs -p) 2>/dev/null
+wait
+exit $status